@@ -0,0 +1,35 @@
+import os
+import time
+import threading
+import pandas as pd
+
+'''
+Same reader as in the cost-management repository: every CSV is read through read_csv,
+COST_CSV_ENGINE=pyarrow switches to the multi-threaded Arrow parser and the parse time
+of every file is recorded in parse_times.
+'''
+csv_engine = os.getenv('COST_CSV_ENGINE', 'c')
+
+# Options the Arrow parser doesn't support, the C parser is used when one of them is given
+c_engine_options = ['chunksize', 'iterator', 'nrows', 'skipfooter', 'converters']
+
+parse_times = []
+parse_times_lock = threading.Lock()
+
+def select_engine(kwargs):
+    if csv_engine == 'pyarrow' and not any(option in kwargs for option in c_engine_options):
+        # low_memory only applies to the C parser
+        kwargs.pop('low_memory', None)
+        return 'pyarrow'
+    return 'c'
+
+def record_parse_time(file_path, engine, seconds, rows):
+    with parse_times_lock:
+        parse_times.append({'file': str(file_path), 'engine': engine, 'seconds': seconds, 'rows': rows})
+
+def read_csv(file_path, dtype=None, **kwargs):
+    engine = select_engine(kwargs)
+    start = time.perf_counter()
+    df = pd.read_csv(file_path, dtype=dtype, engine=engine, **kwargs)
+    record_parse_time(file_path, engine, time.perf_counter() - start, len(df))
+    return df
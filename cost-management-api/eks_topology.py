@@ -0,0 +1,134 @@
+import boto3
+from dotenv import load_dotenv
+import os
+import time
+import threading
+import inventory
+
+load_dotenv()
+
+aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+aws_region = os.getenv('AWS_REGION')
+
+session = boto3.Session(
+    aws_access_key_id=aws_access_key_id,
+    aws_secret_access_key=aws_secret_access_key,
+    region_name=aws_region
+)
+autoscaling_client = session.client('autoscaling')
+
+'''
+Graph of the EKS clusters shared by the EKS checks: cluster -> nodegroup -> instance -> volumes.
+The nodegroups come from the inventory snapshot, the instances of all their auto scaling groups
+are looked up together, asg_batch_size group names per describe_auto_scaling_groups call, and the
+volumes of the instances from the attachments of the volumes in the inventory.
+The graph is built again after refresh_seconds, when the inventory lists the clusters or volumes
+again, or after invalidate().
+'''
+refresh_seconds = float(os.getenv('EKS_TOPOLOGY_REFRESH_SECONDS', '300'))
+asg_batch_size = 50
+
+# The graph, cluster -> nodegroup name -> instance id -> volume ids, the time and the inventory listings it was built from.
+# A new graph replaces the old one, the checks still reading the old one aren't affected.
+built = {'graph': {}, 'at': None, 'from': None}
+topology_lock = threading.Lock()
+# Held while a graph is built, the lookups of the current graph don't wait for it
+build_lock = threading.Lock()
+counts = {'builds': 0, 'asg_calls': 0}
+
+'''
+An Amazon EC2 Auto Scaling group (ASG) contains a collection of EC2 instances that share similar characteristics and 
+are treated as a logical grouping for the purposes of fleet management and dynamic scaling. (source: AWS Documentation)
+Instance ids of every auto scaling group, in as few calls as possible.
+'''
+def asg_instance_ids(asg_names):
+    instance_ids = {}
+    asg_names = sorted(set(asg_names))
+    paginator = autoscaling_client.get_paginator('describe_auto_scaling_groups')
+    for first in range(0, len(asg_names), asg_batch_size):
+        for page in paginator.paginate(AutoScalingGroupNames=asg_names[first:first + asg_batch_size]):
+            counts['asg_calls'] += 1
+            for group in page['AutoScalingGroups']:
+                instance_ids[group['AutoScalingGroupName']] = [instance['InstanceId'] for instance in group['Instances']]
+    return instance_ids
+
+def nodegroup_asg_names(nodegroup):
+    return [asg['name'] for asg in nodegroup.get('resources', {}).get('autoScalingGroups', [])]
+
+def build_graph():
+    clusters = inventory.get('clusters')
+    asg_instances = asg_instance_ids(asg_name for nodegroups in clusters.values()
+                                     for nodegroup in nodegroups for asg_name in nodegroup_asg_names(nodegroup))
+
+    new_graph = {}
+    for cluster_name, nodegroups in clusters.items():
+        new_graph[cluster_name] = {}
+        for nodegroup in nodegroups:
+            nodegroup_instances = {}
+            for asg_name in nodegroup_asg_names(nodegroup):
+                for instance_id in asg_instances.get(asg_name, []):
+                    nodegroup_instances[instance_id] = [volume['VolumeId'] for volume in inventory.instance_volumes(instance_id)]
+            new_graph[cluster_name][nodegroup['nodegroupName']] = nodegroup_instances
+    return new_graph
+
+def sources():
+    return inventory.listed_at('clusters'), inventory.listed_at('volumes')
+
+def current_graph():
+    # The graph when it's recent and built from the current inventory listings, else None
+    with topology_lock:
+        if built['at'] is not None and time.monotonic() - built['at'] <= refresh_seconds and built['from'] == sources():
+            return built['graph']
+        return None
+
+'''
+The graph, built again when it's older than refresh_seconds or the inventory listings it was built from changed.
+Checks that need a new graph at the same time wait for the one that builds it.
+'''
+def resolve():
+    graph = current_graph()
+    if graph is not None:
+        return graph
+    with build_lock:
+        graph = current_graph()
+        if graph is not None:
+            return graph
+        started = time.monotonic()
+        graph = build_graph()
+        # Read after the build, which lists the clusters and volumes when they aren't listed yet
+        graph_sources = sources()
+        with topology_lock:
+            built['graph'] = graph
+            built['at'] = started
+            built['from'] = graph_sources
+            counts['builds'] += 1
+        return graph
+
+def invalidate(refresh_inventory=True):
+    # The next check resolves the graph again, with a new listing of the clusters and volumes
+    with topology_lock:
+        built['at'] = None
+    if refresh_inventory:
+        inventory.refresh('clusters', 'volumes')
+
+def cluster_names():
+    return list(resolve())
+
+def nodegroup_instance_ids(cluster_name):
+    # Nodegroup name -> instance ids of the nodegroups of a cluster
+    return {nodegroup_name: list(instances) for nodegroup_name, instances in resolve().get(cluster_name, {}).items()}
+
+def cluster_instance_ids(cluster_name):
+    return [instance_id for instances in resolve().get(cluster_name, {}).values() for instance_id in instances]
+
+def cluster_volume_ids(cluster_name):
+    # Instance id -> volume ids of the instances of a cluster
+    return {instance_id: volume_ids for instances in resolve().get(cluster_name, {}).values()
+            for instance_id, volume_ids in instances.items()}
+
+def topology_stats():
+    with topology_lock:
+        graph = built['graph']
+        return {**counts, 'clusters': len(graph),
+                'instances': sum(len(instances) for nodegroups in graph.values() for instances in nodegroups.values())}
@@ -0,0 +1,30 @@
+import json
+import pyarrow as pa
+
+'''
+Reader of the forecasts.arrow file written by the cost-management repository.
+Every service is one record batch and the schema metadata holds, per service, its batch and
+outlier threshold. The file is memory-mapped and only the batches that are asked for are read.
+'''
+forecasts_file = 'forecasts.arrow'
+format_version = 1
+
+def read_index(reader):
+    metadata = reader.schema.metadata or {}
+    index = json.loads(metadata.get(b'forecasts', b'{}'))
+    if index and index.get('version') != format_version:
+        raise ValueError(f"{forecasts_file} has format version {index.get('version')}, expected {format_version}")
+    return index.get('services', {})
+
+def open_forecasts(file_path=forecasts_file):
+    reader = pa.ipc.open_file(pa.memory_map(file_path, 'r'))
+    return reader, read_index(reader)
+
+def load_thresholds(file_path=forecasts_file):
+    _, services = open_forecasts(file_path)
+    return {service: entry['threshold'] for service, entry in services.items()}
+
+def load_forecasts(services=None, file_path=forecasts_file):
+    reader, index = open_forecasts(file_path)
+    services = index.keys() if services is None else services
+    return {service: reader.get_batch(index[service]['batch']).to_pandas() for service in services if service in index}
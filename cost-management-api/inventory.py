@@ -0,0 +1,190 @@
+import boto3
+from dotenv import load_dotenv
+import os
+import time
+import threading
+
+load_dotenv()
+
+aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+aws_region = os.getenv('AWS_REGION')
+
+session = boto3.Session(
+    aws_access_key_id=aws_access_key_id,
+    aws_secret_access_key=aws_secret_access_key,
+    region_name=aws_region
+)
+ec2_client = session.client('ec2')
+s3_client = session.client('s3')
+eks_client = session.client('eks')
+elb_client = session.client('elbv2')
+logs_client = session.client('logs')
+cloudwatch_client = session.client('cloudwatch')
+
+'''
+Snapshot of the AWS resources the checks look at, shared by all of them.
+Every section (instances, volumes, snapshots, clusters, buckets, network resources, ...) is listed
+once per refresh interval, the first time a check asks for it, and the lookups a check makes per
+resource (the volumes of an instance, the nodegroups of a cluster) are indexed when it's listed,
+so the checks that run at the same time share one listing instead of paginating the same calls each.
+'''
+refresh_seconds = float(os.getenv('INVENTORY_REFRESH_SECONDS', '900'))
+
+# Section name -> function that lists it, and name -> (time it was listed, listing)
+loaders = {}
+sections = {}
+inventory_lock = threading.Lock()
+section_locks = {}
+counts = {'listings': 0, 'hits': 0}
+
+def section(name):
+    def register(loader):
+        loaders[name] = loader
+        section_locks[name] = threading.Lock()
+        return loader
+    return register
+
+def paginate(client, operation, key, **kwargs):
+    items = []
+    for page in client.get_paginator(operation).paginate(**kwargs):
+        items.extend(page[key])
+    return items
+
+'''
+The listing of a section, listed again when it's older than refresh_seconds.
+Checks that ask for the same section at the same time wait for the one that lists it.
+'''
+def get(name):
+    with section_locks[name]:
+        with inventory_lock:
+            entry = sections.get(name)
+            if entry is not None and time.monotonic() - entry[0] <= refresh_seconds:
+                counts['hits'] += 1
+                return entry[1]
+        listing = loaders[name]()
+        with inventory_lock:
+            sections[name] = (time.monotonic(), listing)
+            counts['listings'] += 1
+        return listing
+
+def listed_at(name):
+    # When the section was last listed, None when it hasn't been or was dropped
+    with inventory_lock:
+        entry = sections.get(name)
+        return entry[0] if entry is not None else None
+
+def refresh(*names):
+    # Drop the given sections, or all of them, so the next check lists them again
+    with inventory_lock:
+        for name in names or list(sections):
+            sections.pop(name, None)
+
+def inventory_stats():
+    now = time.monotonic()
+    with inventory_lock:
+        return {**counts, 'sections': {name: round(now - listed_at) for name, (listed_at, _) in sections.items()}}
+
+@section('instances')
+def list_instances():
+    instances = {}
+    for reservation in paginate(ec2_client, 'describe_instances', 'Reservations'):
+        for instance in reservation['Instances']:
+            instances[instance['InstanceId']] = instance
+    return instances
+
+@section('volumes')
+def list_volumes():
+    volumes = {}
+    by_instance = {}
+    for volume in paginate(ec2_client, 'describe_volumes', 'Volumes'):
+        volumes[volume['VolumeId']] = volume
+        for attachment in volume.get('Attachments', []):
+            by_instance.setdefault(attachment['InstanceId'], []).append(volume)
+    return {'volumes': volumes, 'by_instance': by_instance}
+
+@section('snapshots')
+def list_snapshots():
+    return paginate(ec2_client, 'describe_snapshots', 'Snapshots', OwnerIds=['self'])
+
+@section('buckets')
+def list_buckets():
+    return [bucket['Name'] for bucket in s3_client.list_buckets()['Buckets']]
+
+@section('nat_gateways')
+def list_nat_gateways():
+    return paginate(ec2_client, 'describe_nat_gateways', 'NatGateways')
+
+@section('addresses')
+def list_addresses():
+    return ec2_client.describe_addresses()['Addresses']
+
+@section('vpn_connections')
+def list_vpn_connections():
+    return ec2_client.describe_vpn_connections()['VpnConnections']
+
+@section('vpc_endpoints')
+def list_vpc_endpoints():
+    return paginate(ec2_client, 'describe_vpc_endpoints', 'VpcEndpoints')
+
+@section('route_tables')
+def list_route_tables():
+    return paginate(ec2_client, 'describe_route_tables', 'RouteTables')
+
+@section('network_acls')
+def list_network_acls():
+    return paginate(ec2_client, 'describe_network_acls', 'NetworkAcls')
+
+@section('security_groups')
+def list_security_groups():
+    return paginate(ec2_client, 'describe_security_groups', 'SecurityGroups')
+
+@section('flow_logs')
+def list_flow_logs():
+    return paginate(ec2_client, 'describe_flow_logs', 'FlowLogs')
+
+@section('load_balancers')
+def list_load_balancers():
+    return paginate(elb_client, 'describe_load_balancers', 'LoadBalancers')
+
+@section('log_groups')
+def list_log_groups():
+    return paginate(logs_client, 'describe_log_groups', 'logGroups')
+
+@section('metrics')
+def list_metrics():
+    return paginate(cloudwatch_client, 'list_metrics', 'Metrics')
+
+'''
+EKS clusters with their nodegroups, eks_topology resolves the instances and volumes of the nodegroups.
+'''
+@section('clusters')
+def list_clusters():
+    clusters = {}
+    for cluster_name in paginate(eks_client, 'list_clusters', 'clusters'):
+        nodegroups = []
+        for nodegroup in paginate(eks_client, 'list_nodegroups', 'nodegroups', clusterName=cluster_name):
+            nodegroups.append(eks_client.describe_nodegroup(clusterName=cluster_name, nodegroupName=nodegroup)['nodegroup'])
+        clusters[cluster_name] = nodegroups
+    return clusters
+
+def instances():
+    return list(get('instances').values())
+
+def instance_ids():
+    return list(get('instances'))
+
+def instance(instance_id):
+    return get('instances').get(instance_id)
+
+def instance_volumes(instance_id):
+    return get('volumes')['by_instance'].get(instance_id, [])
+
+def cluster_names():
+    return list(get('clusters'))
+
+def nodegroups(cluster_name):
+    return get('clusters').get(cluster_name, [])
+
+def log_group_names():
+    return [log_group['logGroupName'] for log_group in get('log_groups')]
@@ -0,0 +1,141 @@
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+'''
+Cache of the answers of the language model to the remediation prompts of the checks.
+The same finding asks the same question every time, so the answers are kept in a SQLite file,
+keyed by a hash of the model and the prompt, for ttl_seconds, and the least recently used ones
+are dropped when there are more than max_entries. The most recently used answers are also kept
+in memory, so a repeated finding doesn't read the file. The times they are used from memory are written
+to the file touch_batch at a time, or before the file is read or written, so the eviction still sees them.
+'''
+cache_file = os.getenv('LLM_CACHE_FILE', 'llm_cache.sqlite')
+ttl_seconds = float(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+max_entries = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+memory_entries = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '256'))
+touch_batch = 64
+
+# Key -> (time it was stored, answer), the most recently used entries are at the end
+memory = OrderedDict()
+# Key -> last time it was used from memory, not written to the file yet
+touched = {}
+cache_lock = threading.Lock()
+connection = {}
+counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+
+def prompt_text(prompt):
+    # The checks write their prompts as tuples of lines
+    if isinstance(prompt, (tuple, list)):
+        return ' '.join(line.strip() for line in prompt)
+    return prompt
+
+def answer_key(model, prompt):
+    return hashlib.sha256(json.dumps([model, prompt_text(prompt)]).encode('utf-8')).hexdigest()
+
+def database():
+    # One connection for the API, used under cache_lock
+    if 'db' not in connection:
+        db = sqlite3.connect(cache_file, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, model TEXT, answer TEXT, '
+                   'stored_at REAL, used_at REAL)')
+        db.execute('CREATE INDEX IF NOT EXISTS answers_used_at ON answers (used_at)')
+        connection['db'] = db
+    return connection['db']
+
+def write_touched(db):
+    # Committed with the next change of the caller
+    if touched:
+        db.executemany('UPDATE answers SET used_at = ? WHERE key = ?', [(used_at, key) for key, used_at in touched.items()])
+        touched.clear()
+
+def remember(key, stored_at, answer):
+    memory[key] = (stored_at, answer)
+    memory.move_to_end(key)
+    while len(memory) > memory_entries:
+        memory.popitem(last=False)
+
+'''
+The cached answer of a prompt, or None when it isn't cached or has expired.
+'''
+def get_answer(model, prompt):
+    key = answer_key(model, prompt)
+    now = time.time()
+    with cache_lock:
+        entry = memory.get(key)
+        if entry is not None and now - entry[0] <= ttl_seconds:
+            memory.move_to_end(key)
+            counts['memory_hits'] += 1
+            touched[key] = now
+            if len(touched) >= touch_batch:
+                db = database()
+                write_touched(db)
+                db.commit()
+            return entry[1]
+        memory.pop(key, None)
+        touched.pop(key, None)
+
+        db = database()
+        write_touched(db)
+        row = db.execute('SELECT stored_at, answer FROM answers WHERE key = ?', (key,)).fetchone()
+        if row is not None and now - row[0] > ttl_seconds:
+            db.execute('DELETE FROM answers WHERE key = ?', (key,))
+            db.commit()
+            counts['expired'] += 1
+            row = None
+        if row is None:
+            db.commit()
+            counts['misses'] += 1
+            return None
+        db.execute('UPDATE answers SET used_at = ? WHERE key = ?', (now, key))
+        db.commit()
+        remember(key, row[0], row[1])
+        counts['disk_hits'] += 1
+        return row[1]
+
+def put_answer(model, prompt, answer):
+    key = answer_key(model, prompt)
+    now = time.time()
+    with cache_lock:
+        db = database()
+        touched.pop(key, None)
+        write_touched(db)
+        db.execute('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)', (key, model, answer, now, now))
+        excess = db.execute('SELECT COUNT(*) FROM answers').fetchone()[0] - max_entries
+        if excess > 0:
+            db.execute('DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY used_at LIMIT ?)', (excess,))
+            counts['evicted'] += excess
+        db.commit()
+        remember(key, now, answer)
+
+def cached_answer(model, prompt, ask):
+    # ask() is only called when the answer isn't cached, failed calls aren't cached
+    answer = get_answer(model, prompt)
+    if answer is None:
+        answer = ask()
+        if answer is not None:
+            put_answer(model, prompt, answer)
+    return answer
+
+def llm_cache_stats():
+    with cache_lock:
+        lookups = counts['memory_hits'] + counts['disk_hits'] + counts['misses']
+        hits = counts['memory_hits'] + counts['disk_hits']
+        entries = database().execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        return {**counts, 'entries': entries, 'memory_entries': len(memory),
+                'hit_rate': hits / lookups if lookups else None}
+
+def clear_llm_cache():
+    with cache_lock:
+        memory.clear()
+        touched.clear()
+        db = database()
+        db.execute('DELETE FROM answers')
+        db.commit()
+        for name in counts:
+            counts[name] = 0
@@ -0,0 +1,220 @@
+import os
+import re
+import threading
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+'''
+Gateway between the checks and the language model.
+The checks run at the same time and each one asks for the remediation of its finding. Identical
+prompts asked while one is in flight wait for its answer instead of asking again, the distinct ones
+are sent max_concurrency at a time over one pooled keep-alive HTTP client, and a check gets None
+instead of waiting more than timeout_seconds for an answer, so its finding is still reported.
+A prompt nobody waits for anymore is cancelled when it hasn't been sent yet, and an answer that
+arrives after the timeout is passed to the on_late function of the checks that gave up on it.
+With pack_prompts above 1, the prompts asked within pack_wait_seconds of each other are packed,
+up to pack_prompts at a time, into one completion whose answer is split back per prompt.
+LLM_BACKEND=stub answers every prompt locally, without an API key or network.
+'''
+backend_name = os.getenv('LLM_BACKEND', 'openai')
+model = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+timeout_seconds = float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+pack_prompts = int(os.getenv('LLM_PACK_PROMPTS', '1'))
+pack_wait_seconds = float(os.getenv('LLM_PACK_WAIT_SECONDS', '0.2'))
+
+llm_executor = ThreadPoolExecutor(max_workers=max_concurrency)
+gateway_lock = threading.Lock()
+# Prompt -> future of its answer while it's being asked, and the prompts waiting to be packed
+in_flight = {}
+pending = []
+# Future of an answer -> number of checks waiting for it, and the completion task it is answered by
+waiters = {}
+tasks = {}
+backends = {}
+counts = {'asked': 0, 'deduplicated': 0, 'completions': 0, 'packed': 0, 'timeouts': 0, 'cancelled': 0, 'late': 0,
+          'errors': 0}
+
+pack_header = 'Answer each of the following {count} questions separately.'
+pack_instructions = "Start the answer to each question with a line containing only '### ' and its number."
+answer_marker = re.compile(r'^###\s*(\d+)\s*$', re.MULTILINE)
+
+def pack(prompts):
+    questions = '\n\n'.join(f'Question {number}: {prompt}' for number, prompt in enumerate(prompts, 1))
+    return f'{pack_header.format(count=len(prompts))} {pack_instructions}\n\n{questions}'
+
+def unpack(text, count):
+    # Answers of a packed completion by question, None for the ones that are missing
+    answers = [None] * count
+    parts = answer_marker.split(text)
+    for number, answer in zip(parts[1::2], parts[2::2]):
+        if 1 <= int(number) <= count and answer.strip():
+            answers[int(number) - 1] = answer.strip()
+    return answers
+
+def openai_backend():
+    import httpx
+    from openai import OpenAI
+    http_client = httpx.Client(limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+                               timeout=timeout_seconds)
+    # timeout_seconds is the budget of the whole answer, a retry would only start when the check has given up
+    client = OpenAI(http_client=http_client, timeout=timeout_seconds, max_retries=0)
+
+    def complete(prompt):
+        completion = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return completion.choices[0].message.content
+    return complete
+
+def stub_backend():
+    def complete(prompt):
+        questions = re.findall(r'^Question (\d+): (.*)$', prompt, re.MULTILINE)
+        if prompt.startswith(pack_header.format(count=len(questions))):
+            return '\n'.join(f'### {number}\nStub answer to: {question}' for number, question in questions)
+        return f'Stub answer to: {prompt}'
+    return complete
+
+def backend():
+    # Created on first use, the stub backend doesn't need the openai package
+    with gateway_lock:
+        if backend_name not in backends:
+            backends[backend_name] = stub_backend() if backend_name == 'stub' else openai_backend()
+        return backends[backend_name]
+
+def complete(prompts, futures):
+    # Ask the model for the prompts, packed in one completion when there are several
+    try:
+        complete_prompt = backend()
+        if len(prompts) == 1:
+            answers = [complete_prompt(prompts[0])]
+        else:
+            answers = unpack(complete_prompt(pack(prompts)), len(prompts))
+            with gateway_lock:
+                counts['packed'] += len(prompts)
+            # The questions the packed answer skipped are asked on their own
+            answers = [answer if answer is not None else complete_prompt(prompt) for prompt, answer in zip(prompts, answers)]
+        with gateway_lock:
+            counts['completions'] += 1
+        for future, answer in zip(futures, answers):
+            if not future.done():
+                future.set_result(answer)
+    except Exception as e:
+        with gateway_lock:
+            counts['errors'] += 1
+        for future in futures:
+            if not future.done():
+                future.set_exception(e)
+    finally:
+        with gateway_lock:
+            for prompt, future in zip(prompts, futures):
+                if in_flight.get(prompt) is future:
+                    del in_flight[prompt]
+                tasks.pop(future, None)
+
+def start(prompts, futures):
+    # Called holding gateway_lock, so the task is known before it can finish
+    task = llm_executor.submit(complete, prompts, futures)
+    for future in futures:
+        tasks[future] = task
+
+def schedule_flush():
+    timer = threading.Timer(pack_wait_seconds, flush)
+    timer.daemon = True
+    timer.start()
+
+def flush():
+    with gateway_lock:
+        batch = pending[:pack_prompts]
+        del pending[:pack_prompts]
+        if pending:
+            schedule_flush()
+        if batch:
+            start([prompt for prompt, _ in batch], [future for _, future in batch])
+
+def submit(prompt):
+    # The future of the answer of a prompt, shared with the identical prompts that are in flight
+    with gateway_lock:
+        counts['asked'] += 1
+        if prompt in in_flight:
+            counts['deduplicated'] += 1
+            future = in_flight[prompt]
+            waiters[future] += 1
+            return future
+        future = Future()
+        in_flight[prompt] = future
+        waiters[future] = 1
+        if pack_prompts <= 1:
+            start([prompt], [future])
+            return future
+        pending.append((prompt, future))
+        if len(pending) == 1:
+            schedule_flush()
+        full = len(pending) >= pack_prompts
+    if full:
+        flush()
+    return future
+
+'''
+Stop waiting for an answer. When no other check waits for it and it hasn't been sent yet, it is cancelled
+together with the prompts packed with it that nobody waits for either. Returns True when it was cancelled.
+'''
+def stop_waiting(prompt, future, cancel=False):
+    with gateway_lock:
+        waiters[future] -= 1
+        if waiters[future] or not cancel:
+            if not waiters[future]:
+                del waiters[future]
+            return False
+        del waiters[future]
+
+        waiting = [index for index, (_, pending_future) in enumerate(pending) if pending_future is future]
+        if waiting:
+            del pending[waiting[0]]
+            cancelled = [(prompt, future)]
+        else:
+            task = tasks.get(future)
+            packed = [(packed_prompt, packed_future) for packed_prompt, packed_future in in_flight.items()
+                      if tasks.get(packed_future) is task]
+            if task is None or any(packed_future in waiters for _, packed_future in packed) or not task.cancel():
+                return False
+            cancelled = packed
+        for cancelled_prompt, cancelled_future in cancelled:
+            in_flight.pop(cancelled_prompt, None)
+            tasks.pop(cancelled_future, None)
+            cancelled_future.cancel()
+            counts['cancelled'] += 1
+        return True
+
+def late_answer(on_late, future):
+    if future.cancelled() or future.exception() is not None or future.result() is None:
+        return
+    with gateway_lock:
+        counts['late'] += 1
+    on_late(future.result())
+
+'''
+The answer of a prompt, or None when there is none after timeout_seconds.
+on_late(answer) is called with an answer that arrives after that, for example to cache it.
+'''
+def ask(prompt, on_late=None):
+    future = submit(prompt)
+    try:
+        answer = future.result(timeout=timeout_seconds)
+    except TimeoutError:
+        with gateway_lock:
+            counts['timeouts'] += 1
+        print(f"No answer from the language model after {timeout_seconds} seconds")
+        if not stop_waiting(prompt, future, cancel=True) and on_late is not None:
+            future.add_done_callback(partial(late_answer, on_late))
+        return None
+    except BaseException:
+        stop_waiting(prompt, future)
+        raise
+    stop_waiting(prompt, future)
+    return answer
+
+def gateway_stats():
+    with gateway_lock:
+        return {**counts, 'in_flight': len(in_flight), 'pending': len(pending), 'waiting': sum(waiters.values())}
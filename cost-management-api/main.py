@@ -1,5 +1,17 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from flask import Flask, jsonify
-import pandas as pd 
+from csv_reader import read_csv
+from forecast_store import forecasts_file, load_forecasts, load_thresholds
+from metrics_cache import cache_stats
+from metric_store import store_stats
+from inventory import inventory_stats, refresh
+from eks_topology import topology_stats, invalidate
+from llm_cache import llm_cache_stats
+from llm_gateway import gateway_stats
 from metrics_amazoncloudwatch import check_amazoncloudwatch
 from metrics_amazonec2 import check_amazonec2
 from metrics_amazoneks import check_amazoneks
@@ -11,87 +23,154 @@ from metrics_awskms import check_awskms
 # # from metrics_kubernetes_engine import check_kubernetes_engine
 # from metrics_networking import check_networking 
 
-# Import the forecasted values from the cost-management repository
-amazon_cloud_watch_forecasts = pd.read_csv('forecasted_amazoncloudwatch_costs.csv')
-amazonEC2_forecasts = pd.read_csv('forecasted_amazonEC2_costs.csv')
-amazonEKS_forecasts = pd.read_csv('forecasted_amazonEKS_costs.csv')
-amazonS3_forecasts = pd.read_csv('forecasted_amazonS3_costs.csv')
-amazonVPC_forecasts = pd.read_csv('forecasted_amazonVPC_costs.csv')
-awsConfig_forecasts = pd.read_csv('forecasted_awsConfig_costs.csv')
-awskms_forecasts = pd.read_csv('forecasted_awskms_costs.csv')
-compute_engine_forecasts = pd.read_csv('forecasted_compute_engine_costs.csv')
-kubernetes_forecasts = pd.read_csv('forecasted_kubernetes_engine_costs.csv')
-networking_forecasts = pd.read_csv('forecasted_networking_costs.csv')
-# Import the ouliers calculated from the cost-management repository
-outliers = pd.read_csv('outliers.csv') 
+'''
+The forecasted values and thresholds come from the forecasts file of the cost-management repository.
+They are read when a request needs them, only for the services that are checked, and read again
+when the pipeline replaced the file. A service without forecasts or without a threshold isn't checked.
+'''
+# The thresholds set by hand are used for the services that have none in the forecasts file
+outliers = read_csv('outliers.csv')
+# Forecasts and thresholds of the services and the size and modification time of the file they were read from
+loaded_forecasts = {'version': None, 'forecasts': {}, 'thresholds': {}}
+forecasts_lock = threading.Lock()
 
-# Get the outlier value for each service
-amazon_cloud_watch_threshold = outliers['AmazonCloudWatch'].iloc[-1]
-amazonEC2_threshold = outliers['AmazonEC2'].iloc[-1]
-amazonEKS_threshold = outliers['AmazonEKS'].iloc[-1]
-amazonS3_threshold = outliers['AmazonS3'].iloc[-1]
-amazonVPC_threshold = outliers['AmazonVPC'].iloc[-1]
-awsConfig_threshold = outliers['AwsConfig'].iloc[-1]
-awskms_threshold = outliers['AWSKMS'].iloc[-1]
-compute_engine_threshold = outliers['ComputeEngine'].iloc[-1]
-kubernetes_threshold = outliers['KubernetesEngine'].iloc[-1]
-networking_threshold = outliers['Networking'].iloc[-1]
+def forecast_data():
+    try:
+        stat = os.stat(forecasts_file)
+        version = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        version = 'missing'
+    with forecasts_lock:
+        if loaded_forecasts['version'] != version:
+            if version == 'missing':
+                print(f"{forecasts_file} doesn't exist, only the thresholds of outliers.csv are known")
+                forecasts, thresholds = {}, {}
+            else:
+                forecasts = load_forecasts([service for _, _, service, _, _ in checks])
+                thresholds = load_thresholds()
+            loaded_forecasts.update(version=version, forecasts=forecasts, thresholds=thresholds)
+        return loaded_forecasts['forecasts'], loaded_forecasts['thresholds']
+
+def service_forecast(service, outlier_column):
+    # Forecasts and threshold of a service, None when it has none
+    forecasts, thresholds = forecast_data()
+    threshold = thresholds.get(service)
+    if threshold is None and outlier_column in outliers and outliers[outlier_column].notna().any():
+        threshold = outliers[outlier_column].dropna().iloc[-1]
+    return forecasts.get(service), threshold
+
+# The checks of the services that overspend run at the same time, at most check_workers of them per request
+# and at most total_check_workers across all the requests (including checks that timed out and still run),
+# and each one is given check_timeout_seconds (or its own limit in check_timeouts) before it is reported as timed out
+check_workers = int(os.getenv('CHECK_WORKERS', '8'))
+total_check_workers = int(os.getenv('CHECK_WORKERS_TOTAL', '32'))
+check_slots = threading.BoundedSemaphore(total_check_workers)
+check_timeout_seconds = float(os.getenv('CHECK_TIMEOUT_SECONDS', '300'))
+check_timeouts = {}
+
+# Result key, name, service in the forecasts file, column in outliers.csv and check of every service
+checks = [
+    ('AmazonCloudWatch', 'Amazon CloudWatch', 'amazoncloudwatch', 'AmazonCloudWatch', check_amazoncloudwatch),
+    ('AmazonEC2', 'Amazon EC2', 'amazonEC2', 'AmazonEC2', check_amazonec2),
+    ('AmazonEKS', 'Amazon EKS', 'amazonEKS', 'AmazonEKS', check_amazoneks),
+    ('AmazonS3', 'Amazon S3', 'amazonS3', 'AmazonS3', check_amazons3),
+    ('AmazonVPC', 'Amazon VPC', 'amazonVPC', 'AmazonVPC', check_amazonvpc),
+    ('AWSConfig', 'AWS Config', 'awsConfig', 'AwsConfig', check_awsconfig),
+    ('AWSKMS', 'AWS KMS', 'awskms', 'AWSKMS', check_awskms),
+    # ('ComputeEngine', 'Compute Engine', 'compute_engine', 'ComputeEngine', check_compute_engine),
+    # ('KubernetesEngine', 'Kubernetes Engine', 'kubernetes_engine', 'KubernetesEngine', check_kubernetes_engine),
+    # ('Networking', 'Networking', 'networking', 'Networking', check_networking),
+]
+
+'''
+Every check holds one of the check_slots while it runs, so the pools of concurrent requests and the checks
+left running by earlier ones never run more than total_check_workers checks.
+A check that doesn't get a slot before its deadline isn't run and is reported as timed out.
+'''
+def limited(check, deadline):
+    def run():
+        if not check_slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            raise TimeoutError()
+        try:
+            return check()
+        finally:
+            check_slots.release()
+    return run
+
+'''
+Every request runs its checks on its own pool, so a check that timed out in an earlier request
+and is still running doesn't hold a worker that the checks of the next request wait for.
+A check that already started can't be stopped, it finishes in the background and its result is dropped,
+the ones that haven't started when the request is answered are cancelled.
+'''
+def run_checks(triggered):
+    if not triggered:
+        return {}
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=min(check_workers, len(triggered)), thread_name_prefix='check')
+    try:
+        futures = {key: executor.submit(limited(check, started + check_timeouts.get(key, check_timeout_seconds)))
+                   for key, check in triggered}
+        results = {}
+        for key, future in futures.items():
+            timeout = check_timeouts.get(key, check_timeout_seconds)
+            try:
+                results[key] = future.result(timeout=max(0, started + timeout - time.monotonic()))
+            except TimeoutError:
+                future.cancel()
+                print(f"{key} check timed out after {timeout:.0f} seconds")
+                results[key] = {'error': f'timed out after {timeout:.0f} seconds'}
+            except Exception as e:
+                print(f"{key} check failed: {e!r}")
+                results[key] = {'error': str(e)}
+        return results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 app = Flask(__name__)
 
+def cache_stats_summary():
+    return {'metrics_cache': cache_stats(), 'metric_store': store_stats(), 'inventory': inventory_stats(),
+            'eks_topology': topology_stats(), 'llm_cache': llm_cache_stats(), 'llm_gateway': gateway_stats()}
+
 @app.route('/', methods=['GET'])
 def compare_values():
     '''
     Check if there are any values that exceed the threshold for each service.
     If there are, run the code to check the metrics for that service.
+    The checks run at the same time, so the answer takes as long as the slowest one.
     Depending on the results of the monitoring, the API will display
     the reason why the service is overspending and the solution to the problem
     by using an OpenAI client to answer a prompt regarding how to fix the issue.
     '''
-    
-    results = {}
-
-    if any(amazon_cloud_watch_forecasts['forecast'] > amazon_cloud_watch_threshold):
-        print("Overspending on Amazon CloudWatch") 
-        results['AmazonCloudWatch'] = check_amazoncloudwatch()
-     
-    if any(amazonEC2_forecasts['forecast'] > amazonEC2_threshold):
-        print("Overspending on Amazon EC2") 
-        results['AmazonEC2'] = check_amazonec2()
- 
-    if any(amazonEKS_forecasts['forecast'] > amazonEKS_threshold):
-        print("Overspending on Amazon EKS") 
-        results['AmazonEKS'] = check_amazoneks()
- 
-    if any(amazonS3_forecasts['forecast'] > amazonS3_threshold):
-        print("Overspending on Amazon S3") 
-        results['AmazonS3'] = check_amazons3()
+    triggered = []
+    for key, name, service, outlier_column, check in checks:
+        service_forecasts, service_threshold = service_forecast(service, outlier_column)
+        if service_forecasts is None or service_threshold is None:
+            print(f"No forecasts or threshold for {name}, it isn't checked")
+            continue
+        if any(service_forecasts['forecast'] > service_threshold):
+            print(f"Overspending on {name}")
+            triggered.append((key, check))
 
-    if any(amazonVPC_forecasts['forecast'] > amazonVPC_threshold):
-        print("Overspending on Amazon VPC") 
-        results['AmazonVPC'] = check_amazonvpc()
-    
-    if any(awsConfig_forecasts['forecast'] > awsConfig_threshold):  
-        print("Overspending on AWS Config") 
-        results['AWSConfig'] = check_awsconfig()
-        
-    if any(awskms_forecasts['forecast'] > awskms_threshold):
-        print("Overspending on AWS KMS") 
-        results['AWSKMS'] = check_awskms() 
-    
-    # if any(compute_engine_forecasts['forecast'] > compute_engine_threshold):
-    #     print("Overspending on Compute Engine") 
-    #     results['ComputeEngine'] = check_compute_engine()
-    
-    # # if any(kubernetes_forecasts['forecast'] > kubernetes_threshold):
-    # #     print("Overspending on Kubernetes Engine") 
-    # #     results['KubernetesEngine'] = check_kubernetes_engine()
+    results = run_checks(triggered)
+    # The counters are only collected when debug logging is on, /cache-stats returns them
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug('Cache stats: %s', cache_stats_summary())
+    return jsonify(results)
 
-    # if any(networking_forecasts['forecast'] > networking_threshold):
-    #     print("Overspending on Networking") 
-    #     results['Networking'] = check_networking()
+@app.route('/cache-stats', methods=['GET'])
+def metrics_cache_stats():
+    # Hits and misses of the metrics cache, fetches of the metric store, listings of the inventory,
+    # EKS topology builds, cached LLM answers and LLM calls since the API started
+    return jsonify(cache_stats_summary())
 
-    return jsonify(results)
+@app.route('/refresh-inventory', methods=['POST'])
+def refresh_inventory():
+    # Resources were created or deleted, the next checks list them again and build the EKS topology again
+    refresh()
+    invalidate(refresh_inventory=False)
+    return jsonify({'inventory': inventory_stats(), 'eks_topology': topology_stats()})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
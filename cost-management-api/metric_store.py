@@ -0,0 +1,145 @@
+import os
+import threading
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from metrics_cache import window_bounds
+
+'''
+Store of the datapoints fetched from CloudWatch and Cloud Monitoring, so that a check that asks
+for the last day or week again only fetches the points after the ones it already has.
+Every series, a metric of a resource with one statistic and period, keeps its timestamps as
+second deltas in an int32 array next to a float64 array of values, and a watermark: the end
+of the last window that was fetched. Points older than the retention are dropped.
+CloudWatch stamps a point with the start of its period, so a window holds the points from its start
+to before its end. Cloud Monitoring stamps an aligned point with the end of its period and counts
+the periods back from the end of the interval, so for these end-stamped series the window ends on
+the period grid and holds the points after its start up to its end.
+'''
+retention = timedelta(days=int(os.getenv('METRIC_STORE_RETENTION_DAYS', '8')))
+
+epoch = datetime(1970, 1, 1)
+series = {}
+store_lock = threading.Lock()
+counts = {'full_fetches': 0, 'delta_fetches': 0, 'fresh': 0, 'points_fetched': 0}
+
+def to_seconds(timestamp):
+    # CloudWatch returns aware datetimes, the windows are naive UTC
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((timestamp - epoch).total_seconds())
+
+def to_datetime(seconds):
+    return epoch + timedelta(seconds=int(seconds))
+
+class Series:
+    def __init__(self):
+        self.first = 0
+        self.deltas = np.empty(0, dtype=np.int32)
+        self.values = np.empty(0, dtype=np.float64)
+        # The store has every point of the series from covered_from to the watermark, in seconds
+        self.covered_from = None
+        self.watermark = None
+
+    def times(self):
+        return self.first + np.cumsum(self.deltas, dtype=np.int64)
+
+    def covers(self, start):
+        return self.watermark is not None and self.covered_from <= start <= self.watermark
+
+    def window(self, start, end, end_stamped=False):
+        times = self.times()
+        first, last = np.searchsorted(times, [start, end], side='right' if end_stamped else 'left')
+        return times[first:last], self.values[first:last]
+
+    def merge(self, start, end, times, values, oldest):
+        # The fetched points replace the stored ones from the first fetched timestamp on, which can be before start
+        # when the provider rounds the start of the window down to its period, the others are kept if they reach start
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+        if self.covers(start):
+            stored = self.times()
+            kept = stored < (times[0] if len(times) else start)
+            times = np.concatenate([stored[kept], times])
+            values = np.concatenate([self.values[kept], values])
+        else:
+            self.covered_from = start
+        # One point per timestamp, the last one fetched
+        _, last = np.unique(times[::-1], return_index=True)
+        unique = len(times) - 1 - last
+        times, values = times[unique], values[unique]
+        recent = times >= oldest
+        times, values = times[recent], values[recent]
+
+        self.first = int(times[0]) if len(times) else 0
+        self.deltas = np.diff(times, prepend=self.first).astype(np.int32)
+        self.values = values
+        self.covered_from = max(self.covered_from, oldest)
+        self.watermark = end
+
+def series_key(namespace, metric_name, dimensions, statistic, period):
+    if isinstance(dimensions, dict):
+        dimensions = dimensions.items()
+    return (namespace, metric_name, tuple(sorted(dimensions)), statistic, period)
+
+def series_bounds(key, start, end, end_stamped):
+    # End-stamped series end on their period grid, so the periods fetched later are the ones already stored
+    period = key[4] or 0
+    if end_stamped and period:
+        return start - end % period, end - end % period
+    return start, end
+
+'''
+Timestamps (seconds) and values of every series over the lookback before the current window bucket.
+fetch(keys, start_time, end_time) returns the (timestamp, value) points of the given series between
+the two times. A series that was fetched before is only fetched from one period before its watermark,
+since the last period may not have been complete, the series with the same window are fetched together.
+end_stamped is for providers that stamp a point with the end of its period, like Cloud Monitoring.
+'''
+def read_series(keys, lookback, fetch, now=None, end_stamped=False):
+    start_time, end_time = window_bounds(lookback, now)
+    bounds = {key: series_bounds(key, to_seconds(start_time), to_seconds(end_time), end_stamped) for key in set(keys)}
+
+    pending = {}
+    with store_lock:
+        for key, (start, end) in bounds.items():
+            stored = series.setdefault(key, Series())
+            if stored.covers(start) and stored.watermark >= end:
+                counts['fresh'] += 1
+                continue
+            if stored.covers(start):
+                fetch_from = max(start, stored.watermark - (key[4] or 0))
+                counts['delta_fetches'] += 1
+            else:
+                fetch_from = start
+                counts['full_fetches'] += 1
+            pending.setdefault((fetch_from, end), []).append(key)
+
+    for (fetch_from, end), pending_keys in pending.items():
+        points = fetch(pending_keys, to_datetime(fetch_from), to_datetime(end))
+        # A lookback longer than the retention is still kept until the next fetch
+        oldest = min(to_seconds(datetime.utcnow() - retention), min(bounds[key][0] for key in pending_keys))
+        with store_lock:
+            for key in pending_keys:
+                key_points = points.get(key, [])
+                counts['points_fetched'] += len(key_points)
+                times = np.array([to_seconds(timestamp) for timestamp, _ in key_points], dtype=np.int64)
+                values = np.array([value for _, value in key_points], dtype=np.float64)
+                series[key].merge(fetch_from, end, times, values, oldest)
+
+    with store_lock:
+        return {key: series[key].window(start, end, end_stamped) for key, (start, end) in bounds.items()}
+
+def summarize(values, percentiles=(50, 90, 99)):
+    # Reductions over the values of a series window
+    if len(values) == 0:
+        return {'count': 0, 'average': None, 'sum': 0.0, 'minimum': None, 'maximum': None,
+                **{f'p{p}': None for p in percentiles}}
+    summary = {'count': len(values), 'average': float(values.mean()), 'sum': float(values.sum()),
+               'minimum': float(values.min()), 'maximum': float(values.max())}
+    for p, value in zip(percentiles, np.percentile(values, percentiles)):
+        summary[f'p{p}'] = float(value)
+    return summary
+
+def store_stats():
+    with store_lock:
+        return {**counts, 'series': len(series), 'points': int(sum(len(s.values) for s in series.values()))}
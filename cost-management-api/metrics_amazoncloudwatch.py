@@ -1,8 +1,10 @@
 import boto3
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta
+from datetime import timedelta
 from openai_client import get_nlp_response
+import inventory
+from metrics_client import metric_query, metric_statistics, prefetch
  
 load_dotenv()
  
@@ -18,12 +20,9 @@ session = boto3.Session(
 cloudwatch = session.client('cloudwatch')
 logs_client = session.client('logs') 
 
+# The metrics and log groups come from the inventory snapshot shared by the checks
 def list_all_metrics():
-    paginator = cloudwatch.get_paginator('list_metrics')
-    metrics = []
-    for response in paginator.paginate():
-        metrics.extend(response['Metrics'])
-    return metrics
+    return inventory.get('metrics')
 
 def check_excessive_metrics():
     all_metrics = list_all_metrics()
@@ -48,10 +47,7 @@ Log Stream: A log stream is a sequence of log events from the same source, such
 Each log stream is uniquely identified within a log group.
 ''' 
 def list_log_groups():
-    paginator = logs_client.get_paginator('describe_log_groups')
-    log_groups = []
-    for response in paginator.paginate():
-        log_groups.extend(response['logGroups'])
+    log_groups = inventory.get('log_groups')
     
     if len(log_groups) > 100:
         problem = "Excessive Number of Log Groups"
@@ -66,12 +62,7 @@ def list_log_groups():
     return None, None
 
 def get_get_log_group_names():
-    log_group_names = []
-    paginator = logs_client.get_paginator('describe_log_groups')
-    for response in paginator.paginate():
-        for log_group in response['logGroups']:
-            log_group_names.append(log_group['logGroupName'])
-    return log_group_names
+    return inventory.log_group_names()
 
 def list_log_streams(log_group_name):
     paginator = logs_client.get_paginator('describe_log_streams')
@@ -92,25 +83,19 @@ def list_log_streams(log_group_name):
     return None, None
 
 def high_data_points(metrics):
-    start_time = datetime.now() - timedelta(minutes=60)
-    end_time = datetime.now()
+    # Period set to one day (24 hours * 60 minutes * 60 seconds), over the last hour
+    window = {'period': 86400, 'lookback': timedelta(minutes=60)}
+    prefetch([metric_query(metric['Namespace'], metric['MetricName'], metric['Dimensions'], ['Sum'], **window)
+              for metric in metrics])
     
     for metric in metrics:
         namespace = metric['Namespace']
         metric_name = metric['MetricName']
         dimensions = metric['Dimensions']
 
-        result = cloudwatch.get_metric_statistics(
-            Namespace=namespace,
-            MetricName=metric_name,
-            Dimensions=dimensions,
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=86400,  # Period set to one day (24 hours * 60 minutes * 60 seconds)
-            Statistics=['Sum']
-        )
+        datapoints = metric_statistics(namespace, metric_name, dimensions, ['Sum'], **window)
         
-        if len(result['Datapoints']) > 100: 
+        if len(datapoints) > 100: 
             problem = "High Frequency Data Points"
             prompt = (
                 "How to fix high frequency data points in Amazon Cloudwatch?", 
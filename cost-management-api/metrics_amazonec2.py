@@ -3,6 +3,8 @@ from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os 
 from openai_client import get_nlp_response 
+import inventory
+from metrics_client import metric_statistics, metric_values, metric_summary, prefetch, resource_queries, resource_summaries
  
 load_dotenv()
  
@@ -21,45 +23,25 @@ ec2_client = session.client('ec2')
 ce_client = session.client('ce')
 autoscaling_client = boto3.client('autoscaling')
 
+# The instances come from the inventory snapshot shared by the checks
 def get_all_instances():
-    instances = []
-    paginator = ec2_client.get_paginator('describe_instances')
-    for page in paginator.paginate():
-        for reservation in page['Reservations']:
-            for instance in reservation['Instances']:
-                instances.append(instance)
-    return instances
+    return inventory.instances()
 
 def get_instance_id():
-    instance_ids = []
-    paginator = ec2_client.get_paginator('describe_instances')
-    for page in paginator.paginate():
-        for reservation in page['Reservations']:
-            for instance in reservation['Instances']:
-                instance_ids.append(instance['InstanceId'])
-    return instance_ids
+    return inventory.instance_ids()
 
 '''
-General function to get instance metrics from CloudWatch
+General function to get instance metrics from CloudWatch, from the last day in one hour periods.
+The metrics of many instances or volumes are prefetched together with prefetch(resource_queries(...)).
 '''
 def get_instance_metrics(metric_name, namespace, dimensions, statistics): 
-    response = cloudwatch.get_metric_statistics(
-        Namespace=namespace,
-        MetricName=metric_name,
-        Dimensions=dimensions,
-        StartTime= datetime.utcnow() - timedelta(days=1),
-        EndTime= datetime.utcnow(),
-        Period=3600,
-        Statistics=statistics
-    )
-    return response['Datapoints'] 
+    return metric_statistics(namespace, metric_name, dimensions, statistics)
 
 def get_cpu_average(instance_id) :
-    response = get_instance_metrics('CPUUtilization', 'AWS/EC2', [{'Name': 'InstanceId', 'Value': instance_id}], ['Average'])
- 
-    datapoints = response['Datapoints'] 
-    total_utilization = sum([datapoint['Average'] for datapoint in datapoints])
-    average_utilization = total_utilization / len(datapoints)
+    cpu = metric_summary('AWS/EC2', 'CPUUtilization', [{'Name': 'InstanceId', 'Value': instance_id}], 'Average')
+    average_utilization = cpu['average']
+    if average_utilization is None:
+        return None, None
 
     if average_utilization < 20:
         problem = f"Instance {instance_id} is potentially over-provisioned or underutilized."
@@ -75,11 +57,8 @@ def get_cpu_average(instance_id) :
 High Data Transfer: Check if the instance has high data transfer (inbound or outbound)
 '''
 def high_data_transfer(instance_id):
-    network_in = get_instance_metrics('NetworkIn', 'AWS/EC2', [{'Name': 'InstanceId', 'Value': instance_id}], ['Sum'])
-    network_out = get_instance_metrics('NetworkOut', 'AWS/EC2', [{'Name': 'InstanceId', 'Value': instance_id}], ['Sum'])
-
-    total_in = sum(data['Sum'] for data in network_in)
-    total_out = sum(data['Sum'] for data in network_out)
+    total_in = metric_values('AWS/EC2', 'NetworkIn', [{'Name': 'InstanceId', 'Value': instance_id}], 'Sum').sum()
+    total_out = metric_values('AWS/EC2', 'NetworkOut', [{'Name': 'InstanceId', 'Value': instance_id}], 'Sum').sum()
 
     high_data_threshold = 1 * 1024 * 1024 * 1024 # threshold for high data transfer (1GB)
 
@@ -139,42 +118,33 @@ def analyze_storage():
     instances = get_all_instances()
     unoptimized_volumes = []
 
-    for instance in instances:
-        instance_id = instance['InstanceId']
-        volumes = ec2_client.describe_volumes(
-            Filters=[
-                {'Name': 'attachment.instance-id', 'Values': [instance_id]}
-            ]
-        )['Volumes']
-
-        for volume in volumes:
-            volume_id = volume['VolumeId']
-            size = volume['Size']  # Size in GB
-            volume_type = volume['VolumeType']
-
-            read_ops_metrics = get_instance_metrics('VolumeReadOps', 'AWS/EBS', [{'Name': 'VolumeId', 'Value': volume_id}], ['Average'])
-            write_ops_metrics = get_instance_metrics('VolumeWriteOps', 'AWS/EBS', [{'Name': 'VolumeId', 'Value': volume_id}], ['Average'])
-
-            # Extract the metric values 
-            read_ops_values = [metric['Value'] for metric in read_ops_metrics if 'Value' in metric]
-            write_ops_values = [metric['Value'] for metric in write_ops_metrics if 'Value' in metric]
-
-            # Calculate the average if there are any metrics
-            read_ops = sum(read_ops_values) / len(read_ops_values) 
-            write_ops = sum(write_ops_values) / len(write_ops_values)
-
-            '''
-            100 represents a low number of read/write operations per day and 500 represents a large volume size
-            '''
-            if (read_ops < 100 and write_ops < 100) or size > 500:
-                unoptimized_volumes.append({
-                    'InstanceId': instance_id,
-                    'VolumeId': volume_id,
-                    'VolumeType': volume_type,
-                    'SizeGiB': size,
-                    'ReadOps': read_ops,
-                    'WriteOps': write_ops
-                })
+    # The volumes are listed once for the account and indexed by the instance they are attached to
+    instance_volumes = [(instance['InstanceId'], volume) for instance in instances
+                        for volume in inventory.instance_volumes(instance['InstanceId'])]
+
+    volume_ops = resource_summaries([('VolumeReadOps', 'Average'), ('VolumeWriteOps', 'Average')], 'AWS/EBS', 'VolumeId',
+                                    [volume['VolumeId'] for _, volume in instance_volumes])
+    for instance_id, volume in instance_volumes:
+        volume_id = volume['VolumeId']
+        size = volume['Size']  # Size in GB
+        volume_type = volume['VolumeType']
+
+        # Average of the hourly averages, a volume without datapoints had no operations
+        read_ops = volume_ops[(volume_id, 'VolumeReadOps')]['average'] or 0
+        write_ops = volume_ops[(volume_id, 'VolumeWriteOps')]['average'] or 0
+
+        '''
+        100 represents a low number of read/write operations per day and 500 represents a large volume size
+        '''
+        if (read_ops < 100 and write_ops < 100) or size > 500:
+            unoptimized_volumes.append({
+                'InstanceId': instance_id,
+                'VolumeId': volume_id,
+                'VolumeType': volume_type,
+                'SizeGiB': size,
+                'ReadOps': read_ops,
+                'WriteOps': write_ops
+            })
 
     for unoptimized_volume in unoptimized_volumes:
         problem = f"Instance ID: {unoptimized_volume['InstanceId']}, Volume ID: {unoptimized_volume['VolumeId']}, Volume Type: {unoptimized_volume['VolumeType']}, Size: {unoptimized_volume['SizeGiB']} GB, Read Ops: {unoptimized_volume['ReadOps']}, Write Ops: {unoptimized_volume['WriteOps']}"
@@ -194,11 +164,7 @@ If the snapshot is older than 180 days, it is considered outdated and it will le
 about an outdated snapshot.
 '''
 def get_all_snapshots():
-    snapshots = []
-    paginator = ec2_client.get_paginator('describe_snapshots')
-    for page in paginator.paginate(OwnerIds=['self']):
-        snapshots.extend(page['Snapshots'])
-    return snapshots
+    return inventory.get('snapshots')
 
 def analyze_snapshot_usage(snapshots):
     excessive_snapshots = []
@@ -232,6 +198,8 @@ def analyze_snapshot_usage(snapshots):
 
 def check_amazonec2(): 
     instance_ids = get_instance_id() 
+    prefetch(resource_queries([('NetworkIn', ['Sum']), ('NetworkOut', ['Sum']), ('CPUUtilization', ['Average'])],
+                              'AWS/EC2', 'InstanceId', instance_ids))
     for instance_id in instance_ids:
         # High Data Transfer
         network_data = high_data_transfer(instance_id)
@@ -1,8 +1,10 @@
 import boto3
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
 from openai_client import get_nlp_response
+import inventory
+import eks_topology
+from metrics_client import metric_statistics, prefetch, resource_queries, resource_summaries
  
 load_dotenv()
  
@@ -21,58 +23,17 @@ ec2_client = session.client('ec2')
 cloudwatch_client = session.client('cloudwatch')
 elb_client = session.client('elbv2')
 logs_client = session.client('logs')
-autoscaling_client = session.client('autoscaling')
 
+# The clusters and their nodegroups, instances and volumes are resolved once for all the EKS checks
 def get_eks_clusters():
-    response = eks_client.list_clusters()
-    return response['clusters']
-
-def get_nodegroup_info(cluster_name):
-    response = eks_client.list_nodegroups(clusterName=cluster_name)
-    nodegroups = response['nodegroups']
-    nodegroup_info = []
-    
-    for nodegroup in nodegroups:
-        response = eks_client.describe_nodegroup(clusterName=cluster_name, nodegroupName=nodegroup)
-        nodegroup_info.append(response['nodegroup'])
-    return nodegroup_info
-
-'''
-An Amazon EC2 Auto Scaling group (ASG) contains a collection of EC2 instances that share similar characteristics and 
-are treated as a logical grouping for the purposes of fleet management and dynamic scaling. (source: AWS Documentation)
-'''
-def get_instance_ids_from_asg(asg_name):
-    response = autoscaling_client.describe_auto_scaling_groups(AutoScalingGroupNames=[asg_name])
-    instance_ids = []
-    for asg in response['AutoScalingGroups']:
-        for instance in asg['Instances']:
-            instance_ids.append(instance['InstanceId'])
-    return instance_ids 
+    return eks_topology.cluster_names()
 
 def get_instance_ids_from_eks_cluster(cluster_name):
-    eks_client.describe_cluster(name=cluster_name)
-    nodegroups = eks_client.list_nodegroups(clusterName=cluster_name)['nodegroups']
-    instance_ids = []
-    
-    for nodegroup in nodegroups:
-        nodegroup_info = eks_client.describe_nodegroup(clusterName=cluster_name, nodegroupName=nodegroup)
-        asg_name = nodegroup_info['nodegroup']['resources']['autoScalingGroups'][0]['name']
-        instance_ids += get_instance_ids_from_asg(asg_name)
-    
-    return instance_ids
+    return eks_topology.cluster_instance_ids(cluster_name)
 
-# Universal method to get instance metrics from CloudWatch
+# Universal method to get instance metrics from CloudWatch, prefetch(resource_queries(...)) gets many of them at once
 def get_instance_metrics(metric_name, namespace, dimensions, statistics): 
-    response = cloudwatch_client.get_metric_statistics(
-        Namespace=namespace,
-        MetricName=metric_name,
-        Dimensions=dimensions,
-        StartTime= datetime.utcnow() - timedelta(days=1),
-        EndTime= datetime.utcnow(),
-        Period=3600,
-        Statistics=statistics
-    )
-    return response['Datapoints']  
+    return metric_statistics(namespace, metric_name, dimensions, statistics)
 
 '''
 Calculate the average CPU and memory utilization of the instances in the Amazon EKS cluster.
@@ -83,11 +44,9 @@ def analyze_over_provisioned_resources():
     clusters = get_eks_clusters()
     
     for cluster in clusters: 
-        nodegroups = get_nodegroup_info(cluster)
-        
-        for nodegroup in nodegroups:
-            asg_name = nodegroup['resources']['autoScalingGroups'][0]['name']
-            instance_ids = get_instance_ids_from_asg(asg_name)
+        for instance_ids in eks_topology.nodegroup_instance_ids(cluster).values():
+            prefetch(resource_queries([('CPUUtilization', ['Average'])], 'AWS/EC2', 'InstanceId', instance_ids) +
+                     resource_queries([('MemoryUtilization', ['Average'])], 'CWAgent', 'InstanceId', instance_ids))
             
             for instance_id in instance_ids: 
                 cpu_metrics = get_instance_metrics('CPUUtilization', 'AWS/EC2', [{'Name': 'InstanceId', 'Value': instance_id}], ['Average'])
@@ -117,11 +76,8 @@ def analyze_high_data_transfer():
     clusters = get_eks_clusters()
     
     for cluster in clusters: 
-        nodegroups = get_nodegroup_info(cluster)
-        
-        for nodegroup in nodegroups:
-            asg_name = nodegroup['resources']['autoScalingGroups'][0]['name']
-            instance_ids = get_instance_ids_from_asg(asg_name)
+        for instance_ids in eks_topology.nodegroup_instance_ids(cluster).values():
+            prefetch(resource_queries([('NetworkIn', ['Sum']), ('NetworkOut', ['Sum'])], 'AWS/EC2', 'InstanceId', instance_ids))
             
             for instance_id in instance_ids:
                 network_in = get_instance_metrics('NetworkIn', 'AWS/EC2', [{'Name': 'InstanceId', 'Value': instance_id}], ['Sum'])
@@ -152,8 +108,7 @@ the user is given a prompt to manage load balancers for Amazon EKS.
 def analyze_load_balancer_configuration():
     clusters = get_eks_clusters()
 
-    load_balancer_response = elb_client.describe_load_balancers()
-    load_balancers = load_balancer_response['LoadBalancers']
+    load_balancers = inventory.get('load_balancers')
 
     for cluster in clusters: 
         cluster_instance_ids = get_instance_ids_from_eks_cluster(cluster)
@@ -199,8 +154,7 @@ If the CPU utilization is over 80%, memory utilization is over 80%, or the data
 the user is given a prompt to optimize the monitoring and resources in Amazon EKS.
 '''
 def check_cloudwatch_logs(log_group_name):
-    response = logs_client.describe_log_groups(logGroupNamePrefix=log_group_name)
-    return bool(response['logGroups'])
+    return any(name.startswith(log_group_name) for name in inventory.log_group_names())
 
 def analyze_cluster_monitoring_and_optimization():
     clusters = get_eks_clusters() 
@@ -256,6 +210,7 @@ def analyze_cluster_monitoring_and_optimization():
 
 def analyze_metrics(cluster_name): 
     metric_names = ['podCount', 'nodeCount'] 
+    prefetch(resource_queries([(metric_name, ['Sum']) for metric_name in metric_names], 'AWS/EKS', 'ClusterName', [cluster_name]))
 
     for metric_name in metric_names:
         data_points = get_instance_metrics(metric_name, 'AWS/EKS', [{'Name': 'ClusterName', 'Value': cluster_name}], ['Sum'])
@@ -269,26 +224,13 @@ def analyze_metrics(cluster_name):
         return problem, answer
     return None, None
 
-def get_ebs_volumes(instance_id):
-    response = ec2_client.describe_instances(InstanceIds=[instance_id])
-    volumes = []
-    
-    for reservation in response['Reservations']:
-        for instance in reservation['Instances']:
-            for block_device in instance['BlockDeviceMappings']:
-                volume_id = block_device['Ebs']['VolumeId']
-                volumes.append(volume_id)
-    return volumes
-
-def get_volume_metrics(volume_id):
-    metrics = ['VolumeReadBytes', 'VolumeWriteBytes', 'VolumeIdleTime']  
-    volume_metrics = {}
-
-    for metric in metrics:
-        response = get_instance_metrics(metric, 'AWS/EBS', [{'Name': 'VolumeId', 'Value': volume_id}], ['Sum'])  
-        total = sum(dp['Sum'] for dp in response)
-        volume_metrics[metric] = total 
-    return volume_metrics
+volume_metric_names = ['VolumeReadBytes', 'VolumeWriteBytes', 'VolumeIdleTime']
+
+def get_volume_metrics(volume_ids):
+    # Sum of every volume metric over the last day, of all the volumes at once
+    summaries = resource_summaries([(metric, 'Sum') for metric in volume_metric_names], 'AWS/EBS', 'VolumeId', volume_ids)
+    return {volume_id: {metric: summaries[(volume_id, metric)]['sum'] for metric in volume_metric_names}
+            for volume_id in volume_ids}
 
 '''
 Get the EBS volumes attached to the instances in the Amazon EKS cluster.
@@ -298,28 +240,22 @@ def analyze_persistent_volumes():
     clusters = get_eks_clusters()
     
     for cluster in clusters: 
-        nodegroups = get_nodegroup_info(cluster)
+        instance_volumes = eks_topology.cluster_volume_ids(cluster)
+        volume_metrics = get_volume_metrics([volume_id for volumes in instance_volumes.values() for volume_id in volumes])
         
-        for nodegroup in nodegroups:
-            asg_name = nodegroup['resources']['autoScalingGroups'][0]['name']
-            instance_ids = get_instance_ids_from_asg(asg_name)
+        for instance_id, volume_ids in instance_volumes.items():
             
-            for instance_id in instance_ids:
-                volume_ids = get_ebs_volumes(instance_id)
-                
-                for volume_id in volume_ids:
-                    volume_metrics = get_volume_metrics(volume_id)
-                     
-                    if volume_metrics['VolumeIdleTime'] > 43200:  # 12 hours 
-                        problem = f"Volume {volume_id} is idle for more than 12 hours."
-                        prompt = ("How to optimize storage in Amazon EKS? "
-                                  "Give details on how to optimize storage in Amazon EKS. Make "
-                                  "sure to include the steps to analyze the storage usage and "
-                                  "identify the resources that are generating high storage costs. "
-                                  "If there are any best practices or tools that can be used, "
-                                  "please provide the details.")
-                        answer = get_nlp_response(prompt)
-                        return problem, answer
+            for volume_id in volume_ids:
+                if volume_metrics[volume_id]['VolumeIdleTime'] > 43200:  # 12 hours 
+                    problem = f"Volume {volume_id} is idle for more than 12 hours."
+                    prompt = ("How to optimize storage in Amazon EKS? "
+                              "Give details on how to optimize storage in Amazon EKS. Make "
+                              "sure to include the steps to analyze the storage usage and "
+                              "identify the resources that are generating high storage costs. "
+                              "If there are any best practices or tools that can be used, "
+                              "please provide the details.")
+                    answer = get_nlp_response(prompt)
+                    return problem, answer
     return None, None
 
 
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 import os 
 from collections import defaultdict
 from openai_client import get_nlp_response 
+import inventory
+from metrics_client import metric_query, metric_statistics, prefetch
  
 load_dotenv()
  
@@ -21,9 +23,7 @@ s3 = session.client('s3')
 logs_client = boto3.client('logs')
 
 def get_s3_buckets(): 
-    response = s3.list_buckets()
-    buckets = [bucket['Name'] for bucket in response['Buckets']]
-    return buckets 
+    return inventory.get('buckets')
 
 '''
 Get the bucket items and check if they have been modified in the last 30 days.
@@ -136,25 +136,21 @@ def analyze_replication(buckets):
             return problem, answer
     return None, None 
 
-def get_s3_request_metrics(bucket_name, start_time, end_time):
-    metrics = cloudwatch.get_metric_statistics(
-        Namespace='AWS/S3',
-        MetricName='NumberOfRequests',
-        Dimensions=[
-            {'Name': 'BucketName', 'Value': bucket_name},
-            {'Name': 'StorageType', 'Value': 'AllStorageTypes'}
-        ],
-        StartTime=start_time,
-        EndTime=end_time,
-        Period=3600,  # 1 hour intervals
-        Statistics=['Sum']
-    )
-    return metrics['Datapoints'] 
+def s3_request_dimensions(bucket_name):
+    return [
+        {'Name': 'BucketName', 'Value': bucket_name},
+        {'Name': 'StorageType', 'Value': 'AllStorageTypes'}
+    ]
+
+def s3_request_query(bucket_name):
+    # Requests of the last 24 hours in 1 hour intervals
+    return metric_query('AWS/S3', 'NumberOfRequests', s3_request_dimensions(bucket_name), ['Sum'], lookback=timedelta(hours=24))
+
+def get_s3_request_metrics(bucket_name):
+    return metric_statistics('AWS/S3', 'NumberOfRequests', s3_request_dimensions(bucket_name), ['Sum'], lookback=timedelta(hours=24))
 
 def analyze_requests(bucket_name): 
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(hours=24)
-    metrics = get_s3_request_metrics(bucket_name, start_time, end_time)
+    metrics = get_s3_request_metrics(bucket_name)
 
     total_requests = sum([datapoint['Sum'] for datapoint in metrics])
     average_requests_per_hour = total_requests / 24   
@@ -177,6 +173,7 @@ def analyze_requests(bucket_name):
 
 def check_amazons3(): 
     buckets = get_s3_buckets()
+    prefetch([s3_request_query(bucket) for bucket in buckets])
     for bucket in buckets: 
         # Multipart Uploads Not Completed  
         multiple_uploads = list_multipart_uploads(bucket)
@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 import os
 from openai_client import get_nlp_response
 from datetime import datetime, timedelta
+import inventory
+from metrics_client import metric_statistics, prefetch, resource_queries
  
 load_dotenv()
  
@@ -20,29 +22,19 @@ ec2_client = session.client('ec2')
 logs_client = session.client('logs')
 cloudwatch_client = session.client('cloudwatch') 
 
+# The network resources come from the inventory snapshot shared by the checks
 def list_nat_gateways():
-    response = ec2_client.describe_nat_gateways()
-    nat_gateways = response['NatGateways']
-    return nat_gateways
+    return inventory.get('nat_gateways')
  
 def get_metrics(namespace, metric_name, dimenions, start_time, end_time, statistics):
-    response = cloudwatch_client.get_metric_statistics(
-        Namespace=namespace,
-        MetricName=metric_name,
-        Dimensions=dimenions,
-        StartTime=start_time,
-        EndTime=end_time,
-        Period=3600,  # 1 hour
-        Statistics=statistics,
-    )
-    return response['Datapoints'] 
+    # Hourly datapoints, the metrics of many resources are prefetched together with prefetch(resource_queries(...))
+    return metric_statistics(namespace, metric_name, dimenions, statistics, start_time=start_time, end_time=end_time)
  
 def list_unused_eips(): 
     # retrieve a description of the Elastic IP addresses that are allocated to your AWS account
-    response = ec2_client.describe_addresses()
     unused_eips = []
     
-    for address in response['Addresses']:
+    for address in inventory.get('addresses'):
         # If the Elastic IP address is not associated with any instance or network interface it's considered unused
         if 'InstanceId' not in address and 'NetworkInterfaceId' not in address and 'AssociationId' not in address:
             unused_eips.append(address['PublicIp'])
@@ -59,9 +51,7 @@ def list_unused_eips():
     return None, None 
 
 def list_vpn_connections():
-    response = ec2_client.describe_vpn_connections()
-    vpn_connections = response['VpnConnections']
-    return vpn_connections 
+    return inventory.get('vpn_connections')
 
 '''
 Get the metrics for the VPN connections and check if the data transfer is high.
@@ -69,6 +59,9 @@ If the data transfer is higher than 1,000,000 bytes, return a problem and ask fo
 '''
 def get_high_data_transfer(): 
     vpn_connections = list_vpn_connections()
+    prefetch(resource_queries([('NetworkPacketsIn', ['Sum']), ('NetworkPacketsOut', ['Sum'])], 'AWS/VPN', 'VpnId',
+                              [vpn_connection['VpnConnectionId'] for vpn_connection in vpn_connections],
+                              start_time=start_time, end_time=end_time))
     for vpn_connection in vpn_connections:
         vpn_connection_id = vpn_connection['VpnConnectionId']
         network_in = get_metrics('AWS/VPN', 'NetworkPacketsIn', [{'Name': 'VpnId', 'Value': vpn_connection_id}], start_time, end_time, ['Sum'])
@@ -96,13 +89,7 @@ def get_high_data_transfer():
     return None, None
 
 def list_vpc_endpoints():
-    paginator = ec2_client.get_paginator('describe_vpc_endpoints')
-    response_iterator = paginator.paginate()
-    
-    vpc_endpoints = []
-    for page in response_iterator:
-        vpc_endpoints.extend(page['VpcEndpoints'])
-    return vpc_endpoints
+    return inventory.get('vpc_endpoints')
  
 def count_vpc_endpoints():
     vpc_endpoints = list_vpc_endpoints()
@@ -119,8 +106,7 @@ def count_vpc_endpoints():
     return None, None  
 
 def analyze_route_tables():
-    response = ec2_client.describe_route_tables()
-    route_tables = response['RouteTables']
+    route_tables = inventory.get('route_tables')
     
     for rt in route_tables: 
         for route in rt['Routes']: 
@@ -147,8 +133,7 @@ def analyze_route_tables():
         return None, None 
  
 def analyze_network_acls():
-    response = ec2_client.describe_network_acls()
-    network_acls = response['NetworkAcls']
+    network_acls = inventory.get('network_acls')
     
     for nacl in network_acls: 
         for entry in nacl['Entries']: 
@@ -178,8 +163,7 @@ def analyze_network_acls():
         return None, None 
     
 def analyze_security_groups():
-    response = ec2_client.describe_security_groups()
-    security_groups = response['SecurityGroups']
+    security_groups = inventory.get('security_groups')
 
     for sg in security_groups:
         # Check the number of incoming and outgoing rules in the security group
@@ -220,10 +204,13 @@ def analyze_security_groups():
 
 def inefficient_nat_gateways():
     nat_gateways = list_nat_gateways()
+    metrics = ['BytesIn', 'BytesOut', 'PacketsIn', 'PacketsOut']
+    prefetch(resource_queries([(metric, ['Sum']) for metric in metrics], 'AWS/NATGateway', 'NatGatewayId',
+                              [nat_gateway['NatGatewayId'] for nat_gateway in nat_gateways],
+                              start_time=start_time, end_time=end_time))
     for nat_gateway in nat_gateways:
         nat_gateway_id = nat_gateway['NatGatewayId'] 
 
-        metrics = ['BytesIn', 'BytesOut', 'PacketsIn', 'PacketsOut']
         for metric in metrics:
             datapoints = get_metrics('AWS/NATGateway', metric, [{'Name': 'NatGatewayId', 'Value': nat_gateway_id}], start_time, end_time, ['Sum'])
             total = sum(dp['Sum'] for dp in datapoints)  
@@ -242,11 +229,14 @@ start_time = end_time - timedelta(days=1)
 
 def inefficient_vpn_connections():
     vpn_connections = list_vpn_connections()
+    metrics = ['TunnelDataIn', 'TunnelDataOut']
+    prefetch(resource_queries([(metric, ['Sum']) for metric in metrics], 'AWS/VPN', 'VpnId',
+                              [vpn_connection['VpnConnectionId'] for vpn_connection in vpn_connections],
+                              start_time=start_time, end_time=end_time))
 
     for vpn_connection in vpn_connections:
         vpn_connection_id = vpn_connection['VpnConnectionId']
         
-        metrics = ['TunnelDataIn', 'TunnelDataOut']
         for metric in metrics:
             datapoints = get_metrics('AWS/VPN', metric, [{'Name': 'VpnId', 'Value': vpn_connection_id}], start_time, end_time, ['Sum'])
             total = sum(dp['Sum'] for dp in datapoints) 
@@ -262,8 +252,10 @@ def inefficient_vpn_connections():
     return None, None 
 
 def traffic_monitoring():
-    response = ec2_client.describe_flow_logs() 
-    flow_logs = response['FlowLogs']
+    flow_logs = inventory.get('flow_logs')
+    prefetch(resource_queries([('IncomingBytes', ['Sum'])], 'AWS/Logs', 'LogGroupName',
+                              [flow_log['LogGroupName'] for flow_log in flow_logs],
+                              start_time=start_time, end_time=end_time))
 
     for flow_log in flow_logs:
         log_group_name = flow_log['LogGroupName'] 
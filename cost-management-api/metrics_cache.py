@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+'''
+Cache of metric datapoints shared by the AWS and GCP metrics modules.
+Entries are keyed by (namespace, metric, dimensions, statistic, period, window), expire after
+ttl_seconds and the least recently used ones are dropped when there are more than max_entries.
+Relative windows like "the last day" end at the start of the current window bucket, so every
+request made within the same window_seconds asks for the same window and shares the datapoints.
+A key that is being fetched is only fetched once, the lookups made in the meantime wait for its datapoints.
+'''
+ttl_seconds = float(os.getenv('METRICS_CACHE_TTL_SECONDS', '300'))
+window_seconds = int(os.getenv('METRICS_CACHE_WINDOW_SECONDS', '300'))
+max_entries = int(os.getenv('METRICS_CACHE_MAX_ENTRIES', '50000'))
+
+epoch = datetime(1970, 1, 1)
+# Key -> (time it was stored, datapoints), the most recently used entries are at the end
+entries = OrderedDict()
+cache_lock = threading.Lock()
+# Key -> future of its datapoints while they are being fetched
+in_flight = {}
+counts = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'shared': 0}
+
+def window_bounds(lookback, now=None):
+    # Naive UTC datetimes, like the ones the metrics modules pass to boto3
+    now = now or datetime.utcnow()
+    seconds = (now - epoch).total_seconds()
+    end_time = epoch + timedelta(seconds=seconds - seconds % window_seconds)
+    return end_time - lookback, end_time
+
+def cache_key(namespace, metric_name, dimensions, statistic, period, start_time, end_time):
+    if isinstance(dimensions, dict):
+        dimensions = dimensions.items()
+    return (namespace, metric_name, tuple(sorted(dimensions)), statistic, period, start_time, end_time)
+
+'''
+The cached datapoints of a key, or None when they aren't cached or have expired.
+'''
+def cache_get(key):
+    with cache_lock:
+        entry = entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > ttl_seconds:
+            del entries[key]
+            counts['expired'] += 1
+            entry = None
+        if entry is None:
+            counts['misses'] += 1
+            return None
+        entries.move_to_end(key)
+        counts['hits'] += 1
+        return entry[1]
+
+def cache_put(key, datapoints):
+    with cache_lock:
+        entries[key] = (time.monotonic(), datapoints)
+        entries.move_to_end(key)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+            counts['evicted'] += 1
+
+def cached(key, fetch):
+    datapoints = cache_get(key)
+    if datapoints is not None:
+        return datapoints
+    with cache_lock:
+        # It can have been fetched and stored since the lookup
+        entry = entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= ttl_seconds:
+            return entry[1]
+        future = in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = in_flight[key] = Future()
+        else:
+            counts['shared'] += 1
+    if not owner:
+        return future.result()
+
+    # Failed fetches aren't cached, the lookups waiting for them get the same exception
+    try:
+        datapoints = fetch()
+        cache_put(key, datapoints)
+        future.set_result(datapoints)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with cache_lock:
+            in_flight.pop(key, None)
+    return datapoints
+
+def cache_stats():
+    with cache_lock:
+        lookups = counts['hits'] + counts['misses']
+        return {**counts, 'entries': len(entries), 'in_flight': len(in_flight),
+                'hit_rate': counts['hits'] / lookups if lookups else None}
+
+def clear_cache():
+    with cache_lock:
+        entries.clear()
+        for name in counts:
+            counts[name] = 0
@@ -0,0 +1,161 @@
+import boto3
+from dotenv import load_dotenv
+import os
+from datetime import datetime, timedelta, timezone
+from metrics_cache import cache_get, cache_put
+from metric_store import series_key, read_series, summarize
+
+load_dotenv()
+
+aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+aws_region = os.getenv('AWS_REGION')
+
+session = boto3.Session(
+    aws_access_key_id=aws_access_key_id,
+    aws_secret_access_key=aws_secret_access_key,
+    region_name=aws_region
+)
+cloudwatch = session.client('cloudwatch')
+
+'''
+Shared CloudWatch metrics client of the metrics_* modules.
+A check first passes every (resource, metric) it is going to look at to prefetch(), which gets
+them with GetMetricData, up to max_queries per call, instead of one GetMetricStatistics call each.
+metric_statistics() then returns the datapoints of a query in the GetMetricStatistics format,
+a list of {'Timestamp': ..., '<statistic>': value}, and metric_values() the values of one statistic.
+Queries over the last day or week are kept in the metric store, which only fetches the points after
+the ones it already has, and queries between fixed times in the metrics cache.
+'''
+max_queries = 500
+
+'''
+A query is the arguments of GetMetricStatistics. Without start_time and end_time the window is
+the lookback before the current window bucket of the cache, so a query can be prefetched and asked for later.
+'''
+def metric_query(namespace, metric_name, dimensions, statistics, period=3600, start_time=None, end_time=None,
+                 lookback=timedelta(days=1)):
+    dimensions = tuple((dimension['Name'], dimension['Value']) for dimension in dimensions)
+    window = (start_time, end_time) if start_time is not None else lookback
+    return (namespace, metric_name, dimensions, tuple(statistics), period, window)
+
+def resource_queries(metrics, namespace, dimension_name, resource_ids, **window):
+    # The queries of the same metrics, given as (name, statistics), for every resource
+    return [metric_query(namespace, metric_name, [{'Name': dimension_name, 'Value': resource_id}], statistics, **window)
+            for resource_id in resource_ids for metric_name, statistics in metrics]
+
+def query_series(query):
+    # The series of every statistic of a query
+    namespace, metric_name, dimensions, statistics, period, _ = query
+    return [(statistic, series_key(namespace, metric_name, dimensions, statistic, period)) for statistic in statistics]
+
+def data_queries(keys):
+    # One MetricDataQuery per series, the ids map the results back to them
+    metric_data_queries = []
+    ids = {}
+    for key in keys:
+        namespace, metric_name, dimensions, statistic, period = key
+        query_id = f'q{len(metric_data_queries)}'
+        ids[query_id] = key
+        metric_data_queries.append({
+            'Id': query_id,
+            'MetricStat': {
+                'Metric': {'Namespace': namespace, 'MetricName': metric_name,
+                           'Dimensions': [{'Name': name, 'Value': value} for name, value in dimensions]},
+                'Period': period,
+                'Stat': statistic,
+            },
+            'ReturnData': True,
+        })
+    return metric_data_queries, ids
+
+def get_window(keys, start_time, end_time):
+    # (timestamp, value) points of every series between the two times
+    points = {key: [] for key in keys}
+    all_data_queries, ids = data_queries(keys)
+    paginator = cloudwatch.get_paginator('get_metric_data')
+    for first in range(0, len(all_data_queries), max_queries):
+        pages = paginator.paginate(MetricDataQueries=all_data_queries[first:first + max_queries],
+                                   StartTime=start_time, EndTime=end_time, ScanBy='TimestampAscending')
+        for page in pages:
+            for result in page['MetricDataResults']:
+                points[ids[result['Id']]] += zip(result['Timestamps'], result['Values'])
+    return points
+
+def get_fixed_windows(queries):
+    # Points of the queries between fixed times, from the metrics cache or else from CloudWatch
+    points = {}
+    missing = {}
+    for query in queries:
+        start_time, end_time = query[5]
+        for _, key in query_series(query):
+            cached = cache_get(key + (start_time, end_time))
+            if cached is None:
+                missing.setdefault((start_time, end_time), set()).add(key)
+            else:
+                points[(query[5], key)] = cached
+    for window, keys in missing.items():
+        for key, key_points in get_window(list(keys), *window).items():
+            cache_put(key + window, key_points)
+            points[(window, key)] = key_points
+    return points
+
+def get_recent_windows(queries, now):
+    # Points of the queries over a lookback, from the metric store that only fetches the new ones
+    lookbacks = {}
+    for query in queries:
+        lookbacks.setdefault(query[5], set()).update(key for _, key in query_series(query))
+    points = {}
+    for lookback, keys in lookbacks.items():
+        for key, (times, values) in read_series(keys, lookback, get_window, now).items():
+            points[(lookback, key)] = [(datetime.fromtimestamp(int(time), timezone.utc), float(value))
+                                       for time, value in zip(times, values)]
+    return points
+
+'''
+Datapoints of every query in the GetMetricStatistics format.
+'''
+def get_metric_data(queries):
+    now = datetime.utcnow()
+    queries = set(queries)
+    recent = [query for query in queries if isinstance(query[5], timedelta)]
+    points = get_recent_windows(recent, now)
+    points.update(get_fixed_windows(queries.difference(recent)))
+
+    results = {}
+    for query in queries:
+        datapoints = {}
+        for statistic, key in query_series(query):
+            for timestamp, value in points[(query[5], key)]:
+                datapoints.setdefault(timestamp, {'Timestamp': timestamp})[statistic] = value
+        results[query] = list(datapoints.values())
+    return results
+
+def prefetch(queries):
+    # Get the datapoints that are not stored or cached yet, in as few calls as possible
+    get_metric_data(queries)
+
+def metric_statistics(namespace, metric_name, dimensions, statistics, period=3600, start_time=None, end_time=None,
+                      lookback=timedelta(days=1)):
+    query = metric_query(namespace, metric_name, dimensions, statistics, period, start_time, end_time, lookback)
+    return get_metric_data([query])[query]
+
+def metric_values(namespace, metric_name, dimensions, statistic, period=3600, lookback=timedelta(days=1)):
+    # The values of one statistic over the lookback as a numpy array, straight from the metric store
+    dimensions = tuple((dimension['Name'], dimension['Value']) for dimension in dimensions)
+    key = series_key(namespace, metric_name, dimensions, statistic, period)
+    return read_series([key], lookback, get_window)[key][1]
+
+def metric_summary(namespace, metric_name, dimensions, statistic, period=3600, lookback=timedelta(days=1)):
+    # Count, average, sum, minimum, maximum and percentiles of a statistic over the lookback
+    return summarize(metric_values(namespace, metric_name, dimensions, statistic, period, lookback))
+
+'''
+Summaries of the same metrics, given as (name, statistic), of every resource over the lookback,
+keyed by (resource id, metric name). All the series are read from the metric store together.
+'''
+def resource_summaries(metrics, namespace, dimension_name, resource_ids, period=3600, lookback=timedelta(days=1)):
+    keys = {(resource_id, metric_name): series_key(namespace, metric_name, ((dimension_name, resource_id),), statistic, period)
+            for resource_id in resource_ids for metric_name, statistic in metrics}
+    series_windows = read_series(keys.values(), lookback, get_window)
+    return {resource: summarize(series_windows[key][1]) for resource, key in keys.items()}
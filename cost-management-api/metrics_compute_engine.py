@@ -1,7 +1,8 @@
 from google.cloud import compute_v1
 from google.cloud import monitoring_v3
-from datetime import datetime, timedelta
+from datetime import timedelta
 from openai_client import get_nlp_response
+from metric_store import series_key, read_series
 from dotenv import load_dotenv
 import os 
 from google.oauth2 import service_account 
@@ -27,40 +28,48 @@ def list_instances(project, zone):
 
     return instances 
 
+'''
+Values of a metric of an instance over the lookback, aligned in periods of period seconds.
+The window ends on the period grid, so up to a period of the most recent data isn't included.
+They are kept in the metric store, so a week that was read before only needs its last hours fetched.
+'''
+def get_instance_values(metric_type, instance_name, project, aligner, period, lookback, value_type):
+    key = series_key(f'projects/{project}', metric_type, {'instance_id': instance_name}, aligner, period)
+
+    def fetch(keys, start, end):
+        interval = monitoring_v3.TimeInterval()
+        end_time = timestamp_pb2.Timestamp()
+        end_time.FromDatetime(end)
+        interval.end_time = end_time
+        start_time = timestamp_pb2.Timestamp()
+        start_time.FromDatetime(start)
+        interval.start_time = start_time
+
+        aggregation = monitoring_v3.Aggregation(
+            alignment_period=duration_pb2.Duration(seconds=period),
+            per_series_aligner=getattr(monitoring_v3.Aggregation.Aligner, aligner),
+        )
+
+        results = monitoring_client.list_time_series(
+            request={
+                "name": f"projects/{project}",
+                "filter": f'metric.type = "{metric_type}" AND resource.labels.instance_id = "{instance_name}"',
+                "interval": interval,
+                "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
+                "aggregation": aggregation,
+            }
+        )
+        return {key: [(point.interval.end_time, getattr(point.value, value_type)) for result in results for point in result.points]}
+
+    # The points are stamped with the end of their period
+    return read_series([key], lookback, fetch, end_stamped=True)[key][1]
+
 def get_cpu_utilization(instance_name, project):
-    interval = monitoring_v3.TimeInterval()
-    now = datetime.utcnow()
-
-    end_time = timestamp_pb2.Timestamp()
-    end_time.FromDatetime(now)
-    interval.end_time = end_time
-
-    start_time = timestamp_pb2.Timestamp()
-    start_time.FromDatetime(now - timedelta(days=7))
-    interval.start_time = start_time
-
-    aggregation = monitoring_v3.Aggregation(
-        alignment_period=duration_pb2.Duration(seconds=3600),
-        per_series_aligner=monitoring_v3.Aggregation.Aligner.ALIGN_MEAN,
-    )
-
-    results = monitoring_client.list_time_series(
-        request={
-            "name": f"projects/{project}",
-            "filter": f'metric.type = "compute.googleapis.com/instance/cpu/utilization" AND resource.labels.instance_id = "{instance_name}"',
-            "interval": interval,
-            "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
-            "aggregation": aggregation,
-        }
-    )
-
-    utilizations = []
-    for result in results:
-        for point in result.points:
-            utilizations.append(point.value.double_value)
-
-    if utilizations:
-        return sum(utilizations) / len(utilizations)
+    utilizations = get_instance_values('compute.googleapis.com/instance/cpu/utilization', instance_name, project,
+                                       'ALIGN_MEAN', 3600, timedelta(days=7), 'double_value')
+
+    if len(utilizations):
+        return utilizations.mean()
     return 0
 
 def find_idle_underutilized_instances(instances, project): 
@@ -82,38 +91,9 @@ def find_idle_underutilized_instances(instances, project):
     return None, None
  
 def get_network_egress(instance_name, project): 
-    interval = monitoring_v3.TimeInterval()
-    now = datetime.utcnow()
-
-    end_time = timestamp_pb2.Timestamp()
-    end_time.FromDatetime(now)
-    interval.end_time = end_time
-
-    start_time = timestamp_pb2.Timestamp()
-    start_time.FromDatetime(now - timedelta(days=7))
-    interval.start_time = start_time
-
-    aggregation = monitoring_v3.Aggregation(
-        alignment_period=duration_pb2.Duration(seconds=3600),
-        per_series_aligner=monitoring_v3.Aggregation.Aligner.ALIGN_MEAN,
-    )
-
-    monitoring_client = monitoring_v3.MetricServiceClient()
-
-    results = monitoring_client.list_time_series(
-        request={
-            "name": f"projects/{project}",
-            "filter": f'metric.type = "compute.googleapis.com/instance/network/received_bytes_count" AND resource.labels.instance_id = "{instance_name}"',
-            "interval": interval,
-            "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
-            "aggregation": aggregation,
-        }
-    )
-
-    total_egress = 0
-    for result in results:
-        for point in result.points:
-            total_egress += point.value.int64_value
+    values = get_instance_values('compute.googleapis.com/instance/network/received_bytes_count', instance_name, project,
+                                 'ALIGN_MEAN', 3600, timedelta(days=7), 'int64_value')
+    total_egress = values.sum()
 
     return total_egress / (1024 ** 3)  # Convert to GB 
 
@@ -131,43 +111,11 @@ def find_high_data_transfer_instances(instances, project):
 
 
 def get_disk_io(instance_name, project):
-    interval = monitoring_v3.TimeInterval()
-    now = datetime.utcnow()
-    interval.end_time.seconds = int(now.timestamp())
-    interval.end_time.nanos = 0
-    interval.start_time.seconds = int((now - timedelta(days=7)).timestamp())
-    interval.start_time.nanos = 0
-
-    aggregation = monitoring_v3.Aggregation(
-        alignment_period={"seconds": 86400},  # 1 day
-        per_series_aligner=monitoring_v3.Aggregation.Aligner.ALIGN_SUM,
-    )
-
-    filters = [
-        f'metric.type = "compute.googleapis.com/instance/disk/read_bytes_count" AND resource.labels.instance_id = "{instance_name}"',
-        f'metric.type = "compute.googleapis.com/instance/disk/write_bytes_count" AND resource.labels.instance_id = "{instance_name}"'
-    ]
-
-    total_read_bytes = 0
-    total_write_bytes = 0
-
-    for filter_query in filters:
-        results = monitoring_client.list_time_series(
-            request={
-                "name": f"projects/{project}",
-                "filter": filter_query,
-                "interval": interval,
-                "view": monitoring_v3.ListTimeSeriesRequest.TimeSerieslist_log_groupsView.FULL,
-                "aggregation": aggregation,
-            }
-        )
-
-        for result in results:
-            for point in result.points:
-                if "read_bytes_count" in filter_query:
-                    total_read_bytes += point.value.int64_value
-                else:
-                    total_write_bytes += point.value.int64_value
+    # Hourly sums over the last week, daily periods would leave out up to a day of the most recent data
+    total_read_bytes = get_instance_values('compute.googleapis.com/instance/disk/read_bytes_count', instance_name, project,
+                                           'ALIGN_SUM', 3600, timedelta(days=7), 'int64_value').sum()
+    total_write_bytes = get_instance_values('compute.googleapis.com/instance/disk/write_bytes_count', instance_name, project,
+                                            'ALIGN_SUM', 3600, timedelta(days=7), 'int64_value').sum()
     return total_read_bytes, total_write_bytes
 
 def list_snapshots(project_id):
@@ -7,6 +7,7 @@ from kubernetes import client
 from googleapiclient import discovery
 from datetime import datetime, timedelta
 from openai_client import get_nlp_response
+from metrics_cache import window_bounds, cache_key, cached
 from google.cloud import container_v1
 from google.cloud.monitoring_v3 import query
 
@@ -113,23 +114,27 @@ def check_high_network_egress(project_id, cluster_name):
     metric_type = 'kubernetes.io/container/network/egress_bytes_count'
     filter_ = f'metric.type="{metric_type}" AND resource.labels.cluster_name="{cluster_name}"'
 
-    query_obj = query.Query(
-        client,
-        project=project_id,
-        metric_type=metric_type,
-        filter_=filter_,
-        end_time=datetime.utcnow(),
-        start_time=datetime.utcnow() - timedelta(days=1)
-    )
-
-    time_series = list(query_obj)
-    for series in time_series:
-        for point in series.points:
-            if point.value.int64_value > 1000000000:
-                problem = f"High network egress detected in cluster: {cluster_name} with value: {point.value.int64_value}"
-                prompt = "How to manage high network egress in Kubernetes? Give details on how to reduce the network egress costs. Make sure to include the steps to identify the pods that are generating high network egress. If there are any best practices or tools that can be used, please provide the details."
-                answer = get_nlp_response(prompt)
-                return problem, answer
+    start_time, end_time = window_bounds(timedelta(days=1))
+    key = cache_key(f'projects/{project_id}', metric_type, {'cluster_name': cluster_name}, None, None, start_time, end_time)
+
+    def fetch():
+        query_obj = query.Query(
+            client,
+            project=project_id,
+            metric_type=metric_type,
+            filter_=filter_,
+            end_time=end_time,
+            start_time=start_time
+        )
+        return [point.value.int64_value for series in query_obj for point in series.points]
+
+    # The values of the last day are kept in the metrics cache
+    for value in cached(key, fetch):
+        if value > 1000000000:
+            problem = f"High network egress detected in cluster: {cluster_name} with value: {value}"
+            prompt = "How to manage high network egress in Kubernetes? Give details on how to reduce the network egress costs. Make sure to include the steps to identify the pods that are generating high network egress. If there are any best practices or tools that can be used, please provide the details."
+            answer = get_nlp_response(prompt)
+            return problem, answer
     return None, None 
 
 def check_excessive_logging_and_monitoring(cluster_name): 
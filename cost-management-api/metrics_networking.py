@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 import os 
 from google.oauth2 import service_account
 from openai_client import get_nlp_response
+from metrics_cache import window_bounds, cache_key, cached
 from google.cloud import logging_v2
 
 load_dotenv()
@@ -20,12 +21,13 @@ project_name = f"projects/{project}"
 end_time = datetime.utcnow()
 start_time = end_time - timedelta(days=1) 
 
-interval = monitoring_v3.TimeInterval(
-    {
-        "end_time": {"seconds": int(end_time.timestamp()), "nanos": end_time.microsecond * 1000},
-        "start_time": {"seconds": int(start_time.timestamp()), "nanos": start_time.microsecond * 1000},
-    }
-)
+def time_interval(start_time, end_time):
+    return monitoring_v3.TimeInterval(
+        {
+            "end_time": {"seconds": int(end_time.timestamp()), "nanos": end_time.microsecond * 1000},
+            "start_time": {"seconds": int(start_time.timestamp()), "nanos": start_time.microsecond * 1000},
+        }
+    )
 
 aggregation = monitoring_v3.Aggregation(
     {
@@ -34,42 +36,43 @@ aggregation = monitoring_v3.Aggregation(
     }
 ) 
 
+'''
+Rates of a VPN tunnel metric over the last day in 5 minute periods, kept in the metrics cache.
+'''
+def get_vpn_tunnel_rates(metric_type):
+    window_start, window_end = window_bounds(timedelta(days=1))
+    key = cache_key(project_name, metric_type, {}, 'ALIGN_RATE', 5 * 60, window_start, window_end)
+
+    def fetch():
+        results = client.list_time_series(
+            request={
+                "name": project_name,
+                "filter": f'metric.type="{metric_type}"',
+                "interval": time_interval(window_start, window_end),
+                "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
+                "aggregation": aggregation,
+            }
+        )
+        return [point.value.double_value for result in results for point in result.points]
+
+    return cached(key, fetch)
+
 def get_egress_data():   
-    results = client.list_time_series(
-        request={
-            "name": project_name,
-            "filter": 'metric.type="networking.googleapis.com/vpn_tunnel/egress_bytes_count"',
-            "interval": interval,
-            "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
-            "aggregation": aggregation,
-        }
-    ) 
-    for result in results:
-        for point in result.points:
-            if point.value.double_value > 1000000000:
-                problem = "High Egress Data Transfer"
-                prompt = "How to reduce high egress data transfer?"
-                answer = get_nlp_response(prompt)
-                return problem, answer
+    for rate in get_vpn_tunnel_rates('networking.googleapis.com/vpn_tunnel/egress_bytes_count'):
+        if rate > 1000000000:
+            problem = "High Egress Data Transfer"
+            prompt = "How to reduce high egress data transfer?"
+            answer = get_nlp_response(prompt)
+            return problem, answer
     return None, None 
 
 def get_high_ingress_data():  
-    results = client.list_time_series(
-        request={
-            "name": project_name,
-            "filter": 'metric.type="networking.googleapis.com/vpn_tunnel/ingress_bytes_count"',
-            "interval": interval,
-            "view": monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
-            "aggregation": aggregation,
-        }
-    ) 
-    for result in results:
-        for point in result.points:
-            if point.value.double_value > 1000000000:
-                problem = "High Ingress Data Transfer"
-                prompt = "How to reduce high ingress data transfer? Give details on how to reduce the data transfer costs. Make sure to include the steps to identify the instances that are generating high data transfer ingress. If there are any best practices or tools that can be used, please provide the details."
-                answer = get_nlp_response(prompt)
-                return problem, answer
+    for rate in get_vpn_tunnel_rates('networking.googleapis.com/vpn_tunnel/ingress_bytes_count'):
+        if rate > 1000000000:
+            problem = "High Ingress Data Transfer"
+            prompt = "How to reduce high ingress data transfer? Give details on how to reduce the data transfer costs. Make sure to include the steps to identify the instances that are generating high data transfer ingress. If there are any best practices or tools that can be used, please provide the details."
+            answer = get_nlp_response(prompt)
+            return problem, answer
     return None, None
 
 def get_excessive_logging(start_time, end_time, logging_client):
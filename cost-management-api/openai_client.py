@@ -1,12 +1,12 @@
-from openai import OpenAI 
-import spacy 
- 
-client = OpenAI()
- 
-nlp = spacy.load("en_core_web_sm") 
-def get_nlp_response(prompt): 
-    completion = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    ) 
-    return completion.choices[0].message.content
+import spacy
+from llm_cache import prompt_text, cached_answer, put_answer
+from llm_gateway import model, ask
+
+nlp = spacy.load("en_core_web_sm")
+
+# The answers are cached by model and prompt, the same finding is only asked once.
+# Prompts that aren't cached go through the gateway, which asks the model for them concurrently.
+# An answer that arrives after the check gave up on it is still cached for the next time.
+def get_nlp_response(prompt):
+    prompt = prompt_text(prompt)
+    return cached_answer(model, prompt, lambda: ask(prompt, on_late=lambda answer: put_answer(model, prompt, answer)))
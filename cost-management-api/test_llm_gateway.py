@@ -0,0 +1,109 @@
+import os
+os.environ.setdefault('LLM_BACKEND', 'stub')
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import llm_gateway
+
+@pytest.fixture(autouse=True)
+def gateway(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'backend_name', 'stub')
+    monkeypatch.setattr(llm_gateway, 'backends', {})
+    monkeypatch.setattr(llm_gateway, 'pack_prompts', 1)
+    monkeypatch.setattr(llm_gateway, 'pack_wait_seconds', 0.05)
+    monkeypatch.setattr(llm_gateway, 'timeout_seconds', 5)
+    monkeypatch.setattr(llm_gateway, 'llm_executor', ThreadPoolExecutor(max_workers=4))
+    for name in llm_gateway.counts:
+        monkeypatch.setitem(llm_gateway.counts, name, 0)
+    yield llm_gateway
+    llm_gateway.llm_executor.shutdown(wait=True, cancel_futures=True)
+    assert not llm_gateway.in_flight and not llm_gateway.pending and not llm_gateway.waiters
+
+def stub(delay=0.0):
+    # The stub backend, slowed down, with the prompts it was asked and the most asked at the same time
+    complete = llm_gateway.stub_backend()
+    calls = {'prompts': [], 'active': 0, 'most_active': 0}
+    lock = threading.Lock()
+
+    def slow_complete(prompt):
+        with lock:
+            calls['prompts'].append(prompt)
+            calls['active'] += 1
+            calls['most_active'] = max(calls['most_active'], calls['active'])
+        time.sleep(delay)
+        with lock:
+            calls['active'] -= 1
+        return complete(prompt)
+    llm_gateway.backends['stub'] = slow_complete
+    return calls
+
+def ask_together(prompts, **kwargs):
+    answers = [None] * len(prompts)
+    def ask(index):
+        answers[index] = llm_gateway.ask(prompts[index], **kwargs)
+    threads = [threading.Thread(target=ask, args=(index,)) for index in range(len(prompts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return answers
+
+def test_identical_prompts_are_asked_once():
+    calls = stub(delay=0.2)
+    answers = ask_together(['How to fix EKS?'] * 5)
+
+    assert answers == ['Stub answer to: How to fix EKS?'] * 5
+    assert calls['prompts'] == ['How to fix EKS?']
+    assert llm_gateway.counts['deduplicated'] == 4
+
+def test_prompts_are_asked_at_most_max_concurrency_at_a_time(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'llm_executor', ThreadPoolExecutor(max_workers=2))
+    calls = stub(delay=0.1)
+    answers = ask_together([f'q{number}' for number in range(6)])
+
+    assert answers == [f'Stub answer to: q{number}' for number in range(6)]
+    assert calls['most_active'] == 2
+
+def test_packed_prompts_are_split_back_per_prompt(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'pack_prompts', 3)
+    calls = stub()
+    answers = ask_together(['q1', 'q2', 'q3'])
+
+    assert sorted(answers) == ['Stub answer to: q1', 'Stub answer to: q2', 'Stub answer to: q3']
+    assert len(calls['prompts']) == 1
+    assert llm_gateway.counts['packed'] == 3
+
+def test_pack_and_unpack():
+    packed = llm_gateway.pack(['first', 'second'])
+    assert 'Question 1: first' in packed and 'Question 2: second' in packed
+    assert llm_gateway.unpack(llm_gateway.stub_backend()(packed), 2) == ['Stub answer to: first', 'Stub answer to: second']
+    # Missing and out of range answers are None, they are asked on their own
+    assert llm_gateway.unpack('### 1\nx\n### 3\nz\n### 4\nw', 3) == ['x', None, 'z']
+
+def test_late_answer_is_passed_on_after_the_timeout(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'timeout_seconds', 0.1)
+    stub(delay=0.3)
+    late = []
+    answer = llm_gateway.ask('slow', on_late=late.append)
+
+    assert answer is None
+    time.sleep(0.4)
+    assert late == ['Stub answer to: slow']
+    assert llm_gateway.counts['timeouts'] == 1 and llm_gateway.counts['late'] == 1
+
+def test_prompt_that_was_not_sent_is_cancelled_after_the_timeout(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'llm_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(llm_gateway, 'timeout_seconds', 0.1)
+    calls = stub(delay=0.3)
+    busy = threading.Thread(target=llm_gateway.ask, args=('busy',))
+    busy.start()
+    time.sleep(0.05)
+    late = []
+
+    assert llm_gateway.ask('queued', on_late=late.append) is None
+    busy.join()
+    time.sleep(0.4)
+    assert calls['prompts'] == ['busy']
+    assert late == []
+    assert llm_gateway.counts['cancelled'] == 1
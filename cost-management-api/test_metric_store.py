@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+import metric_store
+from metric_store import series_key, read_series, to_seconds, to_datetime
+
+period = 3600
+lookback = timedelta(days=1)
+key = series_key('AWS/EC2', 'CPUUtilization', {'InstanceId': 'i-1'}, 'Average', period)
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    metric_store.series.clear()
+    yield
+    metric_store.series.clear()
+
+def cloudwatch_fetch(fetches):
+    # Like GetMetricData: the start is rounded down to the period and a point is stamped with the start of its period
+    def fetch(keys, start_time, end_time):
+        fetches.append((start_time, end_time))
+        start = to_seconds(start_time)
+        times = range(start - start % period, to_seconds(end_time), period)
+        return {k: [(to_datetime(t), float(len(fetches))) for t in times] for k in keys}
+    return fetch
+
+def monitoring_fetch(fetches):
+    # Like Cloud Monitoring with an alignment period: the periods end at the end of the interval,
+    # a point is stamped with the end of its period
+    def fetch(keys, start_time, end_time):
+        fetches.append((start_time, end_time))
+        times = range(to_seconds(end_time), to_seconds(start_time), -period)
+        return {k: [(to_datetime(t), float(len(fetches))) for t in times] for k in keys}
+    return fetch
+
+def test_cloudwatch_delta_fetch_keeps_one_point_per_period():
+    fetches = []
+    fetch = cloudwatch_fetch(fetches)
+    read_series([key], lookback, fetch, now=datetime(2024, 5, 1, 12, 7))
+    times, values = read_series([key], lookback, fetch, now=datetime(2024, 5, 1, 14, 37))[key]
+
+    assert len(fetches) == 2
+    assert len(np.unique(times)) == len(times) == 24
+    assert to_datetime(times[0]) == datetime(2024, 4, 30, 15)
+    assert to_datetime(times[-1]) == datetime(2024, 5, 1, 14)
+    # The period the delta fetch started in is replaced, not added again
+    assert values[times == to_seconds(datetime(2024, 5, 1, 11))].tolist() == [2.0]
+
+    metric_store.series.clear()
+    full_times, _ = read_series([key], lookback, cloudwatch_fetch([]), now=datetime(2024, 5, 1, 14, 37))[key]
+    assert full_times.tolist() == times.tolist()
+
+def test_monitoring_window_includes_the_point_at_its_end():
+    fetches = []
+    times, _ = read_series([key], lookback, monitoring_fetch(fetches), now=datetime(2024, 5, 1, 12, 7), end_stamped=True)[key]
+
+    # The window ends on the period grid, its last period is stamped with that end
+    assert fetches[0][1] == datetime(2024, 5, 1, 12)
+    assert len(times) == 24
+    assert to_datetime(times[0]) == datetime(2024, 4, 30, 13)
+    assert to_datetime(times[-1]) == datetime(2024, 5, 1, 12)
+
+def test_monitoring_delta_fetch_stays_on_the_period_grid():
+    fetches = []
+    fetch = monitoring_fetch(fetches)
+    read_series([key], lookback, fetch, now=datetime(2024, 5, 1, 12, 7), end_stamped=True)
+    times, values = read_series([key], lookback, fetch, now=datetime(2024, 5, 1, 14, 37), end_stamped=True)[key]
+
+    assert [to_seconds(end) % period for _, end in fetches] == [0, 0]
+    assert fetches[1][0] == datetime(2024, 5, 1, 11)
+    assert len(np.unique(times)) == len(times) == 24
+    assert to_datetime(times[-1]) == datetime(2024, 5, 1, 14)
+    assert values.sum() == 21 * 1.0 + 3 * 2.0
+
+def test_fresh_series_are_not_fetched_again():
+    fetches = []
+    fetch = cloudwatch_fetch(fetches)
+    first = read_series([key], lookback, fetch, now=datetime(2024, 5, 1, 12, 7))[key]
+    second = read_series([key], lookback, fetch, now=datetime(2024, 5, 1, 12, 9))[key]
+
+    assert len(fetches) == 1
+    assert first[0].tolist() == second[0].tolist()
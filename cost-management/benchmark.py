@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+import pandas as pd
+import csv_reader
+from main import pipeline_stages
+from pipeline import file_fingerprint
+from instrumentation import instrument, write_report, reset
+from generate_synthetic_data import generate, default_gcp_rows
+
+'''
+End-to-end benchmark of the pipeline on synthetic reports.
+For every scale the reports are generated once in <work-dir>/rows-<n>, every stage of main.py
+runs on them in order and its wall time, CPU time and peak memory are appended to the results file.
+Each run is compared with the previous run of the same scale and configuration.
+'''
+default_scales = [10000, 100000, 1000000]
+results_columns = ['run', 'commit', 'config', 'rows', 'stage', 'status', 'wall_seconds', 'cpu_seconds',
+                   'peak_rss_mb', 'traced_peak_mb']
+# Files written by a run that are not outputs of a stage
+run_files = ['pipeline-state.json', 'forecasts.arrow', 'csv-parse-times.csv']
+# Stages faster than this are too noisy to be reported as regressions
+min_compared_seconds = 0.5
+
+def current_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+def current_config(trace_memory):
+    # The settings that change how the stages run, runs are only compared with the same settings
+    config = {k: v for k, v in os.environ.items() if k.startswith('COST_')}
+    if trace_memory:
+        config['trace_memory'] = True
+    return json.dumps(config, sort_keys=True)
+
+'''
+Run a stage and measure it. tracemalloc slows the stages down noticeably,
+so the traced peak is only measured when trace_memory is set.
+'''
+def measure(stage, trace_memory=False):
+    if trace_memory:
+        tracemalloc.start()
+    status = 'ok'
+    try:
+        with instrument(stage['name']) as section:
+            stage['func']()
+    except Exception as e:
+        print(f'  failed: {e!r}')
+        status = 'failed'
+    record = section.record
+    result = {'status': status, 'wall_seconds': record['wall_seconds'],
+              'cpu_seconds': record['cpu_seconds'] + record['children_cpu_seconds'],
+              # The stages run one at a time here, so the peak of the process is the peak of the stage
+              'peak_rss_mb': record['process_peak_rss_mb'], 'traced_peak_mb': None}
+    if trace_memory:
+        result['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return result
+
+def prepare_data(data_dir, rows, gcp_rows, seed):
+    marker = os.path.join(data_dir, 'synthetic-data.json')
+    parameters = {'rows': rows, 'gcp_rows': gcp_rows, 'seed': seed}
+    try:
+        with open(marker) as f:
+            if json.load(f) == parameters:
+                return
+    except FileNotFoundError:
+        pass
+    print(f'Generating {rows} rows in {data_dir}')
+    generate(rows, gcp_rows, data_dir, seed=seed)
+    with open(marker, 'w') as f:
+        json.dump(parameters, f)
+
+def remove_outputs(stages):
+    for file_path in run_files + [f for stage in stages for f in stage['outputs']]:
+        # Parts of a shared file, like the forecasts of a service, go with the file itself
+        if '::' not in file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+def outputs_exist(stage):
+    return all(file_fingerprint(file_path, {}) is not None if '::' in file_path else os.path.exists(file_path)
+               for file_path in stage['outputs'])
+
+def clear_caches():
+    with csv_reader.cached_frames_lock:
+        csv_reader.cached_frames.clear()
+    with csv_reader.parse_times_lock:
+        csv_reader.parse_times.clear()
+    reset()
+
+def run_scale(rows, gcp_rows, work_dir, seed, stage_names, trace_memory):
+    data_dir = os.path.join(work_dir, f'rows-{rows}')
+    prepare_data(data_dir, rows, gcp_rows, seed)
+
+    results = []
+    previous_dir = os.getcwd()
+    # The stages read and write their files in the working directory
+    os.chdir(data_dir)
+    try:
+        stages = pipeline_stages()
+        selected = [stage for stage in stages if not stage_names or stage['name'] in stage_names]
+        remove_outputs(selected)
+        clear_caches()
+        for stage in stages:
+            if stage not in selected:
+                # Stages that are not measured only run to produce the inputs of the next ones
+                if not outputs_exist(stage):
+                    stage['func']()
+                continue
+            print(f"{rows} rows: {stage['name']}")
+            results.append({'rows': rows, 'stage': stage['name'], **measure(stage, trace_memory)})
+        # The sections of the models inside the stages are in the instrumentation report of the scale
+        write_report()
+    finally:
+        os.chdir(previous_dir)
+    return results
+
+def load_results(results_file):
+    try:
+        return pd.read_csv(results_file, dtype={'commit': str, 'config': str})
+    except FileNotFoundError:
+        return pd.DataFrame(columns=results_columns)
+
+def save_results(results_file, results):
+    header = not os.path.exists(results_file)
+    pd.DataFrame(results, columns=results_columns).to_csv(results_file, mode='a', header=header, index=False)
+
+'''
+Compare the wall time of every stage with the last earlier run of the same scale and configuration.
+Returns the stages that got slower by more than tolerance.
+'''
+def compare_with_previous(history, results, tolerance):
+    regressions = []
+    current = pd.DataFrame(results, columns=results_columns)
+    for rows, run in current.groupby('rows'):
+        earlier = history[(history['rows'] == rows) & (history['config'] == run['config'].iloc[0])]
+        if earlier.empty:
+            print(f'{rows} rows: no earlier run to compare with')
+            continue
+        previous = earlier[earlier['run'] == earlier['run'].max()].set_index('stage')
+        print(f"{rows} rows, compared with run {previous['run'].iloc[0]} ({previous['commit'].iloc[0]}):")
+        for _, row in run.iterrows():
+            if row['stage'] not in previous.index:
+                continue
+            before = previous.loc[row['stage']]
+            ratio = row['wall_seconds'] / before['wall_seconds'] if before['wall_seconds'] else float('inf')
+            slower = ratio > 1 + tolerance and row['wall_seconds'] >= min_compared_seconds
+            flag = '  REGRESSION' if slower else ''
+            print(f"  {row['stage']:<20} {before['wall_seconds']:9.2f}s -> {row['wall_seconds']:9.2f}s ({ratio:5.2f}x)"
+                  f"  peak RSS {before['peak_rss_mb']:8.0f} -> {row['peak_rss_mb']:8.0f} MB{flag}")
+            if slower:
+                regressions.append((rows, row['stage']))
+    return regressions
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic reports.')
+    parser.add_argument('--rows', default=','.join(str(rows) for rows in default_scales),
+                        help='comma-separated numbers of AWS line items, from 10000 to 50000000')
+    parser.add_argument('--gcp-rows', type=int, default=default_gcp_rows, help='approximate number of GCP rows')
+    parser.add_argument('--work-dir', default='benchmark', help='directory for the synthetic reports and the results')
+    parser.add_argument('--results', default=None, help='results file, <work-dir>/benchmark-results.csv by default')
+    parser.add_argument('--stages', help='comma-separated stages to measure, all of them by default')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--trace-memory', action='store_true', help='also measure the peak of the Python allocations')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown reported as a regression, 0.2 is 20%%')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with 1 when a stage got slower')
+    return parser.parse_args(args)
+
+def main(args=None):
+    options = parse_args(args)
+    work_dir = os.path.abspath(options.work_dir)
+    results_file = options.results or os.path.join(work_dir, 'benchmark-results.csv')
+    stage_names = [name.strip() for name in options.stages.split(',')] if options.stages else None
+    os.makedirs(work_dir, exist_ok=True)
+
+    run = time.strftime('%Y-%m-%dT%H:%M:%S')
+    common = {'run': run, 'commit': current_commit(), 'config': current_config(options.trace_memory)}
+    results = []
+    for rows in [int(rows) for rows in options.rows.split(',')]:
+        results += [{**common, **result} for result in
+                    run_scale(rows, options.gcp_rows, work_dir, options.seed, stage_names, options.trace_memory)]
+
+    history = load_results(results_file)
+    save_results(results_file, results)
+    regressions = compare_with_previous(history, results, options.tolerance)
+    return 1 if regressions and options.fail_on_regression else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
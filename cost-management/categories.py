@@ -0,0 +1,83 @@
+import os
+import json
+import threading
+from csv_reader import read_csv_cached
+
+'''
+Compact in-memory representation of the clean reports.
+The text columns are read as categories, so every row only holds a small integer code.
+The categories of every column are kept in categories.json in the order they were first seen,
+so a value keeps the same code across runs and in every process that reads the reports.
+With COST_FLOAT32=1 the cost columns are also read as float32 instead of float64.
+'''
+categories_file = 'categories.json'
+aws_category_columns = ['line_item_product_code', 'product_region_code', 'product_servicecode', 'product_location']
+gcp_category_columns = ['Service description', 'SKU description', 'Project ID']
+aws_cost_columns = ['cost']
+gcp_cost_columns = ['Cost']
+float32_costs = os.getenv('COST_FLOAT32', '0') == '1'
+
+categories_lock = threading.Lock()
+
+def load_categories():
+    try:
+        with open(categories_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_categories(categories):
+    temp_file = categories_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(categories, f, indent=2, ensure_ascii=False)
+    os.replace(temp_file, categories_file)
+
+'''
+Add the values of df that are not known yet at the end of their column's categories.
+Values are stored as text, the way the CSV parser reads categories back.
+'''
+def update_categories(df, columns):
+    with categories_lock:
+        categories = load_categories()
+        changed = False
+        for column in columns:
+            if column not in df.columns:
+                continue
+            known = categories.setdefault(column, [])
+            new_values = sorted(set(df[column].dropna().astype(str).unique()) - set(known))
+            if new_values:
+                known.extend(new_values)
+                changed = True
+        if changed:
+            save_categories(categories)
+
+def clean_report_dtypes(category_columns, cost_columns):
+    dtypes = {column: 'category' for column in category_columns}
+    if float32_costs:
+        dtypes.update({column: 'float32' for column in cost_columns})
+    return dtypes
+
+'''
+The parser sorts the categories it finds in the file, they are put back in the shared order.
+Values missing from categories.json are kept after the known ones instead of becoming NaN.
+'''
+def apply_categories(df, columns):
+    categories = load_categories()
+    for column in columns:
+        if column not in df.columns:
+            continue
+        known = categories.get(column, [])
+        extra = sorted(set(df[column].cat.categories) - set(known))
+        df[column] = df[column].cat.set_categories(known + extra)
+    return df
+
+def read_clean_report(file_path, category_columns, cost_columns):
+    return read_csv_cached(file_path, dtype=clean_report_dtypes(category_columns, cost_columns),
+                           prepare=lambda df: apply_categories(df, category_columns),
+                           delimiter=',', low_memory=False)
+
+def read_aws_clean_report(file_path='clean-cost-and-usage-report-aws.csv'):
+    return read_clean_report(file_path, aws_category_columns, aws_cost_columns)
+
+def read_gcp_clean_report(file_path='clean-cost-and-usage-report-gcp.csv'):
+    return read_clean_report(file_path, gcp_category_columns, gcp_cost_columns)
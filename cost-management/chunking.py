@@ -0,0 +1,82 @@
+import os
+import pandas as pd
+import csv_reader
+
+'''
+Out-of-core mode for large cost reports.
+When COST_MEMORY_BUDGET_MB is set, the reports are read in chunks whose size is
+derived from the budget instead of being loaded whole into memory.
+'''
+memory_budget_mb = int(os.getenv('COST_MEMORY_BUDGET_MB', '0'))
+
+# A chunk is copied a few times while it is cleaned (drop, groupby, concat),
+# so only part of the budget is given to the raw rows of a single chunk.
+chunk_budget_share = 4
+sample_rows = 1000
+
+def chunked_mode():
+    return memory_budget_mb > 0
+
+def chunk_budget_bytes():
+    return memory_budget_mb * 1024 * 1024 / chunk_budget_share
+
+def read_sample(file_path, compression='infer', dtype=None):
+    return csv_reader.read_csv(file_path, nrows=sample_rows, compression=compression, low_memory=False, dtype=dtype)
+
+'''
+Estimate how many rows fit in the memory budget by parsing a small sample of the file
+and measuring how much memory one row takes once it is loaded into a DataFrame.
+'''
+def estimate_chunk_rows(sample):
+    if len(sample) == 0:
+        return sample_rows
+    bytes_per_row = sample.memory_usage(index=True, deep=True).sum() / len(sample)
+    return max(1, int(chunk_budget_bytes() / bytes_per_row))
+
+'''
+The columns, of the given ones, that have a value which isn't a number somewhere in the file.
+Only the given columns are read, as text, in chunks of chunk_rows rows.
+'''
+def text_columns(file_path, compression, columns, chunk_rows):
+    text = set()
+    if not columns:
+        return text
+    for chunk in csv_reader.read_csv(file_path, usecols=columns, dtype=str, chunksize=chunk_rows,
+                                     compression=compression, low_memory=False):
+        for column in set(columns) - text:
+            values = chunk[column].dropna()
+            if pd.to_numeric(values, errors='coerce').isna().any():
+                text.add(column)
+        if len(text) == len(columns):
+            break
+    return text
+
+'''
+The dtypes every chunk is parsed with. Left to the parser, a column can be read as integers in one
+chunk and as floats or text in the next, and the cleaned output would depend on the chunk size.
+The numeric columns of the sample are read as float64 and the others as text, dtype overrides them.
+Sparse columns, like resource tags or reservation ARNs, can be empty in the whole sample, which the
+parser reads as numeric. They are checked over the whole file first, like the parser does without chunks.
+'''
+def chunk_dtypes(sample, dtype=None, empty_text_columns=()):
+    dtypes = {}
+    for column, kind in sample.dtypes.items():
+        numeric = pd.api.types.is_numeric_dtype(kind) and not pd.api.types.is_bool_dtype(kind)
+        dtypes[column] = 'float64' if numeric and column not in empty_text_columns else str
+    dtypes.update(dtype or {})
+    return dtypes
+
+def read_csv_chunks(file_path, compression='infer', dtype=None, **kwargs):
+    # dtype=str reads every column as text, otherwise the dtypes of the sample are completed with dtype
+    sample = read_sample(file_path, compression, dtype)
+    chunk_rows = estimate_chunk_rows(sample)
+    if dtype is not str:
+        usecols = kwargs.get('usecols')
+        empty = [column for column in sample.columns if sample[column].isna().all() and column not in (dtype or {})
+                 and (usecols is None or column in usecols)]
+        dtype = chunk_dtypes(sample, dtype, text_columns(file_path, compression, empty, chunk_rows))
+    return csv_reader.read_csv(file_path, chunksize=chunk_rows, compression=compression,
+                               low_memory=False, dtype=dtype, **kwargs)
+
+def read_columns(file_path, compression='infer'):
+    return list(csv_reader.read_csv(file_path, nrows=0, compression=compression).columns)
@@ -0,0 +1,200 @@
+import io
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import data_processing as processing
+from csv_reader import read_csv
+
+'''
+Precomputed cost cube over date x provider x service x region x account.
+The daily cube and its weekly and monthly rollups are saved as parquet files sorted by date,
+in row groups of a few days each. A time window is read with filters on the date column, so only the
+row groups whose date statistics overlap it are read, and a chart is a small groupby over those rows.
+The incremental update finds the first changed day with a binary search on the sorted dates.
+'''
+cube_files = {
+    'daily': 'cost-cube-daily.parquet',
+    'weekly': 'cost-cube-weekly.parquet',
+    'monthly': 'cost-cube-monthly.parquet',
+}
+# Size and hash of the clean reports the cube was built from
+cube_state_file = 'cost-cube-state.json'
+dimensions = ['date', 'provider', 'service', 'region', 'account']
+rollup_periods = {'weekly': 'W-SUN', 'monthly': 'M'}
+# The files are sorted by date, so every row group covers a few days and a read of a
+# date window skips the row groups whose date statistics are outside of it
+row_group_rows = 20000
+
+# Columns of the clean reports for every dimension, GCP reports have no region.
+# AWS services are their product codes, the way the dashboard shows them.
+# Reports without the account column, like AWS reports without the usage account, have an empty account
+sources = {
+    'aws': {'file': processing.aws_clean_file, 'date': 'date', 'service': 'line_item_product_code',
+            'region': 'product_region_code', 'account': 'line_item_usage_account_id', 'cost': 'cost'},
+    'gcp': {'file': processing.gcp_clean_file, 'date': 'Date', 'service': 'Service description',
+            'region': None, 'account': 'Project ID', 'cost': 'Cost'},
+}
+
+def prefix_hash(file_path, size):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        remaining = size
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            sha1.update(block)
+            remaining -= len(block)
+    return sha1.hexdigest()
+
+def load_cube_state():
+    try:
+        with open(cube_state_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_cube_state(state):
+    temp_file = cube_state_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_file, cube_state_file)
+
+def read_source(source, file_state):
+    # The header is parsed as CSV, quoted column names can contain commas
+    header = list(read_csv(source['file'], nrows=0).columns)
+    dtypes = {source[column]: str for column in ['date', 'service', 'region', 'account'] if source[column] in header}
+    # In incremental runs the clean report is only appended to, so only the new rows are parsed
+    if file_state:
+        with open(source['file'], 'rb') as f:
+            f.seek(file_state['size'])
+            tail = f.read()
+        if not tail:
+            return pd.DataFrame(columns=header)
+        return read_csv(io.BytesIO(tail), names=header, header=None, dtype=dtypes)
+    return read_csv(source['file'], dtype=dtypes, low_memory=False)
+
+def daily_rows(df, provider, source):
+    rows = pd.DataFrame({
+        'date': pd.to_datetime(df[source['date']]),
+        'provider': provider,
+        'service': df[source['service']].fillna(''),
+        'region': df[source['region']].fillna('') if source['region'] else '',
+        'account': df[source['account']].fillna('') if source['account'] in df else '',
+        'cost': df[source['cost']].astype(np.float64),
+    })
+    return aggregate(rows)
+
+def aggregate(rows):
+    return rows.groupby(dimensions, observed=True, sort=True)['cost'].sum().reset_index()
+
+def rollup(daily, granularity):
+    rows = daily.copy()
+    rows['date'] = rows['date'].dt.to_period(rollup_periods[granularity]).dt.start_time
+    return aggregate(rows)
+
+def save_cube(granularity, cube):
+    file_path = cube_files[granularity]
+    temp_file = file_path + '.tmp'
+    cube.to_parquet(temp_file, index=False, row_group_size=row_group_rows)
+    os.replace(temp_file, file_path)
+
+def replace_from(cube, new_rows, start):
+    # Rows are sorted by date, everything from start on is replaced by the new rows
+    if cube is None:
+        return new_rows
+    kept = cube.iloc[:date_position(cube, start, 'left')]
+    return pd.concat([kept, new_rows], ignore_index=True)
+
+def date_position(cube, date, side):
+    return int(np.searchsorted(cube['date'].to_numpy(), np.datetime64(pd.Timestamp(date)), side=side))
+
+'''
+Build the cube, or update it when the clean reports have only been appended to since the last build.
+Only the days from the first appended day on are aggregated again, the earlier rows are kept.
+'''
+def update_cost_cube():
+    state = load_cube_state()
+    new_state = {}
+    file_states = {}
+    for provider, source in sources.items():
+        size = os.path.getsize(source['file'])
+        file_state = state.get(provider)
+        appended = (file_state is not None and all(os.path.exists(f) for f in cube_files.values())
+                    and size >= file_state['size'] and prefix_hash(source['file'], file_state['size']) == file_state['sha1'])
+        file_states[provider] = file_state if appended else None
+        new_state[provider] = {'size': size, 'sha1': prefix_hash(source['file'], size)}
+
+    incremental = all(file_states.values())
+    if not incremental:
+        file_states = {provider: None for provider in sources}
+
+    new_rows = [daily_rows(read_source(source, file_states[provider]), provider, source)
+                for provider, source in sources.items()]
+    new_rows = aggregate(pd.concat(new_rows, ignore_index=True))
+
+    old_daily = pd.read_parquet(cube_files['daily']) if incremental else None
+    if incremental and len(new_rows) == 0:
+        save_cube_state(new_state)
+        return
+    if incremental:
+        start = new_rows['date'].min()
+        # Appended rows can still fall on the last day of the cube, that day is aggregated again
+        changed = old_daily.iloc[date_position(old_daily, start, 'left'):]
+        new_rows = aggregate(pd.concat([changed, new_rows], ignore_index=True))
+    else:
+        start = None
+    daily = replace_from(old_daily, new_rows, start)
+    save_cube('daily', daily)
+
+    for granularity, period in rollup_periods.items():
+        if incremental:
+            period_start = pd.Timestamp(start).to_period(period).start_time
+            rows = rollup(daily.iloc[date_position(daily, period_start, 'left'):], granularity)
+            cube = replace_from(pd.read_parquet(cube_files[granularity]), rows, period_start)
+        else:
+            cube = rollup(daily, granularity)
+        save_cube(granularity, cube)
+    save_cube_state(new_state)
+
+def window_filters(start=None, end=None, **filters):
+    conditions = []
+    if start is not None:
+        conditions.append(('date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        conditions.append(('date', '<=', pd.Timestamp(end)))
+    for column, values in filters.items():
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else list(values)
+        conditions.append((column, 'in', values))
+    return conditions or None
+
+'''
+Read only the rows of a cube file between start and end (both included) that match the filters, without loading
+the cube, for example read_cube_window('daily', '2024-05-01', '2024-05-31', provider='aws', service=['AmazonEC2']).
+The row groups outside of the window are not read.
+'''
+def read_cube_window(granularity='daily', start=None, end=None, **filters):
+    return pd.read_parquet(cube_files[granularity], filters=window_filters(start, end, **filters))
+
+def cube_dates(granularity='daily'):
+    # First and last date of a cube file, from the row group statistics in its footer
+    metadata = pq.ParquetFile(cube_files[granularity]).metadata
+    if metadata.num_rows == 0:
+        return None, None
+    column = metadata.schema.names.index('date')
+    statistics = [metadata.row_group(i).column(column).statistics for i in range(metadata.num_row_groups)]
+    statistics = [s for s in statistics if s is not None and s.has_min_max]
+    return pd.Timestamp(min(s.min for s in statistics)), pd.Timestamp(max(s.max for s in statistics))
+
+def cube_values(column, granularity='monthly', **filters):
+    # Values of a dimension, the monthly rollup has them all in the fewest rows
+    rows = pd.read_parquet(cube_files[granularity], columns=[column], filters=window_filters(**filters))
+    return sorted(rows[column].dropna().unique())
+
+def cube_chart(rows, column='service'):
+    return rows.groupby(['date', column], observed=True)['cost'].sum().unstack()
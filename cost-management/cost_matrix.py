@@ -0,0 +1,71 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import data_processing as processing
+from categories import (load_categories, read_aws_clean_report, read_gcp_clean_report, float32_costs)
+
+'''
+Daily cost of every service as one dense services x days matrix.
+The matrix is saved as a .npy file next to a small JSON index with the service names and dates,
+so worker processes can memory-map it instead of receiving pickled DataFrames.
+The AWS services come first, then the GCP ones, each in the order of categories.json,
+so the row of a service doesn't move when new services appear.
+'''
+matrix_file = 'cost-matrix.npy'
+index_file = 'cost-matrix.json'
+aws_service_column = 'product_servicecode'
+gcp_service_column = 'Service description'
+
+def daily_costs(df, service_column, date_column, cost_column):
+    dates = pd.to_datetime(df[date_column]).dt.strftime('%Y-%m-%d')
+    return df[cost_column].groupby([df[service_column], dates], observed=True).sum()
+
+def ordered_services(services, column):
+    known = load_categories().get(column, [])
+    return [s for s in known if s in services] + sorted(set(services) - set(known))
+
+def save_atomically(file_path, write):
+    # Attached workers keep reading the old file until they attach again
+    temp_file = file_path + '.tmp'
+    with open(temp_file, 'wb') as f:
+        write(f)
+    os.replace(temp_file, file_path)
+
+def build_cost_matrix():
+    aws_costs = daily_costs(read_aws_clean_report(processing.aws_clean_file), aws_service_column, 'date', 'cost')
+    gcp_costs = daily_costs(read_gcp_clean_report(processing.gcp_clean_file), gcp_service_column, 'Date', 'Cost')
+
+    services = (ordered_services(aws_costs.index.unique(0), aws_service_column)
+                + ordered_services(gcp_costs.index.unique(0), gcp_service_column))
+    providers = ['aws'] * aws_costs.index.unique(0).size + ['gcp'] * gcp_costs.index.unique(0).size
+    all_dates = aws_costs.index.unique(1).union(gcp_costs.index.unique(1))
+    # Every day between the first and the last report is a column, days without costs are zero
+    dates = pd.date_range(all_dates.min(), all_dates.max()).strftime('%Y-%m-%d') if len(all_dates) else pd.Index([])
+
+    costs = pd.concat([aws_costs, gcp_costs])
+    costs.index = costs.index.set_levels(costs.index.levels[0].astype(str), level=0)
+    matrix = costs.unstack(fill_value=0).reindex(index=services, columns=dates, fill_value=0)
+    matrix = matrix.to_numpy(dtype=np.float32 if float32_costs else np.float64)
+
+    save_atomically(matrix_file, lambda f: np.save(f, matrix))
+    index = {'services': services, 'providers': providers, 'dates': list(dates), 'dtype': str(matrix.dtype)}
+    save_atomically(index_file, lambda f: f.write(json.dumps(index, indent=2).encode('utf-8')))
+    return matrix, index
+
+'''
+Memory-map the matrix read-only. The pages are shared by every process that attaches to it,
+and a worker only reads the rows it uses.
+'''
+def attach_cost_matrix():
+    with open(index_file) as f:
+        index = json.load(f)
+    matrix = np.load(matrix_file, mmap_mode='r')
+    if matrix.shape != (len(index['services']), len(index['dates'])):
+        raise ValueError(f'{matrix_file} and {index_file} are from different runs, build the cost matrix again')
+    return matrix, index
+
+def service_costs(matrix, index, service):
+    # The values are a view of the mapped row, nothing is copied
+    row = index['services'].index(service)
+    return pd.Series(matrix[row], index=pd.DatetimeIndex(index['dates']), name=service, copy=False)
@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+import pandas as pd
+
+'''
+Every CSV of the pipeline is read through read_csv, so the parser can be switched in one place.
+COST_CSV_ENGINE=pyarrow uses the multi-threaded Arrow parser, the default is the pandas C parser.
+The parse time of every file is recorded in parse_times.
+'''
+csv_engine = os.getenv('COST_CSV_ENGINE', 'c')
+
+# Options the Arrow parser doesn't support, the C parser is used when one of them is given
+c_engine_options = ['chunksize', 'iterator', 'nrows', 'skipfooter', 'converters', 'float_precision']
+
+parse_times = []
+parse_times_lock = threading.Lock()
+
+# Frames returned by read_csv_cached, by file path, with the size and modification time they were read at
+cached_frames = {}
+cached_frames_lock = threading.Lock()
+file_locks = {}
+
+def select_engine(kwargs):
+    if csv_engine == 'pyarrow' and not any(option in kwargs for option in c_engine_options):
+        # low_memory only applies to the C parser
+        kwargs.pop('low_memory', None)
+        return 'pyarrow'
+    return 'c'
+
+def record_parse_time(file_path, engine, seconds, rows):
+    with parse_times_lock:
+        parse_times.append({'file': str(file_path), 'engine': engine, 'seconds': seconds, 'rows': rows})
+
+def timed_read_csv(file_path, dtype=None, **kwargs):
+    engine = select_engine(kwargs)
+    start = time.perf_counter()
+    df = pd.read_csv(file_path, dtype=dtype, engine=engine, **kwargs)
+    return df, engine, time.perf_counter() - start
+
+def read_csv(file_path, dtype=None, **kwargs):
+    if 'chunksize' in kwargs or kwargs.get('iterator'):
+        return read_csv_chunks(file_path, dtype=dtype, **kwargs)
+    df, engine, seconds = timed_read_csv(file_path, dtype=dtype, **kwargs)
+    record_parse_time(file_path, engine, seconds, len(df))
+    return df
+
+'''
+The time spent in a chunked read is only known once all the chunks have been parsed,
+so it is recorded when the iterator is exhausted.
+'''
+def read_csv_chunks(file_path, dtype=None, **kwargs):
+    seconds = 0
+    rows = 0
+    start = time.perf_counter()
+    reader = pd.read_csv(file_path, dtype=dtype, engine='c', **kwargs)
+    seconds += time.perf_counter() - start
+    with reader:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - start
+            rows += len(chunk)
+            yield chunk
+    record_parse_time(file_path, 'c', seconds, rows)
+
+'''
+Read a file once and return the same DataFrame until the file changes on disk.
+The services all read the same clean report, and a long-running process keeps it in memory
+between runs. The returned frame is shared, so it must not be modified in place.
+prepare is called once on a newly parsed frame, before it is shared.
+'''
+def read_csv_cached(file_path, dtype=None, prepare=None, **kwargs):
+    with cached_frames_lock:
+        file_lock = file_locks.setdefault(file_path, threading.Lock())
+    # Only one thread parses a file, the others wait for its result
+    with file_lock:
+        stat = os.stat(file_path)
+        version = (stat.st_size, stat.st_mtime_ns, repr(dtype), repr(sorted(kwargs.items())))
+        cached = cached_frames.get(file_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        df = read_csv(file_path, dtype=dtype, **kwargs)
+        if prepare is not None:
+            df = prepare(df)
+        cached_frames[file_path] = (version, df)
+        return df
+
+def parse_time_report():
+    with parse_times_lock:
+        return pd.DataFrame(parse_times, columns=['file', 'engine', 'seconds', 'rows'])
+
+def write_parse_times(file_path='csv-parse-times.csv'):
+    parse_time_report().to_csv(file_path, index=False)
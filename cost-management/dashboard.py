@@ -1,19 +1,20 @@
 import streamlit as st
-import pandas as pd
 from streamlit_option_menu import option_menu
-
-aws_report = pd.read_csv('clean-cost-and-usage-report-aws.csv') 
-gcp_report = pd.read_csv('clean-cost-and-usage-report-gcp.csv') 
-forecast_compute_engine = pd.read_csv('forecasted_compute_engine_costs.csv')
-forecast_kubernetes_engine = pd.read_csv('forecasted_kubernetes_engine_costs.csv')
-forecast_networking = pd.read_csv('forecasted_networking_costs.csv')
-forecast_amazon_ec2 = pd.read_csv('forecasted_amazonEC2_costs.csv')
-forecast_amazon_eks = pd.read_csv('forecasted_amazonEKS_costs.csv')
-forecast_amazon_vpc = pd.read_csv('forecasted_amazonVPC_costs.csv')
-forecast_awsconfig = pd.read_csv('forecasted_awsConfig_costs.csv')
-forecast_awskms = pd.read_csv('forecasted_awskms_costs.csv')
-forecast_amazon_s3 = pd.read_csv('forecasted_amazonS3_costs.csv')
-forecast_amazon_cloud_watch = pd.read_csv('forecasted_amazoncloudwatch_costs.csv')
+from dashboard_data import cost_by_date, cost_by_region, service_forecast, date_range, dimension_values
+
+# Selectors of the window that is charted, only that window is read from the cost cube
+def window_selectors(provider, with_regions=True):
+    first, last = date_range()
+    if first is None:
+        return None, None, None, None
+    with st.sidebar:
+        dates = st.date_input('Dates', value=(first.date(), last.date()), min_value=first.date(), max_value=last.date(),
+                              key=f'{provider}_dates')
+        services = st.multiselect('Services', dimension_values('service', provider), key=f'{provider}_services')
+        regions = st.multiselect('Regions', dimension_values('region', provider), key=f'{provider}_regions') if with_regions else None
+    # While the second date of the range is being picked only the first one is set
+    start, end = (dates[0], dates[-1]) if dates else (None, None)
+    return start, end, services, regions
 
 with st.sidebar:
     selected = option_menu(
@@ -24,6 +25,7 @@ with st.sidebar:
     
 if selected == "Amazon Web Services":
     st.header('AWS Statistics')
+    start, end, services, regions = window_selectors('aws')
     # Create a row layout
     Cost_by_date , Cost_by_region= st.columns(2)
 
@@ -32,15 +34,15 @@ if selected == "Amazon Web Services":
         Cost_by_region.write("Cost by region")
 
     with Cost_by_date :
-        cost_by_date = aws_report.groupby(['date', 'line_item_product_code'])['cost'].sum().unstack()
-        st.bar_chart(cost_by_date)
+        st.bar_chart(cost_by_date('aws', start, end, services, regions))
 
     with Cost_by_region:
-        chart_data = aws_report.groupby(['line_item_product_code', 'product_location'])['cost'].sum().unstack()
-        st.bar_chart(chart_data)
+        st.bar_chart(cost_by_region('aws', start, end, services, regions))
     
 if selected == "Google Cloud Platform":
     st.header('GCP Statistics')
+    # GCP reports have no region
+    start, end, services, _ = window_selectors('gcp', with_regions=False)
     # Create a row layout
     Cost_by_date, Cost_by_region= st.columns(2)
     c3, c4= st.columns(2)
@@ -49,8 +51,7 @@ if selected == "Google Cloud Platform":
         Cost_by_date .write("Cost by date ")
 
     with Cost_by_date :
-        cost_by_date = gcp_report.groupby(['Date', 'Service description'])['Cost'].sum().unstack()
-        st.bar_chart(cost_by_date)
+        st.bar_chart(cost_by_date('gcp', start, end, services))
 
     
 if selected == "AWS Forecasts":
@@ -77,31 +78,31 @@ if selected == "AWS Forecasts":
         Forecast_Amazon_EC2.write("Forecast Amazon EC2")
 
     with Forecast_amazon_EKS:
-        forecasts_amazon_eks = forecast_amazon_eks.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_amazon_eks = service_forecast('amazonEKS')
         st.bar_chart(forecasts_amazon_eks)
 
     with Forecast_amazon_s3:
-        forecasts_amazon_s3 = forecast_amazon_s3.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_amazon_s3 = service_forecast('amazonS3')
         st.bar_chart(forecasts_amazon_s3)
     
     with Forecast_awsconfig:
-        forecasts_awsconfig = forecast_awsconfig.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_awsconfig = service_forecast('awsConfig')
         st.bar_chart(forecasts_awsconfig)
 
     with Forecast_amazon_VPC:
-        forecasts_amazon_vpc = forecast_amazon_vpc.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_amazon_vpc = service_forecast('amazonVPC')
         st.bar_chart(forecasts_amazon_vpc)
     
     with Forecast_awskms:
-        forecasts_awskms = forecast_awskms.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_awskms = service_forecast('awskms')
         st.bar_chart(forecasts_awskms)
     
     with Forecast_Amazon_cloud_watch:
-        forecasts_amazon_cloud_watch = forecast_amazon_cloud_watch.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_amazon_cloud_watch = service_forecast('amazoncloudwatch')
         st.bar_chart(forecasts_amazon_cloud_watch)
     
     with Forecast_Amazon_EC2:
-        forecasts_amazon_ec2 = forecast_amazon_ec2.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecasts_amazon_ec2 = service_forecast('amazonEC2')
         st.bar_chart(forecasts_amazon_ec2)
 
 if selected == "GCP Forecasts":
@@ -119,13 +120,13 @@ if selected == "GCP Forecasts":
         Forecast_Compute_Engine.write("Forecast Compute Engine")
 
     with Forecast_Kubernetes:
-        forecast_kubernetes_engine = forecast_kubernetes_engine.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecast_kubernetes_engine = service_forecast('kubernetes_engine')
         st.bar_chart(forecast_kubernetes_engine)
 
     with Forecast_Networking:
-        forecast_networking = forecast_networking.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecast_networking = service_forecast('networking')
         st.bar_chart(forecast_networking)
 
     with Forecast_Compute_Engine:
-        forecast_compute_engine = forecast_compute_engine.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+        forecast_compute_engine = service_forecast('compute_engine')
         st.bar_chart(forecast_compute_engine)
@@ -0,0 +1,90 @@
+import os
+import pandas as pd
+import streamlit as st
+from forecast_store import load_forecasts, service_fingerprint
+from cost_cube import cube_files, rollup_periods, cube_chart, read_cube_window, cube_dates, cube_values
+
+'''
+Data layer of the dashboard. Every chart is computed from the cost cube or the forecasts file
+and cached by streamlit for all sessions, keyed on the version of the file it was computed from,
+so a rerun or a new session only reads the files again after the pipeline rewrote them.
+The tabs call these functions when they are shown and each one returns only the series it charts.
+The selected dates, services and regions are passed down to the parquet reads, so only the
+row groups of the selected window are read and aggregated.
+'''
+# Windows longer than this are charted from the weekly, then the monthly rollup of the cube
+max_chart_points = 400
+# Charts of older file versions are dropped after a day
+cache_seconds = 24 * 60 * 60
+
+def file_version(file_path):
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def cube_versions():
+    return {granularity: file_version(file_path) for granularity, file_path in cube_files.items()}
+
+def chart_granularity(start, end):
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    if days <= max_chart_points:
+        return 'daily'
+    if days / 7 <= max_chart_points:
+        return 'weekly'
+    return 'monthly'
+
+def selection(values):
+    # Nothing selected means everything, and the order of the selection doesn't change the chart
+    return tuple(sorted(values)) if values else None
+
+@st.cache_data(show_spinner=False, ttl=cache_seconds)
+def cached_date_range(versions):
+    return cube_dates('daily')
+
+@st.cache_data(show_spinner=False, ttl=cache_seconds)
+def cached_dimension_values(column, provider, versions):
+    return cube_values(column, provider=provider)
+
+@st.cache_data(show_spinner=False, ttl=cache_seconds)
+def cached_cost_by_date(provider, start, end, services, regions, versions):
+    first, last = cached_date_range(versions)
+    if first is None:
+        return None
+    granularity = chart_granularity(start or first, end or last)
+    if start is not None and granularity != 'daily':
+        # Rows of a rollup are dated by the first day of their week or month
+        start = pd.Timestamp(start).to_period(rollup_periods[granularity]).start_time
+    rows = read_cube_window(granularity, start, end, provider=provider, service=services, region=regions)
+    return cube_chart(rows)
+
+@st.cache_data(show_spinner=False, ttl=cache_seconds)
+def cached_cost_by_region(provider, start, end, services, regions, versions):
+    rows = read_cube_window('daily', start, end, provider=provider, service=services, region=regions)
+    return rows.groupby(['service', 'region'], observed=True)['cost'].sum().unstack()
+
+@st.cache_data(show_spinner=False, ttl=cache_seconds)
+def cached_service_forecast(service, fingerprint):
+    forecast = load_forecasts([service]).get(service)
+    if forecast is None:
+        return None
+    return forecast.groupby(['date', 'product_servicecode'])['forecast'].sum().unstack()
+
+def date_range():
+    # First and last day of the reports, the bounds of the date selectors
+    return cached_date_range(cube_versions())
+
+def dimension_values(column, provider):
+    return cached_dimension_values(column, provider, cube_versions())
+
+'''
+Cost by date and service between start and end (both included) of the selected services and regions,
+None selects all of them. Long windows are charted from the weekly or monthly rollup.
+'''
+def cost_by_date(provider, start=None, end=None, services=None, regions=None):
+    return cached_cost_by_date(provider, start, end, selection(services), selection(regions), cube_versions())
+
+def cost_by_region(provider, start=None, end=None, services=None, regions=None):
+    return cached_cost_by_region(provider, start, end, selection(services), selection(regions), cube_versions())
+
+def service_forecast(service):
+    # Keyed on the hash of the service in the file, updating another service keeps this chart cached
+    return cached_service_forecast(service, service_fingerprint(service))
@@ -1,62 +1,154 @@
 import pandas as pd 
 import numpy as np
+import os
+import json
+import shutil
+import tempfile
+from chunking import chunked_mode, read_csv_chunks, chunk_budget_bytes
+from csv_reader import read_csv
+from categories import aws_category_columns, gcp_category_columns, update_categories
+from dedup import (aws_line_item_columns, gcp_line_item_columns, gcp_optional_line_item_columns, dedup_line_items,
+                   row_fingerprints, key_columns, contains, add_keys, load_keys, save_keys)
 
-def data_processing():
-    aws_report = pd.read_csv('cost-and-usage-report-aws.csv', delimiter=',', low_memory=False)
-    gcp_report = pd.read_csv('cost-and-usage-report-gcp.csv', delimiter=',', low_memory=False)
+aws_group_columns = ['date', 'line_item_product_code', 'product_region_code']
+# Fingerprints of the line items that have been processed, kept for incremental runs
+aws_keys_file = 'aws-line-items.keys.npy'
+gcp_keys_file = 'gcp-line-items.keys.npy'
+aws_raw_file = 'cost-and-usage-report-aws.csv'
+gcp_raw_file = 'cost-and-usage-report-gcp.csv'
+aws_clean_file = 'clean-cost-and-usage-report-aws.csv'
+gcp_clean_file = 'clean-cost-and-usage-report-gcp.csv'
+# Last date that has been processed for every provider
+state_file = 'processing-state.json'
+incremental_mode = os.getenv('COST_INCREMENTAL', '0') == '1'
+# The Arrow parser would turn these into timestamps, the processing works on their text.
+# Account ids are identifiers and can start with a zero, they are kept as text too
+aws_raw_dtypes = {'identity_time_interval': str, 'bill_billing_period_start_date': str, 'line_item_usage_account_id': str}
 
+aws_unused_columns = ['bill_bill_type', 'bill_billing_entity', 'bill_invoice_id', 'bill_invoicing_entity',
+                      'bill_payer_account_id', 'bill_payer_account_name', 'bill_billing_period_end_date',
+                      'bill_billing_period_start_date', 'cost_category', 'discount', 'identity_line_item_id',
+                      'line_item_availability_zone', 'line_item_currency_code',
+                      'line_item_line_item_type', 'line_item_net_unblended_cost', 'line_item_net_unblended_rate',
+                      'line_item_normalization_factor', 'split_line_item_net_split_cost', 'split_line_item_net_unused_cost',
+                      'split_line_item_parent_resource_id', 'split_line_item_public_on_demand_split_cost',
+                      'split_line_item_public_on_demand_unused_cost', 'split_line_item_reserved_usage',
+                      'split_line_item_split_cost', 'split_line_item_split_usage',
+                      'split_line_item_split_usage_ratio', 'split_line_item_unused_cost',
+                      'line_item_normalized_usage_amount', 'savings_plan_purchase_term',
+                      'savings_plan_recurring_commitment_for_billing_period', 'line_item_tax_type',
+                      'savings_plan_offering_type', 'savings_plan_payment_option', 'savings_plan_region',
+                      'savings_plan_savings_plan_a_r_n', 'savings_plan_savings_plan_effective_cost',
+                      'split_line_item_actual_usage', 'savings_plan_used_commitment',
+                      'savings_plan_total_commitment_to_date', 'savings_plan_start_time', 'savings_plan_savings_plan_rate',
+                      'savings_plan_net_savings_plan_effective_cost', 'reservation_unused_normalized_unit_quantity',
+                      'reservation_unused_quantity', 'reservation_unused_recurring_fee', 'reservation_upfront_value',
+                      'resource_tags', 'savings_plan_amortized_upfront_commitment_for_billing_period', 'savings_plan_end_time',
+                      'savings_plan_instance_type_family', 'savings_plan_net_amortized_upfront_commitment_for_billing_period',
+                      'savings_plan_net_recurring_commitment_for_billing_period', 'reservation_normalized_units_per_reservation',
+                      'reservation_number_of_reservations', 'reservation_recurring_fee_for_usage',
+                      'reservation_reservation_a_r_n', 'reservation_start_time', 'reservation_subscription_id',
+                      'reservation_net_amortized_upfront_fee_for_billing_period', 'reservation_net_effective_cost',
+                      'reservation_net_recurring_fee_for_usage', 'reservation_net_unused_amortized_upfront_fee_for_billing_period',
+                      'reservation_unused_amortized_upfront_fee_for_billing_period',
+                      'reservation_units_per_reservation', 'reservation_total_reserved_units', 'reservation_total_reserved_normalized_units',
+                      'reservation_net_upfront_value', 'reservation_net_unused_recurring_fee', 'reservation_net_amortized_upfront_cost_for_usage',
+                      'reservation_modification_status', 'reservation_end_time', 'reservation_effective_cost', 'reservation_availability_zone',
+                      'reservation_amortized_upfront_fee_for_billing_period', 'reservation_amortized_upfront_cost_for_usage',
+                      'product_sku', 'product_to_location_type', 'product_product_family', 'product_pricing_unit',
+                      'product_operation', 'product_location_type', 'product_instancesku', 'product_instance_type',
+                      'product_instance_family', 'product_from_region_code', 'product_from_location_type',
+                      'product_from_location', 'product_fee_code', 'product_fee_description', 'product_comment',
+                      'product', 'pricing_unit', 'pricing_term', 'pricing_rate_id', 'pricing_rate_code', 'pricing_purchase_option',
+                      'pricing_public_on_demand_cost', 'pricing_public_on_demand_rate', 'pricing_offering_class', 'pricing_lease_contract_length',
+                      'pricing_currency', 'line_item_usage_type', 'line_item_usage_start_date', 'line_item_usage_end_date',
+                      'line_item_usage_account_name', 'line_item_unblended_rate']
+
+'''
+Clean the raw AWS rows and keep the first line item of every (date, product code, region code) group.
+The first row of a group is also the first row among the per-chunk results, so the chunked
+mode can clean every chunk on its own and merge the partial results with the same groupby.
+'''
+def clean_aws_report(aws_report):
     # Convert the columns to numeric values, forcing any non-numeric values to NaN for AWS
     numeric_columns = aws_report.select_dtypes(include=[np.number]).columns
     aws_report[numeric_columns] = aws_report[numeric_columns].fillna(0.0)
 
     # Drop columns that are not needed
-    gcp_report.drop(['Subtotal (€)', 'Unrounded subtotal (€)'], axis=1, inplace=True)  
-    aws_report.drop(['bill_bill_type', 'bill_billing_entity', 'bill_invoice_id', 'bill_invoicing_entity', 
-                    'bill_payer_account_id', 'bill_payer_account_name', 'bill_billing_period_end_date', 
-                    'bill_billing_period_start_date', 'cost_category', 'discount', 'identity_line_item_id', 
-                    'line_item_availability_zone', 'line_item_currency_code', 
-                    'line_item_line_item_type', 'line_item_net_unblended_cost', 'line_item_net_unblended_rate', 
-                    'line_item_normalization_factor', 'split_line_item_net_split_cost', 'split_line_item_net_unused_cost', 
-                    'split_line_item_parent_resource_id', 'split_line_item_public_on_demand_split_cost', 
-                    'split_line_item_public_on_demand_unused_cost', 'split_line_item_reserved_usage', 
-                    'split_line_item_split_cost', 'split_line_item_split_usage', 
-                    'split_line_item_split_usage_ratio', 'split_line_item_unused_cost', 
-                    'line_item_normalized_usage_amount', 'savings_plan_purchase_term', 
-                    'savings_plan_recurring_commitment_for_billing_period', 'line_item_tax_type', 
-                    'savings_plan_offering_type', 'savings_plan_payment_option', 'savings_plan_region', 
-                    'savings_plan_savings_plan_a_r_n', 'savings_plan_savings_plan_effective_cost', 
-                    'split_line_item_actual_usage', 'savings_plan_used_commitment', 
-                    'savings_plan_total_commitment_to_date', 'savings_plan_start_time', 'savings_plan_savings_plan_rate', 
-                    'savings_plan_net_savings_plan_effective_cost', 'reservation_unused_normalized_unit_quantity', 
-                    'reservation_unused_quantity', 'reservation_unused_recurring_fee', 'reservation_upfront_value', 
-                    'resource_tags', 'savings_plan_amortized_upfront_commitment_for_billing_period', 'savings_plan_end_time', 
-                    'savings_plan_instance_type_family', 'savings_plan_net_amortized_upfront_commitment_for_billing_period', 
-                    'savings_plan_net_recurring_commitment_for_billing_period', 'reservation_normalized_units_per_reservation', 
-                    'reservation_number_of_reservations', 'reservation_recurring_fee_for_usage', 
-                    'reservation_reservation_a_r_n', 'reservation_start_time', 'reservation_subscription_id', 
-                    'reservation_net_amortized_upfront_fee_for_billing_period', 'reservation_net_effective_cost', 
-                    'reservation_net_recurring_fee_for_usage', 'reservation_net_unused_amortized_upfront_fee_for_billing_period', 
-                    'reservation_unused_amortized_upfront_fee_for_billing_period', 
-                    'reservation_units_per_reservation', 'reservation_total_reserved_units', 'reservation_total_reserved_normalized_units', 
-                    'reservation_net_upfront_value', 'reservation_net_unused_recurring_fee', 'reservation_net_amortized_upfront_cost_for_usage', 
-                    'reservation_modification_status', 'reservation_end_time', 'reservation_effective_cost', 'reservation_availability_zone', 
-                    'reservation_amortized_upfront_fee_for_billing_period', 'reservation_amortized_upfront_cost_for_usage', 
-                    'product_sku', 'product_to_location_type', 'product_product_family', 'product_pricing_unit', 
-                    'product_operation', 'product_location_type', 'product_instancesku', 'product_instance_type', 
-                    'product_instance_family', 'product_from_region_code', 'product_from_location_type', 
-                    'product_from_location', 'product_fee_code', 'product_fee_description', 'product_comment', 
-                    'product', 'pricing_unit', 'pricing_term', 'pricing_rate_id', 'pricing_rate_code', 'pricing_purchase_option', 
-                    'pricing_public_on_demand_cost', 'pricing_public_on_demand_rate', 'pricing_offering_class', 'pricing_lease_contract_length', 
-                    'pricing_currency', 'line_item_usage_type', 'line_item_usage_start_date', 'line_item_usage_end_date', 
-                    'line_item_usage_account_name', 'line_item_unblended_rate'], axis=1, inplace=True)   
-    
+    aws_report.drop(aws_unused_columns, axis=1, inplace=True)
+
     # Make a proper datetime format
     aws_report['date'] = aws_report['identity_time_interval'].apply(lambda x: x.split('T')[0])
 
     # Group the data by date, product code, and region code
-    grouped_data = aws_report.groupby(['date', 'line_item_product_code', 'product_region_code']).first().reset_index() 
+    grouped_data = aws_report.groupby(aws_group_columns).first().reset_index() 
     grouped_data.drop('identity_time_interval', axis=1, inplace=True) 
+    return grouped_data
+
+def merge_aws_groups(grouped_data, partial_group):
+    if grouped_data is None:
+        return partial_group
+    combined = pd.concat([grouped_data, partial_group], ignore_index=True)
+    return combined.groupby(aws_group_columns).first().reset_index()
+
+'''
+The groups of the AWS rows cleaned so far. In chunked mode, when the groups take more memory
+than a chunk is given, they are spilled to disk in one file per month of their date, and the
+months are merged one at a time at the end, so the memory never holds the groups of every month.
+The spilled files of a month are read back in the order they were written, so the first row of
+every group is the same as without spilling.
+'''
+class AwsGroups:
+    def __init__(self):
+        self.grouped = None
+        self.empty = None
+        self.spill_dir = None
+        self.spilled = {}
+
+    def add(self, partial_group):
+        self.empty = partial_group.iloc[:0]
+        self.grouped = merge_aws_groups(self.grouped, partial_group)
+        if chunked_mode() and self.grouped.memory_usage(index=True, deep=True).sum() > chunk_budget_bytes():
+            self.spill()
+
+    def spill(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='aws-groups-')
+        for month, rows in self.grouped.groupby(self.grouped['date'].str[:7], sort=False):
+            files = self.spilled.setdefault(month, [])
+            file_path = os.path.join(self.spill_dir, f'{month}-{len(files)}.pkl')
+            rows.to_pickle(file_path)
+            files.append(file_path)
+        self.grouped = None
+
+    def months(self):
+        # The merged groups of every month, in date order
+        in_memory = {}
+        if self.grouped is not None:
+            in_memory = dict(tuple(self.grouped.groupby(self.grouped['date'].str[:7], sort=False)))
+            self.grouped = None
+        months = sorted(set(self.spilled) | set(in_memory))
+        if not months and self.empty is not None:
+            yield self.empty
+        for month in months:
+            frames = [pd.read_pickle(file_path) for file_path in self.spilled.get(month, [])]
+            if month in in_memory:
+                frames.append(in_memory.pop(month))
+            yield pd.concat(frames, ignore_index=True).groupby(aws_group_columns).first().reset_index()
+        self.close()
 
+    def frame(self):
+        # All the groups at once, for the runs whose new rows are merged into an existing report
+        months = list(self.months())
+        return pd.concat(months, ignore_index=True) if months else None
+
+    def close(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+            self.spilled = {}
+
+def aws_cost(grouped_data):
     # Calculate the cost after applying discounts and promotions
     cost = grouped_data['line_item_blended_cost'] - (grouped_data['discount_bundled_discount'] + grouped_data['discount_total_discount'])
     grouped_data['cost'] = cost
@@ -65,6 +157,12 @@ def data_processing():
     grouped_data.drop('line_item_blended_cost', axis=1, inplace=True)
     grouped_data.drop('discount_bundled_discount', axis=1, inplace=True)
     grouped_data.drop('discount_total_discount', axis=1, inplace=True)
+    grouped_data = grouped_data[grouped_data['cost'] != 0]
+    return grouped_data
+
+def clean_gcp_report(gcp_report):
+    # Drop columns that are not needed
+    gcp_report.drop(['Subtotal (€)', 'Unrounded subtotal (€)'], axis=1, inplace=True)  
 
     # Convert the columns to numeric values, forcing any non-numeric values to NaN for GCP
     gcp_report['Cost (€)'] = pd.to_numeric(gcp_report['Cost (€)'], errors='coerce')
@@ -80,14 +178,155 @@ def data_processing():
     gcp_report.drop('Cost (€)', axis=1, inplace=True)
     gcp_report.drop('Discounts (€)', axis=1, inplace=True)
     gcp_report.drop('Promotions and others (€)', axis=1, inplace=True)
-    grouped_data = grouped_data[grouped_data['cost'] != 0]
+    return gcp_report
+
+def load_state():
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(state):
+    with open(state_file, 'w') as f:
+        json.dump(state, f, indent=2)
+
+def aws_row_dates(aws_report):
+    return aws_report['identity_time_interval'].str.split('T').str[0]
+
+def read_aws_batches():
+    if chunked_mode():
+        return read_csv_chunks(aws_raw_file, dtype=aws_raw_dtypes)
+    return [read_csv(aws_raw_file, delimiter=',', low_memory=False, dtype=aws_raw_dtypes)]
+
+def read_gcp_report():
+    return read_csv(gcp_raw_file, delimiter=',', low_memory=False, dtype={'Date': str})
+
+def process_aws_full():
+    # Drop duplicated line items before the grouping, by the fingerprint of their identifying columns
+    aws_keys = np.empty(0, dtype=np.uint64)
+    # Only the merged groups and one batch are kept in memory, in chunked mode never the whole AWS report
+    groups = AwsGroups()
+    for batch in read_aws_batches():
+        batch, aws_keys = dedup_line_items(batch, aws_line_item_columns, aws_keys)
+        groups.add(clean_aws_report(batch))
+
+    # Save the cleaned data to a new CSV file sorted by date, one month at a time
+    header = True
+    last_date = None
+    for month_groups in groups.months():
+        df_aws = aws_cost(month_groups).sort_values(by='date', kind='mergesort')
+        df_aws.to_csv(aws_clean_file, index=False, header=header, mode='w' if header else 'a')
+        header = False
+        update_categories(df_aws, aws_category_columns)
+        if len(df_aws):
+            last_date = df_aws['date'].max()
+    save_keys(aws_keys_file, aws_keys)
+    return last_date
+
+def process_gcp_full():
+    gcp_report, gcp_keys = dedup_line_items(read_gcp_report(), gcp_line_item_columns, np.empty(0, dtype=np.uint64),
+                                            optional_columns=gcp_optional_line_item_columns)
+    gcp_report = clean_gcp_report(gcp_report)
+
+    df_gcp = gcp_report.sort_values(by='Date', kind='mergesort')
+    df_gcp.to_csv(gcp_clean_file, index=False)
+    update_categories(df_gcp, gcp_category_columns)
+    save_keys(gcp_keys_file, gcp_keys)
+    return df_gcp['Date'].max()
+
+'''
+AWS keeps rewriting the files of a billing period while it is open and can restate a closed one.
+A line item that is dated on or before the high-water mark but has never been seen means its
+billing period has been restated, so the whole period is cleaned again and replaces the old rows.
+'''
+def restated_aws_periods(aws_report, seen_keys, high_water_mark):
+    keys = row_fingerprints(aws_report, key_columns(aws_report, aws_line_item_columns))
+    old_rows = (aws_row_dates(aws_report) <= high_water_mark) & ~contains(seen_keys, keys)
+    return set(aws_report.loc[old_rows, 'bill_billing_period_start_date'].str[:7])
+
+def select_rows(df, mask):
+    return df.take(np.flatnonzero(mask.to_numpy()))
+
+'''
+Add the newly cleaned rows to a sorted clean report.
+Without replaced months, with every new row after the high-water mark and no column the report doesn't have,
+the rows are appended in the order of the report's header.
+Otherwise the rows of the replaced months are dropped and the report is sorted again.
+'''
+def merge_clean_report(file_path, new_rows, date_column, high_water_mark, replaced_months):
+    if len(new_rows) == 0 and not replaced_months:
+        return high_water_mark
+    new_rows = new_rows.sort_values(by=date_column, kind='mergesort')
+    header = list(read_csv(file_path, nrows=0).columns)
+    if not replaced_months and set(new_rows.columns) <= set(header) and (new_rows[date_column] > high_water_mark).all():
+        new_rows.reindex(columns=header).to_csv(file_path, index=False, header=False, mode='a')
+    else:
+        # round_trip keeps the rewritten costs identical to the ones already in the report
+        clean_report = read_csv(file_path, delimiter=',', low_memory=False, dtype={date_column: str}, float_precision='round_trip')
+        clean_report = select_rows(clean_report, ~clean_report[date_column].str[:7].isin(replaced_months))
+        clean_report = pd.concat([clean_report, new_rows], ignore_index=True)
+        clean_report.sort_values(by=date_column, kind='mergesort').to_csv(file_path, index=False)
+    if len(new_rows) == 0:
+        return high_water_mark
+    return max(high_water_mark, new_rows[date_column].max())
+
+def process_aws_incremental(high_water_mark):
+    seen_keys = load_keys(aws_keys_file)
+
+    batches = read_aws_batches()
+    if chunked_mode():
+        # A first pass over the identifying columns finds the restated periods before any chunk is cleaned
+        restated_periods = set()
+        period_columns = aws_line_item_columns + ['bill_billing_period_start_date']
+        for chunk in read_csv_chunks(aws_raw_file, usecols=period_columns, dtype=str):
+            restated_periods |= restated_aws_periods(chunk, seen_keys, high_water_mark)
+    else:
+        restated_periods = restated_aws_periods(batches[0], seen_keys, high_water_mark)
+
+    # Only the rows after the mark and the rows of the restated periods are cleaned
+    run_keys = np.empty(0, dtype=np.uint64)
+    groups = AwsGroups()
+    for batch in batches:
+        new_rows = (aws_row_dates(batch) > high_water_mark) | batch['bill_billing_period_start_date'].str[:7].isin(restated_periods)
+        batch, run_keys = dedup_line_items(select_rows(batch, new_rows), aws_line_item_columns, run_keys)
+        groups.add(clean_aws_report(batch))
+    # The new rows of a run are merged into the clean report together
+    grouped_data = aws_cost(groups.frame())
+
+    high_water_mark = merge_clean_report(aws_clean_file, grouped_data, 'date', high_water_mark, restated_periods)
+    update_categories(grouped_data, aws_category_columns)
+    save_keys(aws_keys_file, add_keys(seen_keys, run_keys))
+    return high_water_mark
+
+'''
+GCP rows are never restated, but an export can bring rows for days before the mark.
+Every line item that hasn't been seen is cleaned and merged into the clean report.
+'''
+def process_gcp_incremental(high_water_mark):
+    seen_keys = load_keys(gcp_keys_file)
+    gcp_report, gcp_keys = dedup_line_items(read_gcp_report(), gcp_line_item_columns, seen_keys,
+                                            optional_columns=gcp_optional_line_item_columns)
+    gcp_report = clean_gcp_report(gcp_report)
+
+    high_water_mark = merge_clean_report(gcp_clean_file, gcp_report, 'Date', high_water_mark, set())
+    update_categories(gcp_report, gcp_category_columns)
+    save_keys(gcp_keys_file, gcp_keys)
+    return high_water_mark
+
+def can_process_incrementally(state):
+    required_files = [aws_clean_file, gcp_clean_file, aws_keys_file, gcp_keys_file]
+    return 'aws' in state and 'gcp' in state and all(os.path.exists(f) for f in required_files)
 
-    # Drop duplicates
-    gcp_report.drop_duplicates(inplace=True) 
-    aws_report.drop_duplicates(inplace=True)
+def data_processing(incremental=None):
+    if incremental is None:
+        incremental = incremental_mode
+    state = load_state()
 
-    # Save the cleaned data to a new CSV file and sort the data by date
-    df_aws = grouped_data.sort_values(by='date')
-    df_gcp = gcp_report.sort_values(by='Date')
-    df_aws.to_csv('clean-cost-and-usage-report-aws.csv', index=False)
-    df_gcp.to_csv('clean-cost-and-usage-report-gcp.csv', index=False)
\ No newline at end of file
+    if incremental and can_process_incrementally(state):
+        state['aws'] = process_aws_incremental(state['aws'])
+        state['gcp'] = process_gcp_incremental(state['gcp'])
+    else:
+        state['aws'] = process_aws_full()
+        state['gcp'] = process_gcp_full()
+    save_state(state)
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pandas as pd
+
+'''
+Rows are identified by a 64-bit hash of their natural key instead of comparing whole rows.
+The seen keys are kept as a sorted uint64 array, which takes 8 bytes per row and can be
+saved next to the report it describes and memory-mapped when it is loaded again.
+'''
+gcp_key_columns = ['Date', 'Service description', 'SKU description', 'Project ID']
+aws_line_item_columns = ['identity_line_item_id', 'identity_time_interval']
+# GCP exports have no line item ID, a line item is its key together with its amounts, credits, cost type and labels
+gcp_line_item_columns = gcp_key_columns + ['Cost (€)', 'Discounts (€)', 'Promotions and others (€)']
+# Only hashed in the rows that have a value, so a row keeps its fingerprint when the combined header gets wider
+gcp_optional_line_item_columns = ['Credits (€)', 'Credit type', 'Cost type', 'Labels', 'Project labels', 'System labels',
+                                  'Resource labels']
+
+def key_columns(df, columns):
+    return [column for column in columns if column in df.columns]
+
+def row_fingerprints(df, columns, optional_columns=()):
+    keys = pd.util.hash_pandas_object(df[columns], index=False).to_numpy(dtype=np.uint64)
+    for column in key_columns(df, optional_columns):
+        present = df[column].notna().to_numpy()
+        if present.any():
+            values = pd.util.hash_pandas_object(df[column][present], index=False).to_numpy(dtype=np.uint64)
+            keys[present] = keys[present] * np.uint64(1000003) ^ values
+    return keys
+
+def contains(sorted_keys, keys):
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.searchsorted(sorted_keys, keys)
+    positions[positions == len(sorted_keys)] = 0
+    return sorted_keys[positions] == keys
+
+def add_keys(sorted_keys, keys):
+    return np.union1d(sorted_keys, keys)
+
+def load_keys(file_path):
+    try:
+        return np.load(file_path, mmap_mode='r')
+    except FileNotFoundError:
+        return np.empty(0, dtype=np.uint64)
+
+def save_keys(file_path, sorted_keys):
+    # The old file can still be memory-mapped, so the new one replaces it instead of overwriting it.
+    # np.save adds .npy to names without it, so the file is written through a handle
+    temp_file = file_path + '.tmp'
+    with open(temp_file, 'wb') as f:
+        np.save(f, np.asarray(sorted_keys, dtype=np.uint64))
+    os.replace(temp_file, file_path)
+
+'''
+Drop the rows that repeat a line item of the same batch and, with skip_seen, the rows
+whose fingerprint is already in seen_keys (rows of an earlier chunk or an earlier run).
+Returns the remaining rows and seen_keys with their fingerprints added.
+'''
+def dedup_line_items(df, columns, seen_keys, skip_seen=True, optional_columns=()):
+    keys = row_fingerprints(df, key_columns(df, columns), optional_columns)
+    _, first_rows = np.unique(keys, return_index=True)
+    keep = np.zeros(len(keys), dtype=bool)
+    keep[first_rows] = True
+    if skip_seen:
+        keep &= ~contains(seen_keys, keys)
+    if not keep.all():
+        # take returns a new frame, so the cleaning can keep modifying it in place
+        df = df.take(np.flatnonzero(keep))
+    return df, add_keys(seen_keys, keys[keep])
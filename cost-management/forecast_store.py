@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import pyarrow as pa
+
+'''
+The forecasts and outlier thresholds of every service, in one Arrow IPC file.
+Every service is one record batch and the schema metadata holds the format version and, per service,
+its batch, threshold and a hash of both. Readers memory-map the file and only read the batches they need.
+The file is rewritten to a temporary file that replaces it, so a reader never sees a partial file.
+'''
+forecasts_file = 'forecasts.arrow'
+format_version = 1
+forecast_schema = pa.schema([
+    ('date', pa.timestamp('ns')),
+    ('product_servicecode', pa.string()),
+    ('forecast', pa.float64()),
+])
+# The services run at the same time and all rewrite the file
+write_lock = threading.Lock()
+
+def read_index(reader):
+    metadata = reader.schema.metadata or {}
+    index = json.loads(metadata.get(b'forecasts', b'{}'))
+    if index and index.get('version') != format_version:
+        raise ValueError(f"{forecasts_file} has format version {index.get('version')}, expected {format_version}")
+    return index.get('services', {})
+
+def open_forecasts(file_path=forecasts_file):
+    reader = pa.ipc.open_file(pa.memory_map(file_path, 'r'))
+    return reader, read_index(reader)
+
+def load_thresholds(file_path=forecasts_file):
+    _, services = open_forecasts(file_path)
+    return {service: entry['threshold'] for service, entry in services.items()}
+
+'''
+Forecasts of the given services, all of them by default, as DataFrames by service.
+Services that are not in the file are left out.
+'''
+def load_forecasts(services=None, file_path=forecasts_file):
+    reader, index = open_forecasts(file_path)
+    services = index.keys() if services is None else services
+    return {service: reader.get_batch(index[service]['batch']).to_pandas() for service in services if service in index}
+
+def service_fingerprint(service, file_path=forecasts_file):
+    try:
+        _, index = open_forecasts(file_path)
+    except FileNotFoundError:
+        return None
+    entry = index.get(service)
+    return entry['sha1'] if entry else None
+
+def save_forecast(service, forecast_df, threshold, accuracy=None, file_path=forecasts_file):
+    batch = pa.RecordBatch.from_pandas(forecast_df[forecast_schema.names], schema=forecast_schema, preserve_index=False)
+    sha1 = hashlib.sha1(batch.serialize().to_pybytes())
+    sha1.update(repr(float(threshold)).encode())
+
+    with write_lock:
+        batches = {}
+        services = {}
+        if os.path.exists(file_path):
+            reader, services = open_forecasts(file_path)
+            batches = {name: reader.get_batch(entry['batch']) for name, entry in services.items()}
+        batches[service] = batch
+        services[service] = {'threshold': float(threshold), 'accuracy': None if accuracy is None else float(accuracy),
+                             'updated': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sha1': sha1.hexdigest()}
+
+        names = sorted(batches)
+        for number, name in enumerate(names):
+            services[name]['batch'] = number
+        metadata = {'forecasts': json.dumps({'version': format_version, 'services': services})}
+        temp_file = file_path + '.tmp'
+        with pa.OSFile(temp_file, 'wb') as sink:
+            with pa.ipc.new_file(sink, forecast_schema.with_metadata(metadata)) as writer:
+                for name in names:
+                    writer.write_batch(batches[name])
+        os.replace(temp_file, file_path)
+
+def forecast_output(service):
+    # Pipeline output for the part of the file that belongs to one service
+    return f'{forecasts_file}::{service}'
@@ -0,0 +1,203 @@
+import os
+import gzip
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+import update_csv_aws
+import update_csv_gcp
+from data_processing import aws_unused_columns
+
+'''
+Synthetic cost reports for benchmarks and for checking changes without the real reports.
+The AWS rows are written as gzip CUR files in the BILLING_PERIOD=<month>/<assembly> folders that
+update_csv_aws reads, the GCP rows as overlapping exports named like the ones update_csv_gcp merges.
+Rows are generated and written in chunks, so 50M rows don't have to fit in memory.
+'''
+aws_services = {
+    # product code: (product servicecode, mean daily cost of a line item)
+    'AmazonEC2': ('AmazonEC2', 2.0),
+    'AmazonS3': ('AmazonS3', 0.4),
+    'AmazonVPC': ('AmazonVPC', 0.6),
+    'AmazonCloudWatch': ('AmazonCloudWatch', 0.3),
+    'AmazonEKS': ('AmazonEKS', 1.5),
+    'AWSConfig': ('AWSConfig', 0.1),
+    'awskms': ('awskms', 0.05),
+    'AWSDataTransfer': ('AWSDataTransfer', 0.2),
+}
+aws_regions = {'eu-west-1': 'EU (Ireland)', 'eu-central-1': 'EU (Frankfurt)', 'us-east-1': 'US East (N. Virginia)'}
+gcp_services = {
+    'Compute Engine': ['N1 Predefined Instance Core', 'N1 Predefined Instance Ram', 'Storage PD Capacity'],
+    'Kubernetes Engine': ['Autopilot Pod mCPU Requests', 'Autopilot Pod Memory Requests', 'Cluster Management Fee'],
+    'Networking': ['Network Internet Egress', 'Network Inter Zone Egress', 'Static Ip Charge'],
+    'Cloud Storage': ['Standard Storage', 'Class A Operations'],
+}
+gcp_columns = ['Date', 'Service description', 'SKU description', 'Project ID', 'Cost (€)', 'Discounts (€)',
+               'Promotions and others (€)', 'Subtotal (€)', 'Unrounded subtotal (€)']
+default_chunk_rows = 500000
+# GCP exports have one row per day, SKU and project, a few projects give a few thousand rows
+default_gcp_rows = 5000
+
+def unused_column_values(column, rng):
+    # A few plausible values per column, so the parser sees text, numbers and dates like in a real report
+    if any(word in column for word in ['cost', 'fee', 'rate', 'quantity', 'units', 'value', 'ratio', 'usage', 'factor']):
+        return np.round(rng.random(4) * 10, 6).astype(str)
+    if column.endswith(('_date', '_time')):
+        return np.array(['2024-05-01T00:00:00Z', '2024-05-15T00:00:00Z', '', ''])
+    return np.array([f'{column[:12]}-{i}' for i in range(3)] + [''])
+
+def write_chunk(df, f, header):
+    # The Arrow writer is several times faster than to_csv on the wide CUR rows
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), f, pa_csv.WriteOptions(include_header=header))
+
+def billing_periods(months, start):
+    return pd.period_range(start, periods=months, freq='M')
+
+def assembly_folder(period, rng):
+    uuid = rng.bytes(16).hex()
+    assembly_id = f'{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}'
+    return f'{period.start_time:%Y-%m-%d}T00_00_00.000Z-{assembly_id}'
+
+def cost_curve(days, mean, rng):
+    # Slow trend, weekly seasonality and noise, never negative
+    trend = np.linspace(1.0, 1.3, len(days))
+    weekly = 1 + 0.2 * np.sin(2 * np.pi * days.dayofweek / 7)
+    return mean * trend * weekly * rng.lognormal(0, 0.1, len(days))
+
+def aws_chunk(rows, first_id, days, day_costs, period, rng, unused_values, duplicate_share):
+    service_names = np.array(list(aws_services))
+    service_codes = np.array([code for code, _ in aws_services.values()])
+    region_codes = np.array(list(aws_regions) + [''])
+    locations = np.array(list(aws_regions.values()) + [''])
+    services = rng.integers(0, len(service_names), rows)
+    regions = rng.integers(0, len(region_codes), rows)
+    day_index = rng.integers(0, len(days), rows)
+    intervals = np.array([f'{d:%Y-%m-%d}T00:00:00Z/{d + pd.Timedelta(days=1):%Y-%m-%d}T00:00:00Z' for d in days])
+
+    line_item_ids = np.arange(first_id, first_id + rows)
+    # CUR files repeat some line items, the processing has to drop them
+    repeated = rng.random(rows) < duplicate_share
+    line_item_ids[repeated] = np.maximum(line_item_ids[repeated] - 1, first_id)
+
+    df = pd.DataFrame({column: values[rng.integers(0, len(values), rows)] for column, values in unused_values.items()})
+    df['identity_line_item_id'] = np.char.add('li-', line_item_ids.astype(str))
+    df['identity_time_interval'] = intervals[day_index]
+    df['bill_billing_period_start_date'] = f'{period.start_time:%Y-%m-%d}T00:00:00.000Z'
+    df['line_item_product_code'] = service_names[services]
+    df['product_servicecode'] = service_codes[services]
+    df['product_region_code'] = region_codes[regions]
+    df['product_location'] = locations[regions]
+    df['product_to_location'] = None
+    df['product_to_region_code'] = None
+    df['line_item_usage_account_id'] = rng.choice([123456789012, 210987654321], rows)
+    df['line_item_blended_cost'] = np.round(day_costs[services, day_index] * rng.lognormal(0, 0.5, rows), 10)
+    df['discount_bundled_discount'] = np.where(rng.random(rows) < 0.5, np.nan, 0.0)
+    df['discount_total_discount'] = np.round(np.where(rng.random(rows) < 0.1, df['line_item_blended_cost'] * 0.05, 0.0), 10)
+    return df
+
+def write_aws_reports(total_rows, months, start, output_dir, rng, chunk_rows=default_chunk_rows, duplicate_share=0.01):
+    unused_values = {column: unused_column_values(column, rng) for column in aws_unused_columns
+                     if column not in ('identity_line_item_id', 'bill_billing_period_start_date')}
+    periods = billing_periods(months, start)
+    rows_per_period = np.full(len(periods), total_rows // len(periods))
+    rows_per_period[:total_rows % len(periods)] += 1
+
+    report_files = []
+    first_id = 0
+    for period, period_rows in zip(periods, rows_per_period):
+        days = pd.date_range(period.start_time, period.end_time.normalize())
+        day_costs = np.array([cost_curve(days, mean, rng) for _, mean in aws_services.values()])
+        folder = os.path.join(output_dir, update_csv_aws.directory, f'{update_csv_aws.directory_prefix}{period.start_time:%Y-%m}',
+                              assembly_folder(period, rng))
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.join(folder, f'{update_csv_aws.prefix}.csv.gz')
+
+        with gzip.open(file_path, 'wb', compresslevel=1) as f:
+            written = 0
+            while written < period_rows:
+                rows = min(chunk_rows, period_rows - written)
+                chunk = aws_chunk(rows, first_id, days, day_costs, period, rng, unused_values, duplicate_share)
+                write_chunk(chunk, f, header=written == 0)
+                written += rows
+                first_id += rows
+        report_files.append(file_path)
+    return report_files
+
+def gcp_chunk(day_index, days, sku_services, sku_names, sku_costs, projects):
+    # One row per day, SKU and project, like the daily cost table export
+    rows_per_day = len(sku_names) * len(projects)
+    sku_index = np.tile(np.repeat(np.arange(len(sku_names)), len(projects)), len(day_index))
+    project_index = np.tile(np.arange(len(projects)), len(day_index) * len(sku_names))
+    day_index = np.repeat(day_index, rows_per_day)
+    # The variation only depends on the key, so a day repeated by two exports has the same costs
+    variation = 1 + 0.3 * np.sin(day_index * 7.3 + sku_index * 1.7 + project_index * 0.37)
+    cost = sku_costs[sku_index, day_index] * variation
+    discounts = np.where((day_index + sku_index) % 5 == 0, cost * 0.1, 0.0)
+    promotions = np.where((day_index + project_index) % 20 == 0, cost * 0.05, 0.0)
+    subtotal = cost - discounts - promotions
+    return pd.DataFrame({
+        'Date': days[day_index].strftime('%Y-%m-%d'),
+        'Service description': sku_services[sku_index],
+        'SKU description': sku_names[sku_index],
+        'Project ID': projects[project_index],
+        'Cost (€)': np.round(cost, 6),
+        'Discounts (€)': np.round(discounts, 6),
+        'Promotions and others (€)': np.round(promotions, 6),
+        'Subtotal (€)': np.round(subtotal, 2),
+        'Unrounded subtotal (€)': np.round(subtotal, 6),
+    }, columns=gcp_columns)
+
+'''
+Every export covers the days since the previous one and overlaps it by overlap_days,
+the way the scheduled GCP exports repeat the last days of the previous file.
+The number of projects is chosen so the exports add up to about total_rows rows.
+'''
+def write_gcp_reports(total_rows, files, months, start, output_dir, rng, chunk_rows=default_chunk_rows, overlap_days=3):
+    days = pd.date_range(pd.Period(start, freq='M').start_time, billing_periods(months, start)[-1].end_time.normalize())
+    windows = np.array_split(np.arange(len(days)), files)
+    windows = [np.arange(max(0, window[0] - overlap_days) if number else 0, window[-1] + 1)
+               for number, window in enumerate(windows)]
+    sku_services = np.array([service for service, service_skus in gcp_services.items() for _ in service_skus])
+    sku_names = np.array([sku for service_skus in gcp_services.values() for sku in service_skus])
+    sku_costs = np.array([cost_curve(days, rng.uniform(1, 20), rng) for _ in sku_names])
+    project_count = max(1, round(total_rows / (sum(len(window) for window in windows) * len(sku_names))))
+    projects = np.array([f'cost-monitoring-{number:04d}' for number in range(project_count)])
+    days_per_chunk = max(1, chunk_rows // (len(sku_names) * project_count))
+
+    report_files = []
+    for number, window in enumerate(windows, start=1):
+        file_path = os.path.join(output_dir, f'{update_csv_gcp.prefix} ({number}).csv')
+        with open(file_path, 'wb') as f:
+            for first in range(0, len(window), days_per_chunk):
+                chunk = gcp_chunk(window[first:first + days_per_chunk], days, sku_services, sku_names, sku_costs, projects)
+                write_chunk(chunk, f, header=first == 0)
+        report_files.append(file_path)
+    return report_files
+
+def generate(aws_rows, gcp_rows=default_gcp_rows, output_dir='.', months=3, start='2024-03', gcp_files=4, seed=42,
+             chunk_rows=default_chunk_rows):
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    aws_files = write_aws_reports(aws_rows, months, start, output_dir, rng, chunk_rows)
+    gcp_files = write_gcp_reports(gcp_rows, gcp_files, months, start, output_dir, rng, chunk_rows)
+    return aws_files, gcp_files
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Write synthetic AWS CUR and GCP cost reports.')
+    parser.add_argument('--aws-rows', type=int, default=10000, help='number of AWS line items, 10000 to 50000000')
+    parser.add_argument('--gcp-rows', type=int, default=default_gcp_rows, help='approximate number of GCP rows')
+    parser.add_argument('--months', type=int, default=3, help='number of billing periods')
+    parser.add_argument('--start', default='2024-03', help='first billing period')
+    parser.add_argument('--gcp-files', type=int, default=4, help='number of GCP exports')
+    parser.add_argument('--output-dir', default='.', help='directory the pipeline will run in')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-rows', type=int, default=default_chunk_rows, help='rows generated at a time')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    options = parse_args()
+    aws_files, gcp_files = generate(options.aws_rows, options.gcp_rows, options.output_dir, options.months, options.start,
+                                    options.gcp_files, options.seed, options.chunk_rows)
+    for file_path in aws_files + gcp_files:
+        print(file_path)
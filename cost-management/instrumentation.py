@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import cProfile
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+'''
+Timing and memory measurements of the pipeline stages and of the models they run.
+Every instrumented section records its wall time, the CPU time of its thread (and of the
+processes it started), and the peak RSS of the whole process while it ran, sampled in the background.
+The RSS is shared by the stages and models that run at the same time, so their process_peak_rss_mb
+is the same peak, it is only the memory of one section when it ran alone, like in the benchmark.
+Sections opened inside another one, like ARIMA_model inside amazon_ec2, are named after their parent.
+COST_TRACE_MEMORY=1 adds the top tracemalloc allocators of every section and COST_PROFILE=1
+writes a cProfile dump of every section to the profiles directory. Both slow the pipeline down.
+'''
+report_dir = os.getenv('COST_REPORT_DIR', 'instrumentation')
+profile_dir = os.path.join(report_dir, 'profiles')
+trace_memory = os.getenv('COST_TRACE_MEMORY', '0') == '1'
+profile_sections = os.getenv('COST_PROFILE', '0') == '1'
+top_allocators = 10
+rss_sample_seconds = 0.05
+
+records = []
+records_lock = threading.Lock()
+# Sections that are running, the peak RSS of the process while they run is updated by the sampler
+active_sections = set()
+sampler_started = False
+local = threading.local()
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        # Without /proc only the peak of the whole run is known, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def children_cpu_seconds():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+def sample_rss():
+    while True:
+        rss = current_rss_mb()
+        with records_lock:
+            for record in active_sections:
+                record.update_peak(rss)
+        time.sleep(rss_sample_seconds)
+
+def start_sampler():
+    global sampler_started
+    with records_lock:
+        if sampler_started:
+            return
+        sampler_started = True
+    threading.Thread(target=sample_rss, name='rss-sampler', daemon=True).start()
+
+class Section:
+    def __init__(self, name):
+        self.name = name
+        self.process_peak_rss_mb = 0
+        # Set when the section ends
+        self.record = None
+
+    def update_peak(self, rss):
+        self.process_peak_rss_mb = max(self.process_peak_rss_mb, rss)
+
+def section_stack():
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+def allocation_diff(before):
+    after = tracemalloc.take_snapshot()
+    return [{'location': str(stat.traceback), 'size_mb': stat.size_diff / 1024 / 1024, 'count': stat.count_diff}
+            for stat in after.compare_to(before, 'lineno')[:top_allocators]]
+
+@contextmanager
+def instrument(name):
+    stack = section_stack()
+    full_name = '/'.join(stack + [name])
+    section = Section(full_name)
+    start_sampler()
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot() if trace_memory else None
+    # Nested sections are part of the profile of their parent
+    profiler = cProfile.Profile() if profile_sections and not stack else None
+
+    rss_start = current_rss_mb()
+    section.update_peak(rss_start)
+    with records_lock:
+        active_sections.add(section)
+    stack.append(name)
+    status = 'ok'
+    started = time.time()
+    start_wall, start_cpu, start_children = time.perf_counter(), time.thread_time(), children_cpu_seconds()
+    if profiler:
+        try:
+            profiler.enable()
+        except ValueError:
+            # Newer Pythons allow a single profiler at a time, a section running at the same time has it
+            profiler = None
+    try:
+        yield section
+    except BaseException:
+        status = 'failed'
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        wall_seconds = time.perf_counter() - start_wall
+        cpu_seconds = time.thread_time() - start_cpu
+        # Processes started by any running section are counted, only exact when one section starts them
+        child_seconds = children_cpu_seconds() - start_children
+        stack.pop()
+        rss_end = current_rss_mb()
+        with records_lock:
+            active_sections.discard(section)
+        section.update_peak(rss_end)
+
+        record = {'name': full_name, 'status': status, 'thread': threading.current_thread().name,
+                  'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+                  'wall_seconds': wall_seconds, 'cpu_seconds': cpu_seconds, 'children_cpu_seconds': child_seconds,
+                  'rss_start_mb': rss_start, 'rss_end_mb': rss_end, 'process_peak_rss_mb': section.process_peak_rss_mb}
+        if snapshot is not None:
+            record['top_allocators'] = allocation_diff(snapshot)
+        if profiler:
+            os.makedirs(profile_dir, exist_ok=True)
+            record['profile'] = os.path.join(profile_dir, full_name.replace('/', '.') + '.prof')
+            profiler.dump_stats(record['profile'])
+        section.record = record
+        with records_lock:
+            records.append(record)
+
+def instrumented(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with instrument(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def reset():
+    with records_lock:
+        records.clear()
+
+'''
+Write the sections recorded since the last report to <report_dir>/run-<time>.json and start a new report.
+'''
+def write_report(run_started=None):
+    with records_lock:
+        run_records = list(records)
+        records.clear()
+    run_started = run_started or time.time()
+    report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(run_started)),
+              'trace_memory': trace_memory, 'profile': profile_sections, 'sections': run_records}
+    os.makedirs(report_dir, exist_ok=True)
+    file_path = os.path.join(report_dir, time.strftime('run-%Y%m%d-%H%M%S.json', time.localtime(run_started)))
+    with open(file_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return file_path
@@ -1,3 +1,11 @@
+import time
+import argparse
+import update_csv_aws
+import update_csv_gcp
+import data_processing as processing
+import categories
+import cost_matrix
+import cost_cube
 from amazon_cloud_watch import amazon_cloud_watch
 from amazon_eks import amazon_eks
 from amazon_vpc import amazon_vpc
@@ -8,26 +16,115 @@ from awskms import awskms
 from compute_engine import compute_engine
 from kubernetes_engine import kubernetes_engine
 from networking import networking
-from update_csv_gcp import update_csv_gcp
-from update_csv_aws import update_csv_aws
-from data_processing import data_processing
+from csv_reader import write_parse_times
+from instrumentation import write_report
+from pipeline import stage, select_stages, run_pipeline, register_part_fingerprint
+from forecast_store import forecasts_file, forecast_output, service_fingerprint
+from watcher import watch
 import warnings
 warnings.filterwarnings("ignore")
 
-def main(): 
-    update_csv_gcp()
-    update_csv_aws()
-    data_processing()
-    amazon_cloud_watch()
-    amazon_eks()
-    amazon_vpc()
-    amazon_s3()
-    amazon_ec2()
-    aws_config()
-    awskms()
-    compute_engine()
-    kubernetes_engine()
-    networking()
+aws_services = [
+    (amazon_cloud_watch, 'amazoncloudwatch'),
+    (amazon_eks, 'amazonEKS'),
+    (amazon_vpc, 'amazonVPC'),
+    (amazon_s3, 'amazonS3'),
+    (amazon_ec2, 'amazonEC2'),
+    (aws_config, 'awsConfig'),
+    (awskms, 'awskms'),
+]
+gcp_services = [
+    (compute_engine, 'compute_engine'),
+    (kubernetes_engine, 'kubernetes_engine'),
+    (networking, 'networking'),
+]
+
+'''
+The stages of the pipeline with the files they read and write.
+The two ingests don't depend on each other and run at the same time,
+the services run once the reports have been cleaned.
+'''
+def pipeline_stages():
+    # Every service stage writes its own part of the forecasts file
+    register_part_fingerprint(forecasts_file, service_fingerprint)
+    stages = [
+        stage('update_csv_gcp', update_csv_gcp.update_csv_gcp,
+              inputs=update_csv_gcp.find_report_files,
+              outputs=[update_csv_gcp.output_file, update_csv_gcp.key_index_file, update_csv_gcp.ingested_file],
+              provider='gcp'),
+        stage('update_csv_aws', update_csv_aws.update_csv_aws,
+              inputs=update_csv_aws.find_report_files,
+              outputs=[update_csv_aws.output_file],
+              provider='aws'),
+        stage('data_processing', processing.data_processing,
+              inputs=[processing.aws_raw_file, processing.gcp_raw_file],
+              outputs=[processing.aws_clean_file, processing.gcp_clean_file, processing.aws_keys_file,
+                       processing.gcp_keys_file, processing.state_file, categories.categories_file],
+              after=['update_csv_gcp', 'update_csv_aws']),
+        stage('cost_matrix', cost_matrix.build_cost_matrix,
+              inputs=[processing.aws_clean_file, processing.gcp_clean_file],
+              outputs=[cost_matrix.matrix_file, cost_matrix.index_file],
+              after=['data_processing']),
+        stage('cost_cube', cost_cube.update_cost_cube,
+              inputs=[processing.aws_clean_file, processing.gcp_clean_file],
+              outputs=list(cost_cube.cube_files.values()) + [cost_cube.cube_state_file],
+              after=['data_processing']),
+    ]
+    for services, clean_file, provider in [(aws_services, processing.aws_clean_file, 'aws'),
+                                           (gcp_services, processing.gcp_clean_file, 'gcp')]:
+        for func, servicecode_name in services:
+            stages.append(stage(func.__name__, func,
+                                inputs=[clean_file],
+                                outputs=[forecast_output(servicecode_name)],
+                                after=['data_processing'],
+                                provider=provider))
+    return stages
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='Update the cost reports, forecasts and thresholds.')
+    parser.add_argument('--stages', help='comma-separated stages to run, for example data_processing,amazon_ec2')
+    parser.add_argument('--services', help='comma-separated providers to run the stages of: aws, gcp')
+    parser.add_argument('--force', action='store_true', help='run the stages even if their inputs have not changed')
+    parser.add_argument('--workers', type=int, default=None, help='number of stages that can run at the same time')
+    parser.add_argument('--list', action='store_true', help='list the stages and exit')
+    parser.add_argument('--watch', action='store_true', help='keep running and process new reports as soon as they arrive')
+    return parser
+
+def split_option(value):
+    return [item.strip() for item in value.split(',')] if value else None
+
+def main(args=None):
+    parser = argument_parser()
+    options = parser.parse_args(args)
+    stages = pipeline_stages()
+    if options.list:
+        for s in stages:
+            print(f"{s['name']} ({s['provider'] or 'all'})")
+        return 0
+
+    try:
+        stages = select_stages(stages, split_option(options.stages), split_option(options.services))
+    except ValueError as e:
+        parser.error(str(e))
+
+    def run():
+        run_started = time.time()
+        status = run_pipeline(stages, force=options.force, workers=options.workers)
+        write_parse_times()
+        write_report(run_started)
+        for name, result in status.items():
+            print(f'{name}: {result}')
+        return status
+
+    if options.watch:
+        # Every drop only adds a few days, the clean reports are updated instead of rebuilt
+        processing.incremental_mode = True
+        options.force = False
+        watch(run)
+        return 0
+
+    status = run()
+    return 1 if any(result in ('failed', 'blocked') for result in status.values()) else 0
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    raise SystemExit(main())
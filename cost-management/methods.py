@@ -3,8 +3,10 @@ from sklearn.ensemble import IsolationForest
 import pandas as pd
 from statsmodels.tsa.stattools import adfuller, pacf, acf
 from statsmodels.tsa.arima.model import ARIMA
+from instrumentation import instrumented
 
 ####### ANOMALY DETECTION USING ISOLATION FOREST #######
+@instrumented
 def anomaly_detection(dataset, column, initial_outlier, target_accuracy, max_iterations):
     # Initialize
     random_state = np.random.RandomState(42)
@@ -36,6 +38,7 @@ def anomaly_detection(dataset, column, initial_outlier, target_accuracy, max_ite
     return outlier, accuracy
 
 ###### CREATE A BIG METHOD THAT INCLUDES ALL OF THE STEPS NECESSARY FOR AN ARIMA MODEL TO USE ON ALL SCRIPTS ######
+@instrumented
 def ARIMA_model(dataset, column, date, servicecode, time_series, servicecode_name):
     # Check for stationarity
     result = adfuller(dataset[column])
@@ -90,4 +93,4 @@ def ARIMA_model(dataset, column, date, servicecode, time_series, servicecode_nam
         'product_servicecode': servicecode,
         'forecast': forecast
     })
-    forecast_df.to_csv(f'forecasted_{servicecode_name}_costs.csv', index=False)
+    return forecast_df
@@ -0,0 +1,50 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from csv_reader import timed_read_csv, record_parse_time
+
+'''
+Decompress and parse the gzip cost reports on a pool of processes.
+Every worker returns the parsed DataFrame, so the typed columns are sent back to the
+main process as they are and can be concatenated without going through CSV again.
+'''
+ingest_workers = int(os.getenv('COST_INGEST_WORKERS', str(os.cpu_count() or 1)))
+# Parsed files that may be waiting for the consumer before no new file is started
+max_pending_files = int(os.getenv('COST_INGEST_MAX_PENDING', str(ingest_workers * 2)))
+
+def read_gzip_csv(file_path):
+    return timed_read_csv(file_path, compression='gzip')
+
+'''
+Yield the parsed files in the same order as file_paths.
+The parse time measured by the workers is recorded in the main process.
+At most max_pending files are submitted ahead of the one the consumer is waiting for,
+so a slow consumer stops the workers instead of filling the memory with parsed files.
+'''
+def read_files_parallel(file_paths, workers=None, max_pending=None, reader=read_gzip_csv):
+    workers = workers or ingest_workers
+    max_pending = max(max_pending or max_pending_files, workers)
+
+    def collect(file_path, result):
+        df, engine, seconds = result
+        record_parse_time(file_path, engine, seconds, len(df))
+        return df
+
+    if workers == 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield collect(file_path, reader(file_path))
+        return
+
+    # Spawned workers don't inherit the locks of other threads of the pipeline
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            if len(pending) >= max_pending:
+                done_path, future = pending.popleft()
+                yield collect(done_path, future.result())
+            pending.append((file_path, executor.submit(reader, file_path)))
+        while pending:
+            done_path, future = pending.popleft()
+            yield collect(done_path, future.result())
@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from instrumentation import instrument
+
+'''
+Small runner for the stages of main.py.
+Every stage declares the files it reads and writes. The content hashes of those files are kept in
+pipeline-state.json, and a stage is skipped when its inputs and outputs are the same as after its last run.
+Stages whose dependencies are done run at the same time on a thread pool.
+'''
+state_file = 'pipeline-state.json'
+hash_block_size = 1024 * 1024
+# Stages running at the same time share the state, it is only changed or saved while holding this lock
+state_lock = threading.Lock()
+# Outputs given as <file>::<part> are parts of a file shared by several stages,
+# they are fingerprinted by the function registered for that file
+part_fingerprints = {}
+
+def stage(name, func, inputs, outputs, after=(), provider=None):
+    # inputs can be a function when the files are only known when the stage is about to run
+    return {'name': name, 'func': func, 'inputs': inputs, 'outputs': outputs, 'after': list(after), 'provider': provider}
+
+def register_part_fingerprint(file_path, fingerprint):
+    part_fingerprints[file_path] = fingerprint
+
+def load_state():
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'stages': {}, 'files': {}}
+
+def save_state(state):
+    with state_lock:
+        content = json.dumps(state, indent=2, sort_keys=True)
+        temp_file = state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            f.write(content)
+        os.replace(temp_file, state_file)
+
+'''
+Hash the content of a file. The hash is reused while the size and modification time
+of the file don't change, so the large report files are only read again when they change.
+'''
+def file_fingerprint(file_path, file_cache):
+    if '::' in file_path:
+        shared_file, part = file_path.split('::', 1)
+        return part_fingerprints[shared_file](part)
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    with state_lock:
+        cached = file_cache.get(file_path)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha1']
+
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(hash_block_size), b''):
+            sha1.update(block)
+    with state_lock:
+        file_cache[file_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1.hexdigest()}
+    return sha1.hexdigest()
+
+def stage_files(files):
+    return sorted(files() if callable(files) else files)
+
+def fingerprint_files(files, file_cache):
+    return {file_path: file_fingerprint(file_path, file_cache) for file_path in stage_files(files)}
+
+def is_up_to_date(stage, stage_state, input_fingerprints, file_cache):
+    # An output that is missing is only up to date when the last run didn't write it either,
+    # like the combined GCP report when there are no exports
+    if stage_state is None or stage_state['inputs'] != input_fingerprints:
+        return False
+    return stage_state['outputs'] == fingerprint_files(stage['outputs'], file_cache)
+
+'''
+Raise a ValueError when a stage depends on a stage that doesn't exist or the dependencies form a cycle,
+the stages in the cycle would wait for each other forever.
+'''
+def check_dependencies(stages):
+    names = {stage['name'] for stage in stages}
+    for stage in stages:
+        unknown = [name for name in stage['after'] if name not in names]
+        if unknown:
+            raise ValueError(f"Stage {stage['name']} depends on unknown stages: {', '.join(unknown)}")
+
+    waiting = {stage['name']: set(stage['after']) for stage in stages}
+    while waiting:
+        ready = [name for name, dependencies in waiting.items() if not dependencies & waiting.keys()]
+        if not ready:
+            raise ValueError(f"Stages with cyclic dependencies: {', '.join(sorted(waiting))}")
+        for name in ready:
+            del waiting[name]
+
+def select_stages(stages, stage_names=None, providers=None):
+    # A misspelt stage or provider raises a ValueError instead of selecting nothing
+    check_dependencies(stages)
+    unknown = sorted(set(stage_names or []) - {stage['name'] for stage in stages})
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(unknown)}")
+    unknown = sorted(set(providers or []) - {stage['provider'] for stage in stages if stage['provider']})
+    if unknown:
+        raise ValueError(f"Unknown providers: {', '.join(unknown)}")
+    selected = []
+    for stage in stages:
+        if stage_names and stage['name'] not in stage_names:
+            continue
+        # Stages without a provider, like data_processing, are shared by all of them
+        if providers and stage['provider'] and stage['provider'] not in providers:
+            continue
+        selected.append(stage)
+    return selected
+
+'''
+Run the selected stages and return the status of every stage: ran, skipped, failed or blocked.
+Dependencies that are not selected are considered done. A stage that depends on a failed
+stage is blocked and doesn't run.
+'''
+def run_pipeline(stages, force=False, workers=None):
+    selected_names = {stage['name'] for stage in stages}
+    check_dependencies([{**stage, 'after': [name for name in stage['after'] if name in selected_names]} for stage in stages])
+    state = load_state()
+    status = {}
+
+    def run_stage(stage):
+        input_fingerprints = fingerprint_files(stage['inputs'], state['files'])
+        if not force and is_up_to_date(stage, state['stages'].get(stage['name']), input_fingerprints, state['files']):
+            return 'skipped'
+
+        print(f"Running {stage['name']}")
+        with instrument(stage['name']):
+            stage['func']()
+
+        output_fingerprints = fingerprint_files(stage['outputs'], state['files'])
+        with state_lock:
+            state['stages'][stage['name']] = {'inputs': input_fingerprints, 'outputs': output_fingerprints}
+        save_state(state)
+        return 'ran'
+
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for stage in list(pending):
+                dependencies = [name for name in stage['after'] if name in selected_names]
+                if any(status.get(name) in ('failed', 'blocked') for name in dependencies):
+                    status[stage['name']] = 'blocked'
+                    pending.remove(stage)
+                elif all(status.get(name) in ('ran', 'skipped') for name in dependencies):
+                    running[executor.submit(run_stage, stage)] = stage
+                    pending.remove(stage)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    status[stage['name']] = future.result()
+                except Exception as e:
+                    print(f"Stage {stage['name']} failed: {e!r}")
+                    status[stage['name']] = 'failed'
+    return status
@@ -1,36 +1,66 @@
 import os
 import re
-import gzip 
 import pandas as pd
-import os
+from chunking import chunked_mode, read_csv_chunks, read_columns
+from parallel_reader import read_files_parallel
 
-directory = 'budget/daily_costs/data/' 
-directory_prefix = 'BILLING_PERIOD='   
+directory = 'budget/daily_costs/data/'
+directory_prefix = 'BILLING_PERIOD='
 folder_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}\.\d{3}Z-[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}$')
-prefix = 'daily_costs-00001' 
+prefix = 'daily_costs-00001'
+output_file = 'cost-and-usage-report-aws.csv'
 
-def update_csv_aws():
-    def find_matching_files(directory, directory_prefix, pattern): 
-        matching_directories = []
-        for item in os.listdir(directory):
-            item_path = os.path.join(directory, item)
-            if os.path.isdir(item_path) and item.startswith(directory_prefix):
-                for sub_item in os.listdir(item_path):
-                    sub_item_path = os.path.join(item_path, sub_item)
-                    if os.path.isdir(sub_item_path) and pattern.match(sub_item):
-                        matching_directories.append(sub_item_path)
-        return matching_directories
-
-    matching_directories = find_matching_files(directory, directory_prefix, folder_pattern)
-        
-    data_frames = []
-    for dir_path in matching_directories:
+def find_matching_files(directory, directory_prefix, pattern):
+    matching_directories = []
+    for item in os.listdir(directory):
+        item_path = os.path.join(directory, item)
+        if os.path.isdir(item_path) and item.startswith(directory_prefix):
+            for sub_item in os.listdir(item_path):
+                sub_item_path = os.path.join(item_path, sub_item)
+                if os.path.isdir(sub_item_path) and pattern.match(sub_item):
+                    matching_directories.append(sub_item_path)
+    return matching_directories
+
+def find_report_files():
+    report_files = []
+    for dir_path in find_matching_files(directory, directory_prefix, folder_pattern):
         for file in os.listdir(dir_path):
             if file.startswith(prefix) and file.endswith('.gz'):
-                file_path = os.path.join(dir_path, file)
-                with gzip.open(file_path, 'rt') as f:
-                    df = pd.read_csv(f)
-                data_frames.append(df)
+                report_files.append(os.path.join(dir_path, file))
+    return report_files
+
+def report_columns(report_files):
+    # The files of different billing periods don't always have the same columns, the header is the union of all of them
+    columns = []
+    for file_path in report_files:
+        for column in read_columns(file_path, compression='gzip'):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+def append_frames(frames, columns):
+    # Every frame is aligned to the header and appended as soon as it is parsed, so only the pending ones are in memory
+    header = True
+    for df in frames:
+        df.reindex(columns=columns).to_csv(output_file, index=False, header=header, mode='w' if header else 'a')
+        header = False
+    if header:
+        pd.DataFrame(columns=columns).to_csv(output_file, index=False)
+
+'''
+Stream every report into the combined CSV one chunk at a time.
+'''
+def update_csv_aws_chunked(report_files):
+    # The rows are copied as text, so no value is rewritten by the parser
+    chunks = (chunk for file_path in report_files for chunk in read_csv_chunks(file_path, compression='gzip', dtype=str))
+    append_frames(chunks, report_columns(report_files))
+
+def update_csv_aws():
+    report_files = find_report_files()
+
+    if chunked_mode():
+        update_csv_aws_chunked(report_files)
+        return
 
-    combined_df = pd.concat(data_frames, ignore_index=True)
-    combined_df.to_csv('cost-and-usage-report-aws.csv', index=False)
\ No newline at end of file
+    # The parsed files are written in order while the workers parse the next ones, at most max_pending of them wait
+    append_frames(read_files_parallel(report_files), report_columns(report_files))
@@ -1,15 +1,110 @@
-import pandas as pd
+import numpy as np
 import os
+import json
+import shutil
+import pandas as pd
+from csv_reader import read_csv
+from dedup import gcp_key_columns, contains, add_keys, load_keys, save_keys, row_fingerprints
 
+'''
+Append every exported report to the combined CSV once.
+The exports overlap, so a row whose (date, service, SKU, project) key was already
+written by an earlier report is skipped. Rows that repeat a key within the same
+report are kept, they are separate line items of that export.
+The keys of the written rows and the exports they came from are saved next to the combined CSV,
+so a later run only reads the new exports. When an ingested export changed or a new one brings
+columns the combined CSV doesn't have, the combined CSV is built again from all the exports.
+The rows are streamed to a temporary file that replaces the combined report at the end.
+'''
 prefix = 'Flowfactor - GC innovate NV_Reports'
+output_file = 'cost-and-usage-report-gcp.csv'
+key_index_file = 'cost-and-usage-report-gcp.keys.npy'
+# Size and modification time of every export that is in the combined CSV
+ingested_file = 'cost-and-usage-report-gcp.files.json'
+
+def find_report_files():
+    return sorted(f for f in os.listdir('.') if f.startswith(prefix) and f.endswith('.csv'))
+
+def file_version(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_ingested():
+    try:
+        with open(ingested_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_ingested(ingested):
+    temp_file = ingested_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(ingested, f, indent=2)
+    os.replace(temp_file, ingested_file)
+
+def report_header(file_path):
+    return list(read_csv(file_path, nrows=0).columns)
+
+def union_columns(headers):
+    columns = []
+    for header in headers:
+        columns += [column for column in header if column not in columns]
+    return columns
+
+'''
+Which rows of the files to write: the first report a key appears in keeps all its rows with that key,
+unless the key is in seen_keys. Only the key columns are read and the keys of all the files are sorted together once.
+Returns the rows to keep of every file and the new keys.
+'''
+def new_rows_by_file(files, headers, columns, seen_keys):
+    # The key columns of the combined header, the ones missing from a report are empty
+    key_columns = [column for column in gcp_key_columns if column in columns]
+    file_keys = []
+    for file in files:
+        df = read_csv(file, usecols=[column for column in key_columns if column in headers[file]])
+        file_keys.append(row_fingerprints(df.reindex(columns=key_columns), key_columns))
+    if not file_keys:
+        return [], np.empty(0, dtype=np.uint64)
+    all_keys = np.concatenate(file_keys)
+    file_ids = np.repeat(np.arange(len(files)), [len(keys) for keys in file_keys])
+    unique_keys, first_rows, inverse = np.unique(all_keys, return_index=True, return_inverse=True)
+    keep = (file_ids[first_rows][inverse] == file_ids) & ~contains(seen_keys, all_keys)
+    bounds = np.cumsum([0] + [len(keys) for keys in file_keys])
+    new_keys = unique_keys[~contains(seen_keys, unique_keys)]
+    return [keep[start:end] for start, end in zip(bounds[:-1], bounds[1:])], new_keys
 
 def update_csv_gcp():
-    files_to_merge = [f for f in os.listdir('.') if f.startswith(prefix) and f.endswith('.csv')]
-    
-    data_frames = []
-    for file in files_to_merge:
-        df = pd.read_csv(file)
-        data_frames.append(df)
- 
-        combined_df = pd.concat(data_frames, ignore_index=True)
-        combined_df.to_csv('cost-and-usage-report-gcp.csv', index=False) 
+    files_to_merge = find_report_files()
+    if not files_to_merge:
+        return
+
+    ingested = load_ingested()
+    versions = {file: file_version(file) for file in files_to_merge}
+    new_files = [file for file in files_to_merge if file not in ingested]
+    changed = any(file in versions and versions[file] != version for file, version in ingested.items())
+    headers = {file: report_header(file) for file in files_to_merge}
+    columns = union_columns(headers.values())
+
+    append = os.path.exists(output_file) and not changed and report_header(output_file) == columns
+    if append and not new_files:
+        return
+    if not append:
+        new_files = files_to_merge
+        ingested = {}
+
+    temp_file = output_file + '.tmp'
+    seen_keys = load_keys(key_index_file) if append else np.empty(0, dtype=np.uint64)
+    if append:
+        shutil.copyfile(output_file, temp_file)
+    else:
+        pd.DataFrame(columns=columns).to_csv(temp_file, index=False)
+
+    keep_rows, new_keys = new_rows_by_file(new_files, headers, columns, seen_keys)
+    for file, keep in zip(new_files, keep_rows):
+        df = read_csv(file).reindex(columns=columns)
+        df[keep].to_csv(temp_file, index=False, header=False, mode='a')
+        ingested[file] = versions[file]
+
+    os.replace(temp_file, output_file)
+    save_keys(key_index_file, add_keys(seen_keys, new_keys))
+    save_ingested(ingested)
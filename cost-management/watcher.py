@@ -0,0 +1,69 @@
+import os
+import threading
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler, EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED
+import update_csv_aws
+import update_csv_gcp
+
+'''
+Long-running mode of the pipeline.
+The report directories are watched for new CUR and GCP drops and the pipeline runs as soon as a
+drop is complete, in the same process, so the libraries and the cached reports stay loaded.
+A drop is considered complete when no new file has arrived for settle_seconds.
+'''
+settle_seconds = float(os.getenv('COST_WATCH_SETTLE_SECONDS', '10'))
+# Only writes count as a drop, the pipeline opening and reading the reports itself or deleting one doesn't
+drop_event_types = {EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED}
+
+def is_report_file(file_path):
+    file_name = os.path.basename(file_path)
+    if file_name.startswith(update_csv_gcp.prefix) and file_name.endswith('.csv'):
+        return True
+    return file_name.startswith(update_csv_aws.prefix) and file_name.endswith('.gz')
+
+class ReportHandler(FileSystemEventHandler):
+    def __init__(self, changed):
+        self.changed = changed
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in drop_event_types:
+            return
+        # Moves are checked on their destination, the reports are often synced to a temporary name first
+        file_path = event.dest_path if event.event_type == EVENT_TYPE_MOVED else event.src_path
+        if is_report_file(file_path):
+            self.changed.set()
+
+def wait_for_drop(changed):
+    changed.wait()
+    while True:
+        changed.clear()
+        if not changed.wait(settle_seconds):
+            return
+
+def watch(run):
+    changed = threading.Event()
+    handler = ReportHandler(changed)
+    observer = Observer()
+    # The GCP reports are dropped in the working directory, the CUR files in their billing period folders
+    observer.schedule(handler, '.', recursive=False)
+    if os.path.isdir(update_csv_aws.directory):
+        observer.schedule(handler, update_csv_aws.directory, recursive=True)
+    else:
+        print(f"{update_csv_aws.directory} doesn't exist, only the GCP reports are watched")
+    observer.start()
+
+    try:
+        # Catch up on the reports that arrived while the watcher wasn't running
+        changed.set()
+        while True:
+            wait_for_drop(changed)
+            print("New cost reports detected")
+            try:
+                run()
+            except Exception as e:
+                print(f"Pipeline run failed: {e!r}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()